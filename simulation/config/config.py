@@ -12,6 +12,7 @@ CONFIG: ConfigObj = ConfigObj(f"{SIMULATION_DIR}/config/config.ini")
 ZOOKEEPER_SECTION: Section = CONFIG["zookeeper"]
 ZOOKEEPER_CLIENT_ENDPOINT: str = ZOOKEEPER_SECTION["client_endpoint"]
 ZOOKEEPER_BARRIER_PATH: str = ZOOKEEPER_SECTION["barrier_path"]
+ZOOKEEPER_TELEMETRY_PATH: str = ZOOKEEPER_SECTION["telemetry_path"]
 
 # Resource tuner config variables
 WORKLOAD_PROFILER_SECTION: Section = CONFIG["workload_profiler"]
@@ -20,7 +21,31 @@ PROFILER_MAX_SHARES: int = WORKLOAD_PROFILER_SECTION.as_int("max_shares")
 PROFILER_SHARE_INCREMENT: int = WORKLOAD_PROFILER_SECTION.as_int(
     "share_increment")
 PROFILER_TRIES: int = WORKLOAD_PROFILER_SECTION.as_int("num_tries")
+PROFILER_MAX_TRIES: int = WORKLOAD_PROFILER_SECTION.as_int("max_tries")
+PROFILER_CI_WIDTH_TARGET: float = WORKLOAD_PROFILER_SECTION.as_float(
+    "ci_width_target")
 PROFILER_OUTPUT_PATH: str = WORKLOAD_PROFILER_SECTION["output_path"]
+PROFILER_MANIFEST_PATH: str = WORKLOAD_PROFILER_SECTION["manifest_path"]
+PROFILER_NUM_LANES: int = WORKLOAD_PROFILER_SECTION.as_int("num_lanes")
+PROFILER_MAX_TOTAL_SHARES: int = WORKLOAD_PROFILER_SECTION.as_int(
+    "max_total_shares")
+PROFILER_ADAPTIVE_ERROR_TARGET: float = WORKLOAD_PROFILER_SECTION.as_float(
+    "adaptive_error_target")
+PROFILER_ADAPTIVE_MAX_FRACTION: float = WORKLOAD_PROFILER_SECTION.as_float(
+    "adaptive_max_fraction")
+PROFILER_ADAPTIVE_MIN_IMPROVEMENT: float = WORKLOAD_PROFILER_SECTION.as_float(
+    "adaptive_min_improvement")
+PROFILER_ADAPTIVE_PATIENCE: int = WORKLOAD_PROFILER_SECTION.as_int(
+    "adaptive_patience")
+
+# Warm pool config variables
+WARM_POOL_SECTION: Section = CONFIG["warm-pool"]
+WARM_POOL_SIZE: int = WARM_POOL_SECTION.as_int("pool_size")
+WARM_POOL_PATH: str = WARM_POOL_SECTION["pool_path"]
+
+# Workload config variables
+WORKLOADS_SECTION: Section = CONFIG["workloads"]
+WORKLOADS_CATALOG_PATH: str = WORKLOADS_SECTION["catalog_path"]
 
 # Forecasting config variables
 FORECASTER_SECTION: Section = CONFIG["forecaster"]
@@ -50,3 +75,7 @@ GANG_SCHEDULING_CHECKPOINT_PENALTY: int = GANG_SCHEDULING_SECTION.as_int(
 GANG_SCHEDULING_SIMULATION_LENGTH: int = GANG_SCHEDULING_SECTION.as_int(
     "simulation_length"
 )
+GANG_SCHEDULING_RECONFIGURATION_LOG_PATH: str = GANG_SCHEDULING_SECTION[
+    "reconfiguration_log_path"]
+GANG_SCHEDULING_TELEMETRY_LOG_PATH: str = GANG_SCHEDULING_SECTION[
+    "telemetry_log_path"]
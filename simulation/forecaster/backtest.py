@@ -0,0 +1,215 @@
+import csv
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, List, Optional, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.config.config import FORECASTER_WINDOW_SIZE, SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD
+from simulation.shared.workloads import Series
+from simulation.forecaster.forecast_data import PATH, get_series_values
+from simulation.forecaster.forecaster import (FORECASTERS, HOLT_WINTERS_BACKEND, RIDGE_BACKEND, SEASONAL_NAIVE_BACKEND,
+                                              Forecaster, get_actual_windows)
+
+
+BACKTEST_RESULTS_PATH: str = f"{PATH}/backtests/backtest_results.csv"
+
+
+@dataclass(frozen=True)
+class BacktestFold:
+    backend: str
+    file_name: str
+    # Index of the last value the forecaster is fitted on
+    cutoff: int
+    # Number of consecutive origins forecast from the cutoff onwards
+    n_origins: int
+    horizon: int
+
+
+@dataclass(frozen=True)
+class BacktestResult:
+    backend: str
+    file_name: str
+    cutoff: int
+    n_origins: int
+    horizon: int
+    step: int
+    # Errors are in the simulated workload range, scaled by the range of the training values
+    rmse: float
+    mae: float
+    fit_time: float
+    predict_time: float
+
+
+def get_series_files() -> List[str]:
+    return sorted(file_name for file_name in os.listdir(f"{PATH}/data") if file_name.endswith(".csv"))
+
+
+def create_folds(backend: str, file_name: str, n_values: int, n_folds: int, horizon: int,
+                 min_train_fraction: float = 0.5) -> List[BacktestFold]:
+    """Split the values after the minimum training length into consecutive rolling-origin folds
+
+    Every fold is fitted on all the values up to its cutoff, and forecasts the origins up to the next fold's cutoff.
+    """
+    min_train: int = int(n_values * min_train_fraction)
+    n_origins: int = (n_values - min_train - horizon) // n_folds
+    return [BacktestFold(backend=backend, file_name=file_name, cutoff=min_train + fold * n_origins - 1,
+                         n_origins=n_origins, horizon=horizon) for fold in range(n_folds)]
+
+
+def run_fold(fold: BacktestFold) -> List[BacktestResult]:
+    """Fit a backend up to the cutoff of the fold, forecast the origins of the fold and measure the error at every step
+    """
+    series: numpy.ndarray = get_series_values(
+        Series(file_name=fold.file_name)).astype("float64")
+    forecaster: Forecaster = FORECASTERS[fold.backend]()
+    train: numpy.ndarray = series[:fold.cutoff + 1]
+    start: float = time.perf_counter()
+    forecaster.fit(train, fold.horizon)
+    fit_time: float = time.perf_counter() - start
+
+    origins: numpy.ndarray = numpy.arange(
+        fold.cutoff, fold.cutoff + fold.n_origins)
+    start = time.perf_counter()
+    forecasts: numpy.ndarray = forecaster.forecast_windows(
+        series, origins, fold.horizon)
+    predict_time: float = time.perf_counter() - start
+
+    data_range: float = float(train.max() - train.min()) or 1
+    errors: numpy.ndarray = (forecasts - get_actual_windows(series, origins, fold.horizon)) * \
+        (SIMULATION_MAX_WORKLOAD - SIMULATION_MIN_WORKLOAD) / data_range
+    rmses: numpy.ndarray = numpy.sqrt(numpy.mean(errors ** 2, axis=0))
+    maes: numpy.ndarray = numpy.mean(numpy.abs(errors), axis=0)
+    return [BacktestResult(backend=fold.backend, file_name=fold.file_name, cutoff=fold.cutoff,
+                           n_origins=fold.n_origins, horizon=fold.horizon, step=step + 1,
+                           rmse=float(rmses[step]), mae=float(maes[step]),
+                           fit_time=fit_time, predict_time=predict_time) for step in range(fold.horizon)]
+
+
+def get_fold_key(result: BacktestResult) -> BacktestFold:
+    return BacktestFold(backend=result.backend, file_name=result.file_name, cutoff=result.cutoff,
+                        n_origins=result.n_origins, horizon=result.horizon)
+
+
+def parse_result(row: Dict[str, str]) -> BacktestResult:
+    return BacktestResult(backend=row["backend"], file_name=row["file_name"], cutoff=int(row["cutoff"]),
+                          n_origins=int(row["n_origins"]), horizon=int(row["horizon"]), step=int(row["step"]),
+                          rmse=float(row["rmse"]), mae=float(row["mae"]), fit_time=float(row["fit_time"]),
+                          predict_time=float(row["predict_time"]))
+
+
+def load_results(path: str) -> List[BacktestResult]:
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as results_file:
+        return [parse_result(row) for row in csv.DictReader(results_file)]
+
+
+def save_results(path: str, results: List[BacktestResult]) -> None:
+    """Write the results table to a temporary file next to the destination and move it into place
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(file_descriptor, "w", newline="") as results_file:
+        writer: csv.DictWriter = csv.DictWriter(
+            results_file, fieldnames=[field.name for field in fields(BacktestResult)])
+        writer.writeheader()
+        writer.writerows(asdict(result) for result in results)
+    os.replace(temp_path, path)
+
+
+def run_backtests(backends: List[str], file_names: Optional[List[str]] = None, n_folds: int = 5,
+                  horizon: int = FORECASTER_WINDOW_SIZE, num_workers: Optional[int] = None,
+                  path: str = BACKTEST_RESULTS_PATH) -> List[BacktestResult]:
+    """Backtest every backend on every series over rolling origins, in parallel worker processes
+
+    Folds that are already in the cached results table are not run again, and the new results are added to it.
+
+    Args:
+        backends (List[str]): The forecaster backends to evaluate
+        file_names (Optional[List[str]], optional): The series to evaluate on. Defaults to every series in the data directory.
+        n_folds (int, optional): Number of rolling origins per series. Defaults to 5.
+        horizon (int, optional): Number of steps to forecast. Defaults to FORECASTER_WINDOW_SIZE.
+        num_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+        path (str, optional): The cached results table. Defaults to BACKTEST_RESULTS_PATH.
+
+    Returns:
+        List[BacktestResult]: The results of every requested fold
+    """
+    file_names = file_names if file_names is not None else get_series_files()
+    folds: List[BacktestFold] = []
+    file_name: str
+    for file_name in file_names:
+        n_values: int = len(get_series_values(Series(file_name=file_name)))
+        for backend in backends:
+            folds += create_folds(backend, file_name,
+                                  n_values, n_folds, horizon)
+
+    cached: List[BacktestResult] = load_results(path)
+    cached_folds: Dict[BacktestFold, List[BacktestResult]] = {}
+    for result in cached:
+        cached_folds.setdefault(get_fold_key(result), []).append(result)
+    pending: List[BacktestFold] = [
+        fold for fold in folds if fold not in cached_folds]
+    print(f"Running {len(pending)} of {len(folds)} backtest folds, the rest are cached")
+
+    if len(pending) > 0:
+        start: float = time.time()
+        # the LSTM backend imports TensorFlow, which does not survive being forked
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(num_workers or os.cpu_count() or 1) as pool:
+            fold_results: List[BacktestResult]
+            for fold_results in pool.imap_unordered(run_fold, pending):
+                cached_folds[get_fold_key(fold_results[0])] = fold_results
+                cached += fold_results
+        save_results(path, cached)
+        print(f"Backtesting took {time.time() - start:.1f} seconds")
+    return [result for fold in folds for result in cached_folds[fold]]
+
+
+def summarize_results(results: List[BacktestResult]) -> Dict[str, Tuple[float, float, float, float, float]]:
+    """Summarize the results of every backend
+
+    Returns:
+        Dict[str, Tuple[float, float, float, float, float]]: The mean RMSE over all steps, at the first step and at
+            the last step, and the mean fit and predict time per fold of every backend
+    """
+    summary: Dict[str, Tuple[float, float, float, float, float]] = {}
+    backend: str
+    for backend in dict.fromkeys(result.backend for result in results):
+        backend_results: List[BacktestResult] = [
+            result for result in results if result.backend == backend]
+        last_step: int = max(result.step for result in backend_results)
+        first_steps: List[BacktestResult] = [
+            result for result in backend_results if result.step == 1]
+        summary[backend] = (
+            float(numpy.mean([result.rmse for result in backend_results])),
+            float(numpy.mean([result.rmse for result in first_steps])),
+            float(numpy.mean(
+                [result.rmse for result in backend_results if result.step == last_step])),
+            float(numpy.mean([result.fit_time for result in first_steps])),
+            float(numpy.mean([result.predict_time for result in first_steps])))
+    return summary
+
+
+def print_summary(results: List[BacktestResult]) -> None:
+    print(f"{'backend':>16}{'rmse':>10}{'rmse t+1':>10}{'rmse t+H':>10}{'fit (s)':>10}{'predict (s)':>12}")
+    for backend, (rmse, first_rmse, last_rmse, fit_time, predict_time) in summarize_results(results).items():
+        print(f"{backend:>16}{rmse:>10.3f}{first_rmse:>10.3f}{last_rmse:>10.3f}{fit_time:>10.4f}{predict_time:>12.4f}")
+
+
+def main():
+    print_summary(run_backtests(
+        [SEASONAL_NAIVE_BACKEND, RIDGE_BACKEND, HOLT_WINTERS_BACKEND]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import numpy
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from simulation.config.config import SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, FORECASTER_WINDOW_SIZE
+from simulation.shared.workloads import Workload, Series
+
+
+PATH: str = str(Path(__file__).parent.absolute())
+HEADER: str = ", ".join(
+    ["t" if i == 0 else f"t+{i}" for i in range(FORECASTER_WINDOW_SIZE)])
+
+
+def scale_to_workload_range(values: numpy.ndarray, reference: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+    """Min-max scale every column of the values to the simulated workload range
+
+    Equivalent to fitting a MinMaxScaler with feature_range=(SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD)
+    on the reference and transforming the values with it.
+
+    Args:
+        values (numpy.ndarray): The values to scale
+        reference (Optional[numpy.ndarray], optional): The values whose minimum and maximum are mapped to the
+            ends of the range. Defaults to the values themselves.
+
+    Returns:
+        numpy.ndarray: The scaled values
+    """
+    reference = values if reference is None else reference
+    data_min: numpy.ndarray = numpy.min(reference, axis=0)
+    data_range: numpy.ndarray = numpy.max(reference, axis=0) - data_min
+    data_range[data_range == 0] = 1
+    scale: numpy.ndarray = (SIMULATION_MAX_WORKLOAD -
+                            SIMULATION_MIN_WORKLOAD) / data_range
+    return values * scale + (SIMULATION_MIN_WORKLOAD - data_min * scale)
+
+
+def get_series_values(series_data: Series, nrows: int = 5000) -> numpy.ndarray:
+    """Read the target column of a series from the data directory
+
+    Returns:
+        numpy.ndarray: The series values as float32
+    """
+    series_path: str = f"{PATH}/data/{series_data.file_name}"
+    with open(series_path) as series_file:
+        header: List[str] = series_file.readline().strip().split(",")
+    return numpy.loadtxt(series_path, delimiter=",", skiprows=1, max_rows=nrows, dtype="float32",
+                         usecols=header.index(series_data.target_col))
+
+
+def get_forecasts_path(file_name: str) -> str:
+    return f"{PATH}/forecasts/{file_name[:-4]}_forecasts.csv"
+
+
+def get_actual_path(file_name: str) -> str:
+    return f"{PATH}/actual/{file_name[:-4]}_actual.csv"
+
+
+def save_array_atomically(file_path: str, values: numpy.ndarray) -> None:
+    """Write the array to a temporary file next to the destination and move it into place,
+    so that readers never see a partially written file
+    """
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path), suffix=".tmp")
+    with os.fdopen(file_descriptor, "w") as temp_file:
+        numpy.savetxt(temp_file, values,
+                      delimiter=",", fmt="%f", header=HEADER)
+    os.replace(temp_path, file_path)
+
+
+def save_results(file_name: str, actual: numpy.ndarray, forecasts: numpy.ndarray) -> None:
+    save_array_atomically(get_actual_path(file_name), actual)
+    save_array_atomically(get_forecasts_path(file_name), forecasts)
+
+
+def get_predictions_dict(workloads: Sequence[Workload]) -> Dict[str, numpy.ndarray]:
+    predictions: Dict[str, numpy.ndarray] = {}
+    for workload in workloads:
+        workload_predictions: numpy.ndarray = numpy.loadtxt(
+            get_forecasts_path(workload.time_series.file_name), delimiter=",", dtype="float64", ndmin=2)
+        predictions[workload.task.task_name] = scale_to_workload_range(
+            workload_predictions)
+    return predictions
+
+
+def get_actual_dict(workloads: Sequence[Workload]) -> Dict[str, numpy.ndarray]:
+    actual: Dict[str, numpy.ndarray] = {}
+    for workload in workloads:
+        workload_actual: numpy.ndarray = numpy.loadtxt(
+            get_actual_path(workload.time_series.file_name), delimiter=",", dtype="float64", ndmin=2)
+        actual[workload.task.task_name] = scale_to_workload_range(
+            workload_actual)
+    return actual
+
+
+def get_scaled_rmse(actual: numpy.ndarray, forecasts: numpy.ndarray) -> numpy.ndarray:
+    """Get the RMSE at every forecast horizon in the simulated workload range
+
+    Both arrays are scaled with the minimum and maximum of the actual values, so a forecast that is
+    off by a constant factor is not scaled back onto the actual values.
+
+    Returns:
+        numpy.ndarray: The RMSE of every column
+    """
+    errors: numpy.ndarray = scale_to_workload_range(
+        actual) - scale_to_workload_range(forecasts, actual)
+    return numpy.sqrt(numpy.mean(errors ** 2, axis=0))
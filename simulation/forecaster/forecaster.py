@@ -0,0 +1,439 @@
+import time
+import numpy
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from itertools import product
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Sequence
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.config.config import FORECASTER_WINDOW_SIZE
+from simulation.shared.workloads import WORKLOADS, Workload, Series
+from simulation.forecaster.forecast_data import get_series_values, get_scaled_rmse, save_results
+
+if TYPE_CHECKING:
+    from keras.models import Sequential
+    from sklearn.preprocessing import MinMaxScaler
+
+
+SEASONAL_NAIVE_BACKEND: str = "seasonal_naive"
+RIDGE_BACKEND: str = "ridge"
+HOLT_WINTERS_BACKEND: str = "holt_winters"
+LSTM_BACKEND: str = "lstm"
+
+
+def estimate_season_length(series: numpy.ndarray, max_season: int = 200, min_correlation: float = 0.2) -> int:
+    """Estimate the season length of a series from the autocorrelation of its differences
+
+    Args:
+        series (numpy.ndarray): The series
+        max_season (int, optional): The longest season to consider. Defaults to 200.
+        min_correlation (float, optional): The autocorrelation a season needs to be accepted. Defaults to 0.2.
+
+    Returns:
+        int: The lag of the strongest autocorrelation peak, or 1 if the series has no clear season
+    """
+    diff: numpy.ndarray = numpy.diff(numpy.asarray(series, dtype="float64"))
+    diff = diff - diff.mean()
+    n_fft: int = 1 << int(2 * len(diff) - 1).bit_length()
+    spectrum: numpy.ndarray = numpy.fft.rfft(diff, n_fft)
+    autocorrelation: numpy.ndarray = numpy.fft.irfft(
+        spectrum * numpy.conj(spectrum), n_fft)[:min(max_season, len(diff) // 2) + 2]
+    if autocorrelation[0] == 0:
+        return 1
+    autocorrelation = autocorrelation / autocorrelation[0]
+    # only local maxima count as seasons, so that the decay right after lag 0 is skipped
+    lags: numpy.ndarray = numpy.arange(2, len(autocorrelation) - 1)
+    peaks: numpy.ndarray = lags[(autocorrelation[lags] > autocorrelation[lags - 1]) &
+                                (autocorrelation[lags] >= autocorrelation[lags + 1])]
+    if len(peaks) == 0:
+        return 1
+    best: int = int(peaks[numpy.argmax(autocorrelation[peaks])])
+    return best if autocorrelation[best] >= min_correlation else 1
+
+
+def get_test_origins(n_values: int, n_test: int, horizon: int) -> numpy.ndarray:
+    """Get the index of the last observed value of every test window
+
+    These are the same windows the LSTM forecaster writes: the last n_test windows of horizon
+    values that fit in the series.
+    """
+    return numpy.arange(n_values - n_test - horizon, n_values - horizon)
+
+
+def get_actual_windows(series: numpy.ndarray, origins: numpy.ndarray, horizon: int) -> numpy.ndarray:
+    return sliding_window_view(series, horizon)[origins + 1]
+
+
+class Forecaster(ABC):
+    """Multi-step forecaster of a univariate series
+    """
+
+    @abstractmethod
+    def fit(self, series: numpy.ndarray, horizon: int) -> "Forecaster":
+        """Fit the forecaster to a training series
+
+        Args:
+            series (numpy.ndarray): The training series
+            horizon (int): Number of steps the forecaster will predict
+
+        Returns:
+            Forecaster: The fitted forecaster
+        """
+        pass
+
+    @abstractmethod
+    def forecast_windows(self, series: numpy.ndarray, origins: numpy.ndarray, horizon: int) -> numpy.ndarray:
+        """Forecast the horizon values after every origin, using only the values up to and including it
+
+        Args:
+            series (numpy.ndarray): The series to forecast
+            origins (numpy.ndarray): The index of the last observed value of every forecast
+            horizon (int): Number of steps to predict
+
+        Returns:
+            numpy.ndarray: One row of horizon forecasts per origin
+        """
+        pass
+
+    def predict(self, history: numpy.ndarray, horizon: int) -> numpy.ndarray:
+        """Forecast the horizon values that follow the history
+        """
+        history = numpy.asarray(history, dtype="float64")
+        return self.forecast_windows(history, numpy.array([len(history) - 1]), horizon)[0]
+
+
+class SeasonalNaiveForecaster(Forecaster):
+    """Repeats the last observed season, or the last value if the series has no season
+
+    Args:
+        season_length (Optional[int], optional): The season length. Defaults to estimating it when fitting.
+    """
+
+    def __init__(self, season_length: Optional[int] = None):
+        self.season_length = season_length
+
+    def fit(self, series: numpy.ndarray, horizon: int) -> "SeasonalNaiveForecaster":
+        if self.season_length is None:
+            self.season_length = estimate_season_length(series)
+        return self
+
+    def forecast_windows(self, series: numpy.ndarray, origins: numpy.ndarray, horizon: int) -> numpy.ndarray:
+        series = numpy.asarray(series, dtype="float64")
+        season_length: int = self.season_length or 1
+        steps: numpy.ndarray = numpy.arange(1, horizon + 1)
+        # step h repeats the value one or more whole seasons before it
+        offsets: numpy.ndarray = steps - season_length * \
+            ((steps - 1) // season_length + 1)
+        return series[numpy.maximum(origins[:, None] + offsets[None, :], 0)]
+
+
+class RidgeForecaster(Forecaster):
+    """Direct multi-step ridge regression on the lagged values of the series
+
+    Each step of the horizon has its own linear model over the last n_lags values. Inputs and targets
+    are taken relative to the last observed value, so the models carry over to shifted levels.
+
+    Args:
+        n_lags (int, optional): Number of lagged values used as features. Defaults to 48.
+        alpha (float, optional): The L2 penalty. Defaults to 1.0.
+    """
+
+    def __init__(self, n_lags: int = 48, alpha: float = 1.0):
+        self.n_lags = n_lags
+        self.alpha = alpha
+        self.scale: float = 1
+        self.weights: numpy.ndarray = numpy.zeros(0)
+
+    def create_features(self, series: numpy.ndarray, origins: numpy.ndarray) -> numpy.ndarray:
+        # pad the start so that early origins see the first value repeated
+        padded: numpy.ndarray = numpy.concatenate(
+            [numpy.full(self.n_lags - 1, series[0]), series])
+        lags: numpy.ndarray = sliding_window_view(padded, self.n_lags)[origins]
+        features: numpy.ndarray = (lags - lags[:, -1:]) / self.scale
+        return numpy.hstack([features[:, :-1], numpy.ones((len(origins), 1))])
+
+    def fit(self, series: numpy.ndarray, horizon: int) -> "RidgeForecaster":
+        series = numpy.asarray(series, dtype="float64")
+        self.scale = float(numpy.std(numpy.diff(series))) or 1
+        origins: numpy.ndarray = numpy.arange(
+            self.n_lags - 1, len(series) - horizon)
+        X: numpy.ndarray = self.create_features(series, origins)
+        y: numpy.ndarray = (get_actual_windows(series, origins, horizon) -
+                            series[origins, None]) / self.scale
+        penalty: numpy.ndarray = self.alpha * numpy.eye(X.shape[1])
+        # the intercept is not penalized
+        penalty[-1, -1] = 0
+        self.weights = numpy.linalg.solve(X.T @ X + penalty, X.T @ y)
+        return self
+
+    def forecast_windows(self, series: numpy.ndarray, origins: numpy.ndarray, horizon: int) -> numpy.ndarray:
+        series = numpy.asarray(series, dtype="float64")
+        X: numpy.ndarray = self.create_features(series, origins)
+        return series[origins, None] + self.scale * (X @ self.weights[:, :horizon])
+
+
+@dataclass
+class HoltWintersState:
+    """The level, trend and seasonal components of a Holt-Winters forecaster, updated one observation at a time
+    """
+    level: float
+    trend: float
+    seasonal: List[float]
+    alpha: float
+    beta: float
+    gamma: float
+    phi: float
+    # Number of observations seen
+    t: int = 0
+
+    def update(self, value: float) -> float:
+        """Update the state with the next observation
+
+        Returns:
+            float: The error of the one-step forecast of the observation
+        """
+        index: int = self.t % len(self.seasonal)
+        season: float = self.seasonal[index]
+        error: float = value - (self.level + self.phi * self.trend + season)
+        level: float = self.alpha * (value - season) + \
+            (1 - self.alpha) * (self.level + self.phi * self.trend)
+        self.trend = self.beta * (level - self.level) + \
+            (1 - self.beta) * self.phi * self.trend
+        self.seasonal[index] = self.gamma * \
+            (value - level) + (1 - self.gamma) * season
+        self.level = level
+        self.t += 1
+        return error
+
+    def forecast(self, horizon: int) -> numpy.ndarray:
+        """Forecast the horizon values after the last observation
+        """
+        steps: numpy.ndarray = numpy.arange(1, horizon + 1)
+        damping: numpy.ndarray = numpy.cumsum(self.phi ** steps)
+        seasonal: numpy.ndarray = numpy.asarray(self.seasonal)
+        return self.level + damping * self.trend + seasonal[(self.t - 1 + steps) % len(seasonal)]
+
+
+class HoltWintersForecaster(Forecaster):
+    """Additive Holt-Winters exponential smoothing with a damped trend
+
+    The smoothing parameters that are not given are chosen by a grid search over the one-step
+    error on the training series.
+
+    Args:
+        season_length (Optional[int], optional): The season length. Defaults to estimating it when fitting.
+        alpha (Optional[float], optional): Level smoothing. Defaults to searching for it.
+        beta (Optional[float], optional): Trend smoothing. Defaults to searching for it.
+        gamma (Optional[float], optional): Seasonal smoothing. Defaults to searching for it.
+        phi (float, optional): Trend damping. Defaults to 0.98.
+    """
+
+    ALPHAS: Tuple[float, ...] = (0.1, 0.3, 0.6, 0.9)
+    BETAS: Tuple[float, ...] = (0.01, 0.1)
+    GAMMAS: Tuple[float, ...] = (0.05, 0.2, 0.5)
+
+    def __init__(self, season_length: Optional[int] = None, alpha: Optional[float] = None,
+                 beta: Optional[float] = None, gamma: Optional[float] = None, phi: float = 0.98):
+        self.season_length = season_length
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+
+    def create_state(self, series: numpy.ndarray, alpha: float, beta: float, gamma: float) -> HoltWintersState:
+        """Initialize the level, trend and seasonal components from the first two seasons of the series
+        """
+        season_length: int = self.season_length or 1
+        if season_length == 1 or len(series) < 2 * season_length:
+            trend: float = float(series[1] - series[0]) if len(series) > 1 else 0
+            return HoltWintersState(level=float(series[0]), trend=trend, seasonal=[0.0] * season_length,
+                                    alpha=alpha, beta=beta, gamma=gamma, phi=self.phi)
+        first: numpy.ndarray = series[:season_length]
+        level: float = float(first.mean())
+        trend = float(series[season_length:2 * season_length].mean() - level) / season_length
+        return HoltWintersState(level=level, trend=trend, seasonal=(first - level).tolist(),
+                                alpha=alpha, beta=beta, gamma=gamma, phi=self.phi)
+
+    def smooth(self, series: numpy.ndarray, alpha: float, beta: float, gamma: float,
+               origins: Optional[numpy.ndarray] = None, horizon: int = 0) -> Tuple[float, numpy.ndarray, HoltWintersState]:
+        """Run the smoothing recursion over the series
+
+        Args:
+            series (numpy.ndarray): The series
+            alpha (float): Level smoothing
+            beta (float): Trend smoothing
+            gamma (float): Seasonal smoothing
+            origins (Optional[numpy.ndarray], optional): Sorted origins to forecast from. Defaults to None.
+            horizon (int, optional): Steps to forecast from every origin. Defaults to 0.
+
+        Returns:
+            Tuple[float, numpy.ndarray, HoltWintersState]: The sum of squared one-step errors, the forecasts at
+                every origin, and the state after the last value
+        """
+        state: HoltWintersState = self.create_state(series, alpha, beta, gamma)
+        forecasts: numpy.ndarray = numpy.zeros(
+            (0 if origins is None else len(origins), horizon))
+        next_origin: int = 0
+        squared_error: float = 0
+        # the first two seasons only warm up the state
+        warmup: int = 2 * len(state.seasonal)
+        t: int
+        value: float
+        for t, value in enumerate(series.tolist()):
+            error: float = state.update(value)
+            if t >= warmup:
+                squared_error += error * error
+            while origins is not None and next_origin < len(origins) and origins[next_origin] == t:
+                forecasts[next_origin] = state.forecast(horizon)
+                next_origin += 1
+        return squared_error, forecasts, state
+
+    def create_online_state(self, history: numpy.ndarray) -> HoltWintersState:
+        """Run the fitted forecaster over the history, returning the state to update with new observations
+        """
+        return self.smooth(numpy.asarray(history, dtype="float64"), self.alpha or 0, self.beta or 0, self.gamma or 0)[2]
+
+    def fit(self, series: numpy.ndarray, horizon: int) -> "HoltWintersForecaster":
+        series = numpy.asarray(series, dtype="float64")
+        if self.season_length is None:
+            self.season_length = estimate_season_length(series)
+        alphas: Tuple[float, ...] = self.ALPHAS if self.alpha is None else (self.alpha,)
+        betas: Tuple[float, ...] = self.BETAS if self.beta is None else (self.beta,)
+        gammas: Tuple[float, ...] = (0,) if self.season_length == 1 else \
+            self.GAMMAS if self.gamma is None else (self.gamma,)
+        self.alpha, self.beta, self.gamma = min(product(alphas, betas, gammas),
+                                                key=lambda params: self.smooth(series, *params)[0])
+        return self
+
+    def forecast_windows(self, series: numpy.ndarray, origins: numpy.ndarray, horizon: int) -> numpy.ndarray:
+        series = numpy.asarray(series, dtype="float64")
+        order: numpy.ndarray = numpy.argsort(origins, kind="stable")
+        forecasts: numpy.ndarray = numpy.empty((len(origins), horizon))
+        # a single pass over the series forecasts every origin
+        forecasts[order] = self.smooth(series[:int(origins.max()) + 1], self.alpha or 0, self.beta or 0,
+                                       self.gamma or 0, origins[order], horizon)[1]
+        return forecasts
+
+
+class LSTMForecaster(Forecaster):
+    """The LSTM of lstm_forecaster behind the Forecaster interface
+
+    Keras is only imported when the forecaster is fitted, so the other backends stay free of TensorFlow.
+
+    Args:
+        mode (str, optional): "stateful" or "minibatch" training, see lstm_forecaster. Defaults to "minibatch".
+        n_lag (int, optional): Number of differenced values used as input. Defaults to 1.
+    """
+
+    def __init__(self, mode: str = "minibatch", n_lag: int = 1):
+        self.mode = mode
+        self.n_lag = n_lag
+        self.scaler: Optional["MinMaxScaler"] = None
+        self.model: Optional["Sequential"] = None
+
+    def fit(self, series: numpy.ndarray, horizon: int) -> "LSTMForecaster":
+        from simulation.forecaster import lstm_forecaster
+
+        diff: numpy.ndarray = numpy.diff(
+            numpy.asarray(series, dtype="float64")).reshape(-1, 1)
+        self.scaler = lstm_forecaster.MinMaxScaler(
+            feature_range=(-1, 1)).fit(diff)
+        train: numpy.ndarray = lstm_forecaster.series_to_supervised(
+            self.scaler.transform(diff), self.n_lag, horizon).to_numpy()
+        if self.mode == lstm_forecaster.MINIBATCH_MODE:
+            self.model = lstm_forecaster.fit_lstm_minibatch(train, self.n_lag)
+        else:
+            self.model = lstm_forecaster.create_stateless_model(
+                lstm_forecaster.fit_lstm(train, self.n_lag, 1, 100, 4), self.n_lag)
+        return self
+
+    def forecast_windows(self, series: numpy.ndarray, origins: numpy.ndarray, horizon: int) -> numpy.ndarray:
+        """Forecast every window with the fitted LSTM
+
+        Raises:
+            ValueError: If the forecaster has not been fitted
+        """
+        scaler: Optional["MinMaxScaler"] = self.scaler
+        model: Optional["Sequential"] = self.model
+        if scaler is None or model is None:
+            raise ValueError("The LSTM forecaster has to be fitted before it forecasts")
+        series = numpy.asarray(series, dtype="float64")
+        diff: numpy.ndarray = numpy.diff(series)
+        # the differences ending at every origin
+        X: numpy.ndarray = sliding_window_view(
+            diff, self.n_lag)[origins - self.n_lag]
+        X = scaler.transform(X.reshape(-1, 1)).reshape(len(origins), 1, self.n_lag)
+        scaled: numpy.ndarray = model.predict(X, batch_size=1024, verbose=0)[:, :horizon]
+        diffs: numpy.ndarray = scaler.inverse_transform(
+            scaled.reshape(-1, 1)).reshape(scaled.shape)
+        return series[origins, None] + numpy.cumsum(diffs, axis=1)
+
+
+FORECASTERS: Dict[str, Callable[[], Forecaster]] = {
+    SEASONAL_NAIVE_BACKEND: SeasonalNaiveForecaster,
+    RIDGE_BACKEND: RidgeForecaster,
+    HOLT_WINTERS_BACKEND: HoltWintersForecaster,
+    LSTM_BACKEND: LSTMForecaster,
+}
+
+
+def backtest(forecaster: Forecaster, series: numpy.ndarray, n_test: int,
+             horizon: int = FORECASTER_WINDOW_SIZE) -> Tuple[numpy.ndarray, numpy.ndarray, float]:
+    """Fit the forecaster on the values before the test windows and forecast every test window
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray, float]: The actual values, the forecasts, and the time taken in seconds
+    """
+    series = numpy.asarray(series, dtype="float64")
+    origins: numpy.ndarray = get_test_origins(len(series), n_test, horizon)
+    start: float = time.time()
+    forecaster.fit(series[:origins[0] + 1], horizon)
+    forecasts: numpy.ndarray = forecaster.forecast_windows(
+        series, origins, horizon)
+    return get_actual_windows(series, origins, horizon), forecasts, time.time() - start
+
+
+def forecast_series(series_data: Series, backend: str = RIDGE_BACKEND) -> None:
+    """Forecast the test windows of a series with the given backend and save them where get_predictions_dict reads them
+    """
+    actual, forecasts, elapsed = backtest(
+        FORECASTERS[backend](), get_series_values(series_data), series_data.n_test)
+    print(f"Forecasts for {series_data.file_name} with {backend} took {elapsed:.2f} seconds")
+    save_results(series_data.file_name, actual, forecasts)
+
+
+def forecast_workloads_with_backend(backend: str = RIDGE_BACKEND, workloads: Sequence[Workload] = WORKLOADS) -> None:
+    """Forecast the series of every workload with the given backend, by default ridge, the most accurate backend
+    on most series
+    """
+    workload: Workload
+    for workload in workloads:
+        forecast_series(workload.time_series, backend)
+
+
+def compare_backends(backends: List[str], workloads: Sequence[Workload] = WORKLOADS) -> None:
+    """Print the time taken and the mean scaled RMSE over the horizon of every backend on every workload
+    """
+    print(f"{'series':>40}" + "".join(f"{backend:>24}" for backend in backends))
+    workload: Workload
+    for workload in workloads:
+        series: numpy.ndarray = get_series_values(workload.time_series)
+        row: str = f"{workload.time_series.file_name:>40}"
+        for backend in backends:
+            actual, forecasts, elapsed = backtest(
+                FORECASTERS[backend](), series, workload.time_series.n_test)
+            row += f"{get_scaled_rmse(actual, forecasts).mean():>14.4f} ({elapsed:5.2f}s)"
+        print(row)
+
+
+def main():
+    compare_backends([SEASONAL_NAIVE_BACKEND, RIDGE_BACKEND, HOLT_WINTERS_BACKEND])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 import numpy
 import pandas
+from numpy.lib.stride_tricks import sliding_window_view
 from keras.models import Sequential
 from keras.layers import LSTM, Dense
+from keras.callbacks import EarlyStopping
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_squared_error
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple, Dict, Sequence
 from math import sqrt
 import matplotlib.pyplot as plt
+import multiprocessing
+import os
+import time
 
 
 import sys
@@ -18,10 +23,12 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from simulation.config.config import SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, FORECASTER_WINDOW_SIZE
 from simulation.shared.workloads import WORKLOADS, Workload, Series
+from simulation.forecaster.forecast_data import PATH, HEADER, save_array_atomically, save_results, \
+    get_predictions_dict, get_actual_dict
 
 
-PATH: str = str(Path(__file__).parent.absolute())
-HEADER: str = "t, t+1, t+2, t+3, t+4, t+5, t+6, t+7, t+8, t+9, t+10, t+11, t+12, t+13, t+14, t+15, t+16, t+17, t+18, t+19"
+STATEFUL_MODE: str = "stateful"
+MINIBATCH_MODE: str = "minibatch"
 
 
 STANDARD_SCALER: MinMaxScaler = MinMaxScaler(
@@ -58,24 +65,16 @@ def series_to_supervised(series: numpy.ndarray, n_in: int, n_out: int) -> pandas
     Returns:
         pandas.DataFrame: The supervised learning dataset
     """
-
-    df: pandas.DataFrame = pandas.DataFrame(series)
-    cols, names = list(), list()
-    # input sequence (t-n, ... t-1)
-    for i in range(n_in, 0, -1):
-        cols.append(df.shift(i))
-        names += [('t-%d' % (i))]
-    # forecast sequence (t, t+1, ... t+n)
-    for i in range(0, n_out):
-        cols.append(df.shift(-i))
-        names += [('t' if i == 0 else 't+%d' % (i))]
-        # put it all together
-
-    agg: pandas.DataFrame = pandas.concat(cols, axis=1)
-    agg.columns = names
+    values: numpy.ndarray = numpy.asarray(series).reshape(-1)
+    values = values.astype(numpy.result_type(values.dtype, numpy.float32))
+    names: List[str] = [f"t-{i}" for i in range(n_in, 0, -1)] + \
+        ["t" if i == 0 else f"t+{i}" for i in range(n_out)]
+    # each row is the window (t-n, ... t-1, t, t+1, ... t+n), as a view into the series
+    windows: numpy.ndarray = sliding_window_view(values, n_in + n_out)
+    index: numpy.ndarray = numpy.arange(n_in, n_in + len(windows))
     # drop rows with NaN values
-    agg.dropna(inplace=True)
-    return agg
+    valid: numpy.ndarray = ~numpy.isnan(windows).any(axis=1)
+    return pandas.DataFrame(windows[valid], index=index[valid], columns=names)
 
 
 def create_differenced_series(dataset: numpy.ndarray, interval: int = 1) -> numpy.ndarray:
@@ -88,11 +87,8 @@ def create_differenced_series(dataset: numpy.ndarray, interval: int = 1) -> nump
     Returns:
         numpy.ndarray: The differenced series
     """
-    diff = list()
-    for i in range(interval, len(dataset)):
-        value = dataset[i] - dataset[i - interval]
-        diff.append(value)
-    return numpy.array(diff)
+    dataset = numpy.asarray(dataset)
+    return dataset[interval:] - dataset[:len(dataset) - interval]
 
 
 def prepare_data(data: pandas.DataFrame, n_test: int, n_lag: int, n_seq: int) -> Tuple[MinMaxScaler, numpy.ndarray, numpy.ndarray]:
@@ -151,6 +147,41 @@ def fit_lstm(train: numpy.ndarray, n_lag: int, n_batch: int, nb_epoch: int, n_ne
         model.reset_states()
     return model
 
+
+def fit_lstm_minibatch(train: numpy.ndarray, n_lag: int, n_batch: int = 256, nb_epoch: int = 1000, n_neurons: int = 4,
+                       validation_split: float = 0.2, patience: int = 20) -> Sequential:
+    """Fit a stateless LSTM with mini-batches, stopping once the validation loss stops improving
+
+    The last validation_split of the training rows is held out for validation, and the weights of the
+    epoch with the lowest validation loss are restored at the end.
+
+    Args:
+        train (numpy.ndarray): The training dataset
+        n_lag (int): Number of timesteps to look backwards when making predictions
+        n_batch (int, optional): Batch size for model fitting. Defaults to 256.
+        nb_epoch (int, optional): Maximum number of epochs for training. Defaults to 1000.
+        n_neurons (int, optional): Number of neurons for the neural network. Defaults to 4.
+        validation_split (float, optional): Fraction of rows held out for validation. Defaults to 0.2.
+        patience (int, optional): Epochs without improvement before stopping. Defaults to 20.
+
+    Returns:
+        Sequential: The trained LSTM Neural Network
+    """
+    # reshape training into [samples, timesteps, features]
+    X, y = train[:, 0:n_lag], train[:, n_lag:]
+    X = X.reshape(X.shape[0], 1, X.shape[1])
+    # design network
+    model: Sequential = Sequential()
+    model.add(LSTM(n_neurons, input_shape=(X.shape[1], X.shape[2])))
+    model.add(Dense(y.shape[1]))
+    model.compile(loss='mean_squared_error', optimizer='adam')
+    # fit network
+    early_stopping: EarlyStopping = EarlyStopping(
+        monitor="val_loss", patience=patience, restore_best_weights=True)
+    model.fit(X, y, epochs=nb_epoch, batch_size=n_batch, verbose=0, shuffle=True,
+              validation_split=validation_split, callbacks=[early_stopping])
+    return model
+
 # make one forecast with an LSTM,
 
 
@@ -164,72 +195,115 @@ def forecast_lstm(model: Sequential, X: numpy.ndarray, n_batch: int) -> List[flo
 
 
 def make_forecasts(model: Sequential, n_batch: int, test: numpy.ndarray, n_lag: int) -> numpy.ndarray:
-    forecasts: List[List[float]] = list()
-    for i in range(len(test)):
-        X = test[i, 0:n_lag]
-        # make forecast
-        forecast = forecast_lstm(model, X, n_batch)
-        # store the forecast
-        forecasts.append(forecast)
-    return numpy.array(forecasts)
+    """Forecast every test row with a single predict call
+
+    The stateful LSTM still walks the rows in order with the given batch size, so its state carries
+    from one row to the next exactly as it would when forecasting one row per call.
+
+    Args:
+        model (Sequential): The trained stateful LSTM
+        n_batch (int): The batch size the model was built with
+        test (numpy.ndarray): The supervised test dataset
+        n_lag (int): Number of timesteps used as input
+
+    Returns:
+        numpy.ndarray: One row of forecasts per test row
+    """
+    # reshape input pattern to [samples, timesteps, features]
+    X: numpy.ndarray = test[:, 0:n_lag].reshape(len(test), 1, n_lag)
+    return model.predict(X, batch_size=n_batch, verbose=0)
+
+
+def create_stateless_model(model: Sequential, n_lag: int) -> Sequential:
+    """Copy the weights of a trained stateful LSTM into a stateless one that accepts any batch size
+    """
+    stateless: Sequential = Sequential()
+    stateless.add(LSTM(model.layers[0].units, input_shape=(1, n_lag)))
+    stateless.add(Dense(model.layers[-1].units))
+    stateless.set_weights(model.get_weights())
+    return stateless
+
+
+def make_stateless_forecasts(model: Sequential, test: numpy.ndarray, n_lag: int, chunk_size: int = 1024) -> numpy.ndarray:
+    """Forecast every test row in large independent batches
+
+    Unlike make_forecasts, every row is forecast from a zeroed LSTM state rather than the state left
+    by the previous rows. This trades a small change in the forecasts for batched inference.
+
+    Args:
+        model (Sequential): The trained stateful LSTM
+        test (numpy.ndarray): The supervised test dataset
+        n_lag (int): Number of timesteps used as input
+        chunk_size (int, optional): Rows per predict batch. Defaults to 1024.
+
+    Returns:
+        numpy.ndarray: One row of forecasts per test row
+    """
+    X: numpy.ndarray = test[:, 0:n_lag].reshape(len(test), 1, n_lag)
+    return create_stateless_model(model, n_lag).predict(X, batch_size=chunk_size, verbose=0)
 
 
 # invert differenced forecast
-def inverse_difference(last_ob: int, forecast: List[float]) -> List[float]:
-    # invert first forecast
-    inverted = list()
-    inverted.append(forecast[0] + last_ob)
-    # propagate difference forecast using inverted first value
-    for i in range(1, len(forecast)):
-        inverted.append(forecast[i] + inverted[i-1])
-    return inverted
+def inverse_difference(last_ob: numpy.ndarray, forecast: numpy.ndarray) -> numpy.ndarray:
+    """Invert the differencing of forecasts by accumulating them onto the last observation
+
+    Args:
+        last_ob (numpy.ndarray): The last observation before each forecast, shape (n_forecasts, 1)
+        forecast (numpy.ndarray): The differenced forecasts, shape (n_forecasts, n_seq)
+
+    Returns:
+        numpy.ndarray: The inverted forecasts, shape (n_forecasts, n_seq)
+    """
+    last_ob = numpy.reshape(last_ob, (-1, 1))
+    forecast = numpy.atleast_2d(forecast)
+    # summing from the last observation keeps the same order of additions as propagating one step at a time
+    return numpy.cumsum(numpy.hstack([numpy.broadcast_to(last_ob, (len(forecast), 1)), forecast]), axis=1)[:, 1:]
 
 # inverse data transform on forecasts
 
 
 def inverse_transform(series: pandas.DataFrame, forecasts: numpy.ndarray, scaler, n_test) -> numpy.ndarray:
-    inverted: List[List[float]] = list()
-    for i in range(len(forecasts)):
-        # create array from forecast
-        forecast: numpy.ndarray = numpy.array(forecasts[i])
-        forecast = forecast.reshape(1, len(forecast))
-        # invert scaling
-        inv_scale: numpy.ndarray = scaler.inverse_transform(forecast)
-        inv_scale = inv_scale[0, :]
-        # invert differencing
-        index: int = len(series) - n_test + i - 1
-        last_ob: int = series.values[index]
-        inv_diff = inverse_difference(last_ob, inv_scale)
-        # store
-        inverted.append(inv_diff)
-    return numpy.array(inverted)
+    forecasts = numpy.asarray(forecasts)
+    # invert scaling of every forecast at once, the scaler was fitted on a single feature
+    inv_scale: numpy.ndarray = scaler.inverse_transform(
+        forecasts.reshape(-1, 1)).reshape(forecasts.shape)
+    # invert differencing
+    start: int = len(series) - n_test - 1
+    last_obs: numpy.ndarray = series.values[start: start + len(forecasts)]
+    return inverse_difference(last_obs, inv_scale)
 
 # evaluate the RMSE for each forecast time step
 
 
-def evaluate_forecasts(test: numpy.ndarray, forecasts: numpy.ndarray, n_seq: int) -> None:
+def evaluate_forecasts(test: numpy.ndarray, forecasts: numpy.ndarray, n_seq: int, verbose: bool = True) -> List[float]:
+    # scale the forecasts with the actual values' scaler, so that both are in the same units
     scaled_actual = STANDARD_SCALER.fit_transform(test)
-    scaled_predicted = STANDARD_SCALER.fit_transform(forecasts)
+    scaled_predicted = STANDARD_SCALER.transform(forecasts)
+    rmses: List[float] = []
     for i in range(n_seq):
         scaled_actual_col = [row[i] for row in scaled_actual]
         scaled_predicted_col = [row[i] for row in scaled_predicted]
         rmse_scaled = sqrt(mean_squared_error(
             scaled_actual_col, scaled_predicted_col))
-        print('t+%d Scaled RMSE: %f' % ((i+1), rmse_scaled))
+        if verbose:
+            print('t+%d Scaled RMSE: %f' % ((i+1), rmse_scaled))
+        rmses.append(rmse_scaled)
+    return rmses
 
 
-def save_results(file_name: str, actual: numpy.ndarray, forecasts: numpy.ndarray) -> None:
-    actual_file: str = f"{PATH}/actual/{file_name[:-4]}_actual.csv"
-    forecasts_file: str = f"{PATH}/forecasts/{file_name[:-4]}_forecasts.csv"
-
-    numpy.savetxt(actual_file, actual,
-                  delimiter=",", fmt="%f", header=HEADER)
-    numpy.savetxt(forecasts_file, forecasts,
-                  delimiter=",", fmt="%f", header=HEADER)
+def train_and_forecast(series_data: Series, mode: str = STATEFUL_MODE,
+                       stateless: bool = False) -> Tuple[numpy.ndarray, numpy.ndarray, float]:
+    """Train a forecaster for the series and forecast its test window
 
+    Args:
+        series_data (Series): The series to forecast
+        mode (str, optional): STATEFUL_MODE trains the stateful LSTM one sample at a time,
+            MINIBATCH_MODE trains a stateless LSTM with mini-batches and early stopping. Defaults to STATEFUL_MODE.
+        stateless (bool, optional): Forecast a stateful model without carrying state between rows. Defaults to False.
 
-def forecast_workload(series_data: Series) -> None:
-    print(f"Forecasts for {series_data.file_name}")
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray, float]: The actual values, the forecasts, and the training time in seconds
+    """
     series_df: pandas.DataFrame = get_series_data(series_data)
 
     n_lag: int = 1
@@ -241,54 +315,122 @@ def forecast_workload(series_data: Series) -> None:
     test: numpy.ndarray
     scaler, train, test = prepare_data(series_df, n_test, n_lag, n_seq)
 
-    sequential: Sequential = fit_lstm(train, n_lag, 1, 100, 4)
-    forecasts: numpy.ndarray = make_forecasts(sequential, 1, test, n_lag)
+    start: float = time.time()
+    forecasts: numpy.ndarray
+    if mode == MINIBATCH_MODE:
+        sequential: Sequential = fit_lstm_minibatch(train, n_lag)
+        training_time: float = time.time() - start
+        forecasts = make_forecasts(sequential, 1024, test, n_lag)
+    else:
+        sequential = fit_lstm(train, n_lag, 1, 100, 4)
+        training_time = time.time() - start
+        forecasts = make_stateless_forecasts(
+            sequential, test, n_lag) if stateless else make_forecasts(sequential, 1, test, n_lag)
     forecasts = inverse_transform(
         series_df, forecasts, scaler, n_test + n_seq - 1)
 
-    actual: numpy.ndarray = numpy.array([row[n_lag:] for row in test])
+    actual: numpy.ndarray = test[:, n_lag:]
     actual = inverse_transform(
         series_df, actual, scaler, n_test + n_seq - 1)
 
     actual = numpy.reshape(actual, (n_test, n_seq))
     forecasts = numpy.reshape(forecasts, (n_test, n_seq))
+    return actual, forecasts, training_time
+
+
+def forecast_workload(series_data: Series, stateless: bool = False, mode: str = STATEFUL_MODE) -> None:
+    print(f"Forecasts for {series_data.file_name}")
+    actual: numpy.ndarray
+    forecasts: numpy.ndarray
+    actual, forecasts, _ = train_and_forecast(series_data, mode, stateless)
 
-    evaluate_forecasts(actual, forecasts, n_seq)
+    evaluate_forecasts(actual, forecasts, FORECASTER_WINDOW_SIZE)
     save_results(series_data.file_name, actual, forecasts)
 
 
+def compare_training_modes(series_data: Series) -> None:
+    """Print the training time and the RMSE at each horizon of the stateful and mini-batch training modes
+    """
+    results: Dict[str, Tuple[List[float], float]] = {}
+    mode: str
+    for mode in [STATEFUL_MODE, MINIBATCH_MODE]:
+        actual, forecasts, training_time = train_and_forecast(
+            series_data, mode)
+        results[mode] = (evaluate_forecasts(
+            actual, forecasts, FORECASTER_WINDOW_SIZE, verbose=False), training_time)
+
+    print(f"Training modes for {series_data.file_name}")
+    print(f"{'':>6}{STATEFUL_MODE:>12}{MINIBATCH_MODE:>12}")
+    print(f"{'time':>6}{results[STATEFUL_MODE][1]:>11.1f}s{results[MINIBATCH_MODE][1]:>11.1f}s")
+    for i in range(FORECASTER_WINDOW_SIZE):
+        print(
+            f"{f't+{i + 1}':>6}{results[STATEFUL_MODE][0][i]:>12.4f}{results[MINIBATCH_MODE][0][i]:>12.4f}")
+
+
 def forecast_workloads() -> None:
     workload: Workload
     for workload in WORKLOADS:
         forecast_workload(workload.time_series)
 
 
-def get_predictions_dict(workloads: List[Workload]) -> Dict[str, numpy.ndarray]:
-    predictions: Dict[str, numpy.ndarray] = {}
-    for workload in workloads:
-        forecasts_file = f"{PATH}/forecasts/{workload.time_series.file_name[:-4]}_forecasts.csv"
-        workload_predictions: numpy.ndarray = pandas.read_csv(
-            forecasts_file, dtype="float64").values
-        predictions[workload.task.task_name] = STANDARD_SCALER.fit_transform(
-            workload_predictions)
-    return predictions
+def init_forecast_worker(num_threads: int) -> None:
+    """Pin the number of threads TensorFlow uses in a forecasting worker, so that parallel workers do not
+    oversubscribe the CPUs
+
+    OMP_NUM_THREADS is set by forecast_workloads_parallel instead, since unpickling the worker's target
+    imports Keras, and with it OpenMP, before this runs.
+    """
+    import tensorflow
+    tensorflow.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tensorflow.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def timed_forecast_workload(series_data: Series) -> Tuple[str, float]:
+    start: float = time.time()
+    forecast_workload(series_data)
+    return series_data.file_name, time.time() - start
+
 
+def forecast_workloads_parallel(workloads: Sequence[Workload] = WORKLOADS, num_threads: int = 1,
+                                num_workers: Optional[int] = None) -> Dict[str, float]:
+    """Train and forecast every workload in its own worker process
 
-def get_actual_dict(workloads: List[Workload]) -> Dict[str, numpy.ndarray]:
-    actual: Dict[str, numpy.ndarray] = {}
-    for workload in workloads:
-        actual_file = f"{PATH}/actual/{workload.time_series.file_name[:-4]}_actual.csv"
-        workload_actual: numpy.ndarray = pandas.read_csv(
-            actual_file, dtype="float64").values
-        actual[workload.task.task_name] = STANDARD_SCALER.fit_transform(
-            workload_actual
-        )
-    return actual
+    Args:
+        workloads (Sequence[Workload], optional): The workloads to forecast. Defaults to WORKLOADS.
+        num_threads (int, optional): Threads per worker. Defaults to 1.
+        num_workers (Optional[int], optional): Number of worker processes. Defaults to as many as fit on the CPUs.
+
+    Returns:
+        Dict[str, float]: The wall time in seconds of every workload's series
+    """
+    if num_workers is None:
+        num_workers = max(1, min(len(workloads),
+                          (os.cpu_count() or 1) // num_threads))
+    wall_times: Dict[str, float] = {}
+    start: float = time.time()
+    # TensorFlow does not survive being forked, so workers are started fresh
+    context = multiprocessing.get_context("spawn")
+    # the workers inherit the environment they are spawned with
+    previous_num_threads: Optional[str] = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    try:
+        with context.Pool(num_workers, initializer=init_forecast_worker, initargs=(num_threads,)) as pool:
+            for file_name, wall_time in pool.imap_unordered(timed_forecast_workload,
+                                                            [workload.time_series for workload in workloads]):
+                print(f"Forecasting {file_name} took {wall_time:.1f} seconds")
+                wall_times[file_name] = wall_time
+    finally:
+        if previous_num_threads is None:
+            del os.environ["OMP_NUM_THREADS"]
+        else:
+            os.environ["OMP_NUM_THREADS"] = previous_num_threads
+    print(f"Forecasting {len(workloads)} workloads took {time.time() - start:.1f} seconds")
+    return wall_times
 
 
 def main():
     # plot_series_data()
-    forecast_workloads()
+    forecast_workloads_parallel()
 
 
 if __name__ == "__main__":
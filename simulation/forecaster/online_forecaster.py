@@ -0,0 +1,139 @@
+import statistics
+import time
+import numpy
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.config.config import FORECASTER_WINDOW_SIZE, SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD
+from simulation.shared.workloads import WORKLOADS, Workload
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict, get_scaled_rmse, get_series_values
+from simulation.forecaster.forecaster import HoltWintersForecaster, HoltWintersState, get_test_origins
+
+
+class OnlineForecaster:
+    """Forecasts the workload of every job from observations that arrive one superstep at a time
+
+    Each job has a Holt-Winters forecaster fitted once on its history. Every observation then only
+    updates the level, trend and seasonal components of its job in constant time, and the next
+    horizon workloads are forecast from those components on demand.
+
+    Args:
+        workloads (Sequence[Workload]): The workloads to forecast
+        horizon (int, optional): Number of supersteps to forecast. Defaults to FORECASTER_WINDOW_SIZE.
+    """
+
+    def __init__(self, workloads: Sequence[Workload], horizon: int = FORECASTER_WINDOW_SIZE):
+        self.workloads = workloads
+        self.horizon = horizon
+        self.states: Dict[str, HoltWintersState] = {}
+        self.update_latencies: List[float] = []
+
+    def fit(self, histories: Dict[str, numpy.ndarray]) -> "OnlineForecaster":
+        """Fit the forecaster of every job and run it over the job's history
+
+        Args:
+            histories (Dict[str, numpy.ndarray]): The past workload sizes of every job
+        """
+        workload: Workload
+        for workload in self.workloads:
+            history: numpy.ndarray = histories[workload.task.task_name]
+            forecaster: HoltWintersForecaster = HoltWintersForecaster().fit(
+                history, self.horizon)
+            self.states[workload.task.task_name] = forecaster.create_online_state(
+                history)
+        return self
+
+    def observe(self, observations: Dict[str, float]) -> None:
+        """Update the forecasters with the workload sizes of the superstep that just finished
+        """
+        start: float = time.perf_counter()
+        job_name: str
+        for job_name, workload_size in observations.items():
+            self.states[job_name].update(float(workload_size))
+        self.update_latencies.append(time.perf_counter() - start)
+
+    def forecast(self) -> Dict[str, numpy.ndarray]:
+        """Forecast the workload sizes of the next horizon supersteps of every job, within the simulated workload range
+        """
+        return {job_name: numpy.clip(state.forecast(self.horizon), SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD)
+                for job_name, state in self.states.items()}
+
+    def stream(self, observations: Iterable[Dict[str, float]]) -> Iterator[Dict[str, numpy.ndarray]]:
+        """Yield the current forecasts, then the updated forecasts after every observation
+
+        The observations are only pulled when the next forecasts are requested, so they can be produced
+        lazily as the supersteps finish.
+
+        Args:
+            observations (Iterable[Dict[str, float]]): The workload sizes of every job, one superstep at a time
+
+        Yields:
+            Iterator[Dict[str, numpy.ndarray]]: The next horizon workload sizes of every job
+        """
+        yield self.forecast()
+        observation: Dict[str, float]
+        for observation in observations:
+            self.observe(observation)
+            yield self.forecast()
+
+    def report_latency(self) -> None:
+        if len(self.update_latencies) > 0:
+            print(f"Updated {len(self.update_latencies)} supersteps, mean update latency "
+                  f"{statistics.mean(self.update_latencies) * 1e6:.1f}us, max {max(self.update_latencies) * 1e6:.1f}us")
+
+
+def get_workload_histories(workloads: Sequence[Workload]) -> Dict[str, numpy.ndarray]:
+    """Get the workload sizes of every job before the first superstep of the simulation
+
+    The series are scaled with the same minimum and maximum that get_actual_dict uses for the
+    workload of each superstep, so the histories and the live observations have the same units.
+
+    Returns:
+        Dict[str, numpy.ndarray]: The history of every job
+    """
+    histories: Dict[str, numpy.ndarray] = {}
+    workload: Workload
+    for workload in workloads:
+        series: numpy.ndarray = get_series_values(
+            workload.time_series).astype("float64")
+        origins: numpy.ndarray = get_test_origins(
+            len(series), workload.time_series.n_test, FORECASTER_WINDOW_SIZE)
+        # the workload of every superstep is the first value of its test window
+        superstep_workloads: numpy.ndarray = series[origins + 1]
+        data_min: float = float(superstep_workloads.min())
+        data_range: float = float(superstep_workloads.max()) - data_min or 1
+        histories[workload.task.task_name] = SIMULATION_MIN_WORKLOAD + (series[:origins[0] + 1] - data_min) * \
+            (SIMULATION_MAX_WORKLOAD - SIMULATION_MIN_WORKLOAD) / data_range
+    return histories
+
+
+def main():
+    # replay the supersteps of the test window as if their workloads arrived live
+    actual: Dict[str, numpy.ndarray] = get_actual_dict(WORKLOADS)
+    predictions: Dict[str, numpy.ndarray] = get_predictions_dict(WORKLOADS)
+    online_forecaster: OnlineForecaster = OnlineForecaster(
+        WORKLOADS).fit(get_workload_histories(WORKLOADS))
+    n_steps: int = min(len(job_actual) for job_actual in actual.values())
+    observations: Iterator[Dict[str, float]] = (
+        {job_name: job_actual[time_step][0] for job_name, job_actual in actual.items()} for time_step in range(n_steps - 1))
+    forecasts: Dict[str, List[numpy.ndarray]] = {
+        job_name: [] for job_name in actual}
+    step_forecasts: Dict[str, numpy.ndarray]
+    for step_forecasts in online_forecaster.stream(observations):
+        for job_name, forecast in step_forecasts.items():
+            forecasts[job_name].append(forecast)
+    online_forecaster.report_latency()
+
+    print(f"{'job':>10}{'offline':>12}{'online':>12}")
+    job_name: str
+    for job_name in actual:
+        print(f"{job_name:>10}{get_scaled_rmse(actual[job_name], predictions[job_name]).mean():>12.4f}"
+              f"{get_scaled_rmse(actual[job_name], numpy.array(forecasts[job_name])).mean():>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import math
+import numpy
+from gym.spaces import Space, Discrete, Box
+from stable_baselines3 import A2C
+from stable_baselines3.common.vec_env import VecEnv
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+
+from simulation.gang_scheduling.reinforcement import MODEL_PATH, SimulatorEnv
+from simulation.gang_scheduling.resource_configurer import ResourceConfigurer
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict
+from simulation.shared.workloads import WORKLOADS, Workload
+from simulation.config.config import (GANG_SCHEDULING_CHECKPOINT_PENALTY, GANG_SCHEDULING_SIMULATION_LENGTH,
+                                      GANG_SCHEDULING_STARTING_SHARES)
+
+
+BATCHED_A2C_PATH: str = f"{MODEL_PATH}/A2C_MlpPolicy_batched"
+
+
+def sample_workload_subsets(workloads: List[Workload], num_subsets: int, rng: numpy.random.Generator) -> List[List[Workload]]:
+    """Sample proper subsets of at least half of the workloads, in the order of workloads
+
+    Returns:
+        List[List[Workload]]: The subsets
+    """
+    subsets: List[List[Workload]] = []
+    for _ in range(num_subsets):
+        size: int = int(rng.integers(math.ceil(len(workloads) / 2), len(workloads)))
+        chosen: numpy.ndarray = numpy.sort(rng.choice(len(workloads), size=size, replace=False))
+        subsets.append([workloads[index] for index in chosen])
+    return subsets
+
+
+class BatchedSimulatorEnv(VecEnv):
+    """Steps many episodes of SimulatorEnv at once, as a stable-baselines3 VecEnv
+
+    Every episode starts at a random time step and runs a random scenario: all the workloads, or one of the
+    workload subsets. The rows of actions other than 0 and the configurations they plan are precomputed for
+    every scenario and time step by SimulatorEnv, so a step of all episodes only looks them up and predicts the
+    runtimes of the current configurations, with one call of every workload model for the whole batch.
+    All episodes share the workload models, predictions and precomputed rows.
+
+    Args:
+        resource_configurer (ResourceConfigurer): Predicts the runtimes the observations are made of
+        simulation_resource_configurer (ResourceConfigurer): Predicts the runtimes the rewards are made of
+        num_envs (int): Number of episodes stepped at once
+        window_size (int): Number of time steps every observation row predicts
+        default_reward (int): Reward of a time step before its runtime and checkpoint penalty are subtracted
+        num_actions (int): Number of actions
+        duration_low (float): Runtime normalized to 0
+        duration_high (float): Runtime normalized to 1
+        workload_subsets (Optional[List[List[Workload]]], optional): The subsets of the workloads episodes may run
+            besides all of them. Defaults to no subsets.
+        max_start_time_step (int, optional): Latest time step an episode may start at. Defaults to 0.
+        checkpoint_penalty (int, optional): Reward subtracted for every reconfiguration. Defaults to GANG_SCHEDULING_CHECKPOINT_PENALTY.
+        min_shares (int, optional): CPU shares of every workload at the start of an episode. Defaults to GANG_SCHEDULING_STARTING_SHARES.
+        simulation_length (int, optional): Number of time steps of an episode. Defaults to GANG_SCHEDULING_SIMULATION_LENGTH.
+        seed (Optional[int], optional): Seed of the start time steps and scenarios. Defaults to None.
+    """
+
+    def __init__(self,
+                 resource_configurer: ResourceConfigurer,
+                 simulation_resource_configurer: ResourceConfigurer,
+                 num_envs: int,
+                 window_size: int,
+                 default_reward: int,
+                 num_actions: int,
+                 duration_low: float,
+                 duration_high: float,
+                 workload_subsets: Optional[List[List[Workload]]] = None,
+                 max_start_time_step: int = 0,
+                 checkpoint_penalty: int = GANG_SCHEDULING_CHECKPOINT_PENALTY,
+                 min_shares: int = GANG_SCHEDULING_STARTING_SHARES,
+                 simulation_length: int = GANG_SCHEDULING_SIMULATION_LENGTH,
+                 seed: Optional[int] = None):
+        self.resource_configurer = resource_configurer
+        self.simulation_resource_configurer = simulation_resource_configurer
+        self.workloads: List[Workload] = resource_configurer.workloads
+        self.window_size = window_size
+        self.default_reward = default_reward
+        self.num_actions = num_actions
+        self.duration_low = duration_low
+        self.duration_high = duration_high
+        self.max_start_time_step = max_start_time_step
+        self.checkpoint_penalty = checkpoint_penalty
+        self.min_shares = min_shares
+        self.simulation_length = simulation_length
+        self.rng: numpy.random.Generator = numpy.random.default_rng(seed)
+        observation_space: Space = Box(low=0, high=1, shape=(
+            num_actions, window_size), dtype="float64")
+        action_space: Space = Discrete(num_actions)
+        super().__init__(num_envs, observation_space, action_space)
+
+        scenarios: List[List[Workload]] = [self.workloads] + \
+            (workload_subsets if workload_subsets is not None else [])
+        # indexed by scenario, time step and action - 1
+        self.action_observations: numpy.ndarray = numpy.empty(
+            (len(scenarios), max_start_time_step + simulation_length + 1, num_actions - 1, window_size))
+        self.action_configurations: numpy.ndarray = numpy.full(
+            (len(scenarios), max_start_time_step + simulation_length + 1, num_actions - 1, len(self.workloads)), min_shares)
+        self.workload_masks: numpy.ndarray = numpy.zeros(
+            (len(scenarios), len(self.workloads)), dtype=bool)
+        index: int
+        scenario: List[Workload]
+        for index, scenario in enumerate(scenarios):
+            self.load_scenario(index, scenario)
+
+        self.scenarios: numpy.ndarray = numpy.zeros(num_envs, dtype="int64")
+        self.time_steps: numpy.ndarray = numpy.zeros(num_envs, dtype="int64")
+        self.end_time_steps: numpy.ndarray = numpy.zeros(num_envs, dtype="int64")
+        self.cpu_shares: numpy.ndarray = numpy.full(
+            (num_envs, len(self.workloads)), min_shares, dtype="int64")
+        self.actions: numpy.ndarray = numpy.zeros(num_envs, dtype="int64")
+
+    def load_scenario(self, index: int, scenario: List[Workload]) -> None:
+        """Precompute the rows and configurations of a scenario with SimulatorEnv, or load them from its cache
+        """
+        env: SimulatorEnv = SimulatorEnv(
+            resource_configurer=self.resource_configurer.for_workloads(scenario),
+            window_size=self.window_size,
+            default_reward=self.default_reward,
+            default_time_step=0,
+            workloads=scenario,
+            actual_workload_sizes=self.simulation_resource_configurer.predictions,
+            num_actions=self.num_actions,
+            duration_low=self.duration_low,
+            duration_high=self.duration_high,
+            checkpoint_penalty=self.checkpoint_penalty,
+            min_shares=self.min_shares,
+            simulation_length=self.max_start_time_step + self.simulation_length,
+            precompute_observations=True,
+            simulation_resource_configurer=self.simulation_resource_configurer.for_workloads(scenario))
+        columns: List[int] = [self.workloads.index(workload) for workload in scenario]
+        self.action_observations[index] = env.action_observations
+        self.action_configurations[index][..., columns] = env.action_configurations
+        self.workload_masks[index, columns] = True
+
+    def get_slowest_runtimes(self, resource_configurer: ResourceConfigurer, time_steps: numpy.ndarray,
+                             starting_prediction: int, env_indices: numpy.ndarray) -> numpy.ndarray:
+        """Predict the runtime of the slowest workload of every episode at a time step, with its current configuration
+        """
+        workload_sizes: numpy.ndarray = numpy.column_stack([
+            resource_configurer.predictions[workload.task.task_name][time_steps, starting_prediction]
+            for workload in self.workloads])
+        runtimes: numpy.ndarray = resource_configurer.calculate_runtimes(
+            workload_sizes, self.cpu_shares[env_indices])
+        return numpy.max(numpy.where(self.workload_masks[self.scenarios[env_indices]], runtimes, -numpy.inf), axis=1)
+
+    def get_observations(self, env_indices: numpy.ndarray) -> numpy.ndarray:
+        observations: numpy.ndarray = numpy.empty(
+            (len(env_indices), self.num_actions, self.window_size))
+        time_steps: numpy.ndarray = self.time_steps[env_indices]
+        step: int
+        for step in range(self.window_size):
+            observations[:, 0, step] = (self.get_slowest_runtimes(self.resource_configurer, time_steps, step, env_indices) -
+                                        self.duration_low) * 1.0 / (self.duration_high - self.duration_low)
+        observations[:, 1:] = self.action_observations[self.scenarios[env_indices], time_steps]
+        return observations
+
+    def reset_envs(self, env_indices: numpy.ndarray) -> None:
+        self.scenarios[env_indices] = self.rng.integers(
+            len(self.workload_masks), size=len(env_indices))
+        self.time_steps[env_indices] = self.rng.integers(
+            self.max_start_time_step + 1, size=len(env_indices))
+        self.end_time_steps[env_indices] = self.time_steps[env_indices] + \
+            self.simulation_length
+        self.cpu_shares[env_indices] = self.min_shares
+
+    def reset(self) -> numpy.ndarray:
+        all_envs: numpy.ndarray = numpy.arange(self.num_envs)
+        self.reset_envs(all_envs)
+        return self.get_observations(all_envs)
+
+    def step_async(self, actions: numpy.ndarray) -> None:
+        self.actions = numpy.asarray(actions, dtype="int64").reshape(self.num_envs)
+
+    def step_wait(self) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, List[Dict[str, Any]]]:
+        all_envs: numpy.ndarray = numpy.arange(self.num_envs)
+        reconfigured: numpy.ndarray = self.actions != 0
+        self.cpu_shares[reconfigured] = self.action_configurations[self.scenarios[reconfigured],
+                                                                   self.time_steps[reconfigured],
+                                                                   self.actions[reconfigured] - 1]
+        rewards: numpy.ndarray = self.default_reward - self.checkpoint_penalty * reconfigured - \
+            self.get_slowest_runtimes(
+                self.simulation_resource_configurer, self.time_steps, 0, all_envs)
+        rewards = (rewards + self.duration_high) / \
+            (self.duration_high - self.duration_low)
+        self.time_steps += 1
+        observations: numpy.ndarray = self.get_observations(all_envs)
+        dones: numpy.ndarray = self.time_steps == self.end_time_steps
+        infos: List[Dict[str, Any]] = [{} for _ in range(self.num_envs)]
+        done_envs: numpy.ndarray = numpy.flatnonzero(dones)
+        if len(done_envs) > 0:
+            env_index: int
+            for env_index in done_envs:
+                infos[env_index]["terminal_observation"] = observations[env_index].copy()
+            self.reset_envs(done_envs)
+            observations[done_envs] = self.get_observations(done_envs)
+        return observations, rewards, dones, infos
+
+    def close(self) -> None:
+        pass
+
+    def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+        self.rng = numpy.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+    def get_indices(self, indices: Optional[Sequence[int]]) -> List[int]:
+        if indices is None:
+            return list(range(self.num_envs))
+        if isinstance(indices, int):
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name: str, indices: Optional[Sequence[int]] = None) -> List[Any]:
+        return [getattr(self, attr_name) for _ in self.get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: Optional[Sequence[int]] = None) -> None:
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: Optional[Sequence[int]] = None, **method_kwargs) -> List[Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self.get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: Any, indices: Optional[Sequence[int]] = None) -> List[bool]:
+        return [False for _ in self.get_indices(indices)]
+
+
+def main():
+    predictions: Dict[str, numpy.ndarray] = get_predictions_dict(WORKLOADS)
+    actual: Dict[str, numpy.ndarray] = get_actual_dict(WORKLOADS)
+    resource_configurer: ResourceConfigurer = ResourceConfigurer(
+        workloads=WORKLOADS,
+        predictions=predictions
+    )
+    env = BatchedSimulatorEnv(
+        resource_configurer=resource_configurer,
+        simulation_resource_configurer=ResourceConfigurer(
+            workloads=WORKLOADS,
+            predictions=actual
+        ),
+        num_envs=16,
+        window_size=6,
+        default_reward=0,
+        num_actions=4,
+        duration_low=75,
+        duration_high=150,
+        workload_subsets=sample_workload_subsets(
+            WORKLOADS, num_subsets=3, rng=numpy.random.default_rng(0)),
+        max_start_time_step=200,
+        seed=0
+    )
+    model = A2C("MlpPolicy", env, verbose=2)
+    model.learn(total_timesteps=100000, log_interval=1)
+    model.save(BATCHED_A2C_PATH)
+
+
+if __name__ == "__main__":
+    main()
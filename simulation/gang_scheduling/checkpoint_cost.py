@@ -0,0 +1,124 @@
+import csv
+import os
+import numpy
+from dataclasses import dataclass, astuple
+from typing import Dict, List
+
+from simulation.config.config import GANG_SCHEDULING_CHECKPOINT_PENALTY
+
+
+EVENT_HEADER: List[str] = ["time_step", "num_changed_jobs",
+                           "total_share_delta", "latency"]
+
+
+@dataclass(frozen=True)
+class ReconfigurationEvent:
+    time_step: int
+    num_changed_jobs: int
+    total_share_delta: int
+    latency: float
+
+
+def get_configuration_delta(old_config: Dict[str, int], new_config: Dict[str, int]) -> List[int]:
+    """Get the absolute change in CPU shares of every job between two resource configurations
+
+    Args:
+        old_config (Dict[str, int]): The configuration being replaced
+        new_config (Dict[str, int]): The new configuration
+
+    Returns:
+        List[int]: The absolute share change of every job in the new configuration
+    """
+    return [abs(cpu_shares - old_config.get(job_name, 0)) for job_name, cpu_shares in new_config.items()]
+
+
+def create_reconfiguration_event(time_step: int, old_config: Dict[str, int], new_config: Dict[str, int],
+                                 latency: float) -> ReconfigurationEvent:
+    deltas: List[int] = get_configuration_delta(old_config, new_config)
+    return ReconfigurationEvent(time_step=time_step,
+                                num_changed_jobs=sum(delta != 0 for delta in deltas),
+                                total_share_delta=sum(deltas),
+                                latency=latency)
+
+
+def save_events(file_path: str, events: List[ReconfigurationEvent]) -> None:
+    """Append reconfiguration events to a CSV, so that the cost model can be fitted over many runs
+    """
+    write_header: bool = not os.path.exists(file_path)
+    with open(file_path, "a", newline="") as csv_file:
+        csv_writer = csv.writer(csv_file)
+        if write_header:
+            csv_writer.writerow(EVENT_HEADER)
+        for event in events:
+            csv_writer.writerow(astuple(event))
+
+
+def load_events(file_path: str) -> List[ReconfigurationEvent]:
+    with open(file_path, newline="") as csv_file:
+        return [ReconfigurationEvent(time_step=int(row["time_step"]),
+                                     num_changed_jobs=int(
+                                         row["num_changed_jobs"]),
+                                     total_share_delta=int(
+                                         row["total_share_delta"]),
+                                     latency=float(row["latency"]))
+                for row in csv.DictReader(csv_file)]
+
+
+class CheckpointCostModel:
+    """Linear model of reconfiguration latency over the number of changed jobs and the total share delta
+
+    Until it has been fitted, the model returns the constant checkpoint penalty for every reconfiguration.
+
+    Args:
+        default_cost (float, optional): Cost used before fitting. Defaults to GANG_SCHEDULING_CHECKPOINT_PENALTY.
+    """
+
+    def __init__(self, default_cost: float = GANG_SCHEDULING_CHECKPOINT_PENALTY):
+        self.default_cost = default_cost
+        self.coefficients: numpy.ndarray = numpy.array(
+            [default_cost, 0, 0], dtype="float64")
+
+    @staticmethod
+    def get_features(num_changed_jobs: int, total_share_delta: int) -> numpy.ndarray:
+        # Shares are scaled to cores so the coefficients have comparable magnitudes
+        return numpy.array([1, num_changed_jobs, total_share_delta / 1000], dtype="float64")
+
+    def fit(self, events: List[ReconfigurationEvent]) -> None:
+        """Fit the model by least squares, keeping the constant cost if there are too few events to fit
+
+        Args:
+            events (List[ReconfigurationEvent]): The measured reconfiguration events
+        """
+        if len(events) < len(self.coefficients):
+            return
+        features: numpy.ndarray = numpy.vstack([self.get_features(
+            event.num_changed_jobs, event.total_share_delta) for event in events])
+        latencies: numpy.ndarray = numpy.array(
+            [event.latency for event in events], dtype="float64")
+        self.coefficients = numpy.linalg.lstsq(
+            features, latencies, rcond=None)[0]
+
+    def estimate(self, old_config: Dict[str, int], new_config: Dict[str, int]) -> float:
+        """Estimate the cost of switching from one resource configuration to another
+
+        Args:
+            old_config (Dict[str, int]): The configuration being replaced
+            new_config (Dict[str, int]): The new configuration
+
+        Returns:
+            float: The estimated cost of the reconfiguration
+        """
+        deltas: List[int] = get_configuration_delta(old_config, new_config)
+        num_changed_jobs: int = sum(delta != 0 for delta in deltas)
+        if num_changed_jobs == 0:
+            return 0.0
+        return max(0.0, float(self.get_features(num_changed_jobs, sum(deltas)) @ self.coefficients))
+
+
+def load_checkpoint_cost_model(file_path: str) -> CheckpointCostModel:
+    """Fit a cost model from logged reconfiguration events, or return the constant model if there is no log yet
+    """
+    cost_model: CheckpointCostModel = CheckpointCostModel()
+    if os.path.exists(file_path):
+        cost_model.fit(load_events(file_path))
+    return cost_model
@@ -0,0 +1,289 @@
+import copy
+import hashlib
+import os
+import time
+import numpy
+import torch
+import torch.nn.functional as functional
+from dataclasses import dataclass
+from stable_baselines3 import DQN
+from stable_baselines3.common.callbacks import BaseCallback
+
+from typing import Dict, List, Optional
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+
+from simulation.gang_scheduling.mpc import DynamicMPController
+from simulation.gang_scheduling.reinforcement import MODEL_PATH
+from simulation.gang_scheduling.resource_configurer import ResourceConfigurer
+from simulation.gang_scheduling.tabulated_env import EpisodeEvaluation, TabulatedSimulatorEnv
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict
+from simulation.shared.workloads import WORKLOADS
+from simulation.config.config import FORECASTER_WINDOW_SIZE, GANG_SCHEDULING_CHECKPOINT_PENALTY
+
+
+WARM_START_DQN_PATH: str = f"{MODEL_PATH}/DQN_MlpPolicy_warm_start"
+
+
+@dataclass(frozen=True)
+class Demonstrations:
+    """Transitions of an episode in which the dynamic MPC picked the actions
+    """
+    observations: numpy.ndarray
+    actions: numpy.ndarray
+    rewards: numpy.ndarray
+    next_observations: numpy.ndarray
+    dones: numpy.ndarray
+
+    def save(self, path: str) -> None:
+        numpy.savez(path, observations=self.observations, actions=self.actions, rewards=self.rewards,
+                    next_observations=self.next_observations, dones=self.dones)
+
+    @staticmethod
+    def load(path: str) -> "Demonstrations":
+        with numpy.load(path) as demonstrations_file:
+            return Demonstrations(**{name: demonstrations_file[name] for name in demonstrations_file.files})
+
+
+@dataclass(frozen=True)
+class TrainingReport:
+    # None if the target reward was not reached
+    steps_to_target: Optional[int]
+    seconds_to_target: Optional[float]
+    final_reward: float
+
+
+def collect_mpc_demonstrations(env: TabulatedSimulatorEnv, mpc: DynamicMPController) -> Demonstrations:
+    """Roll out the dynamic MPC through an episode of the env, recording its decisions
+
+    The MPC plans with the env's resource configurer and may plan windows of up to num_actions - 1 time
+    steps, so every decision it makes is an action of the env.
+
+    Returns:
+        Demonstrations: The transition of every time step
+    """
+    observations: List[numpy.ndarray] = []
+    actions: List[int] = []
+    rewards: List[float] = []
+    next_observations: List[numpy.ndarray] = []
+    dones: List[bool] = []
+    observation: numpy.ndarray = env.reset()
+    done: bool = False
+    while not done:
+        action: int = int(mpc.calculate_time_horizon(
+            env.time_step, env.current_config))
+        next_observation, reward, done, _ = env.step(action)
+        observations.append(observation)
+        actions.append(action)
+        rewards.append(reward)
+        next_observations.append(next_observation)
+        dones.append(done)
+        observation = next_observation
+    return Demonstrations(observations=numpy.array(observations), actions=numpy.array(actions),
+                          rewards=numpy.array(rewards), next_observations=numpy.array(next_observations),
+                          dones=numpy.array(dones))
+
+
+def get_demonstrations_fingerprint(env: TabulatedSimulatorEnv, mpc: DynamicMPController) -> str:
+    """Hash everything the demonstrations depend on: the observations of the env, its rewards, and the
+    inputs the MPC decides with
+    """
+    fingerprint = hashlib.sha256()
+    fingerprint.update(env.get_observation_fingerprint().encode("utf-8"))
+    checkpoint_costs: Optional[List[float]] = mpc.checkpoint_cost_model.coefficients.tolist() \
+        if mpc.checkpoint_cost_model is not None else None
+    fingerprint.update(repr((env.checkpoint_penalty, mpc.length_punishment, mpc.window_size, mpc.simulation_length,
+                             GANG_SCHEDULING_CHECKPOINT_PENALTY, checkpoint_costs,
+                             FORECASTER_WINDOW_SIZE)).encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def load_mpc_demonstrations(env: TabulatedSimulatorEnv, demonstrations_dir: str = MODEL_PATH) -> Demonstrations:
+    """Load the demonstrations of the dynamic MPC for an env, or collect and save them
+    """
+    mpc: DynamicMPController = DynamicMPController(
+        resource_configurer=env.resource_configurer,
+        simulation_length=env.default_time_step + env.simulation_length,
+        window_size=env.num_actions - 1)
+    demonstrations_path: str = f"{demonstrations_dir}/mpc_demonstrations_{get_demonstrations_fingerprint(env, mpc)[:16]}.npz"
+    if os.path.exists(demonstrations_path):
+        return Demonstrations.load(demonstrations_path)
+    print(f"Rolling out the dynamic MPC for {env.simulation_length} time steps")
+    demonstrations: Demonstrations = collect_mpc_demonstrations(env, mpc)
+    demonstrations.save(demonstrations_path)
+    return demonstrations
+
+
+def pretrain_q_network(model: DQN, demonstrations: Demonstrations, epochs: int = 200, batch_size: int = 64,
+                       learning_rate: float = 1e-3, margin: float = 0.8, margin_weight: float = 1.0) -> None:
+    """Pretrain the Q-network of a DQN on demonstrations, like DQfD
+
+    The loss is the one step TD loss of the demonstrated transitions plus a large margin loss, which pushes
+    the Q-value of every other action at least margin below the Q-value of the demonstrated action. The
+    target network is synchronized after every epoch.
+
+    Args:
+        model (DQN): The model, whose Q-network and target network are updated in place
+        demonstrations (Demonstrations): The demonstrations
+        epochs (int, optional): Number of passes over the demonstrations. Defaults to 200.
+        batch_size (int, optional): Number of transitions per gradient step. Defaults to 64.
+        learning_rate (float, optional): Learning rate of the Adam optimizer. Defaults to 1e-3.
+        margin (float, optional): Margin of the large margin loss. Defaults to 0.8.
+        margin_weight (float, optional): Weight of the large margin loss. Defaults to 1.0.
+    """
+    q_net = model.policy.q_net
+    q_net_target = model.policy.q_net_target
+    optimizer = torch.optim.Adam(q_net.parameters(), lr=learning_rate)
+
+    def to_tensor(values: numpy.ndarray, dtype: torch.dtype) -> torch.Tensor:
+        return torch.as_tensor(values, dtype=dtype, device=model.device)
+
+    observations: torch.Tensor = to_tensor(demonstrations.observations, torch.float32)
+    actions: torch.Tensor = to_tensor(demonstrations.actions, torch.long)
+    rewards: torch.Tensor = to_tensor(demonstrations.rewards, torch.float32)
+    next_observations: torch.Tensor = to_tensor(demonstrations.next_observations, torch.float32)
+    dones: torch.Tensor = to_tensor(demonstrations.dones, torch.float32)
+    model.policy.set_training_mode(True)
+    for _ in range(epochs):
+        permutation: torch.Tensor = torch.randperm(len(actions), device=model.device)
+        start: int
+        for start in range(0, len(actions), batch_size):
+            batch: torch.Tensor = permutation[start:start + batch_size]
+            q_values: torch.Tensor = q_net(observations[batch])
+            demonstrated_q_values: torch.Tensor = q_values.gather(
+                1, actions[batch, None]).squeeze(1)
+            with torch.no_grad():
+                targets: torch.Tensor = rewards[batch] + (1 - dones[batch]) * model.gamma * \
+                    q_net_target(next_observations[batch]).max(dim=1).values
+            margins: torch.Tensor = torch.full_like(q_values, margin)
+            margins.scatter_(1, actions[batch, None], 0.0)
+            margin_loss: torch.Tensor = (
+                (q_values + margins).max(dim=1).values - demonstrated_q_values).mean()
+            loss: torch.Tensor = functional.smooth_l1_loss(
+                demonstrated_q_values, targets) + margin_weight * margin_loss
+            optimizer.zero_grad()
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(q_net.parameters(), model.max_grad_norm)
+            optimizer.step()
+        q_net_target.load_state_dict(q_net.state_dict())
+    model.policy.set_training_mode(False)
+
+
+def add_demonstrations_to_replay_buffer(model: DQN, demonstrations: Demonstrations) -> None:
+    index: int
+    for index in range(len(demonstrations.actions)):
+        model.replay_buffer.add(demonstrations.observations[index][None], demonstrations.next_observations[index][None],
+                                numpy.array([[demonstrations.actions[index]]]), numpy.array(
+                                    [demonstrations.rewards[index]]),
+                                numpy.array([demonstrations.dones[index]]), [{}])
+
+
+def evaluate_model(env: TabulatedSimulatorEnv, model: DQN) -> float:
+    evaluation: EpisodeEvaluation = env.evaluate_policy(
+        lambda observation: model.predict(observation, deterministic=True)[0])
+    return evaluation.total_reward
+
+
+class TargetRewardCallback(BaseCallback):
+    """Evaluates the policy exactly every eval_interval steps, and stops training once it reaches the target reward
+
+    Args:
+        eval_env (TabulatedSimulatorEnv): The env the policy is evaluated in
+        target_reward (float): The episode reward to reach
+        eval_interval (int): Number of steps between evaluations
+        start (float): The time training started at, from time.perf_counter
+    """
+
+    def __init__(self, eval_env: TabulatedSimulatorEnv, target_reward: float, eval_interval: int, start: float):
+        super().__init__()
+        self.eval_env = eval_env
+        self.target_reward = target_reward
+        self.eval_interval = eval_interval
+        self.start = start
+        self.steps_to_target: Optional[int] = None
+        self.seconds_to_target: Optional[float] = None
+
+    def _on_step(self) -> bool:
+        if self.num_timesteps % self.eval_interval != 0:
+            return True
+        if evaluate_model(self.eval_env, self.model) >= self.target_reward:
+            self.steps_to_target = self.num_timesteps
+            self.seconds_to_target = time.perf_counter() - self.start
+            return False
+        return True
+
+
+def train_dqn(env: TabulatedSimulatorEnv, target_reward: float, total_timesteps: int,
+              demonstrations: Optional[Demonstrations] = None, eval_interval: int = 1000) -> TrainingReport:
+    """Train a DQN until its policy reaches the target reward, from scratch or warm started from demonstrations
+
+    A warm started DQN is pretrained on the demonstrations, which also fill its replay buffer, and explores
+    less since its policy already follows the MPC. Its time to the target includes the pretraining.
+
+    Returns:
+        TrainingReport: The steps and seconds the DQN took to reach the target reward
+    """
+    start: float = time.perf_counter()
+    if demonstrations is None:
+        model = DQN("MlpPolicy", env, verbose=0)
+    else:
+        model = DQN("MlpPolicy", env, verbose=0, learning_starts=0,
+                    exploration_initial_eps=0.1)
+        add_demonstrations_to_replay_buffer(model, demonstrations)
+        pretrain_q_network(model, demonstrations)
+    # shares the tables of the training env, but not its episode
+    eval_env: TabulatedSimulatorEnv = copy.copy(env)
+    callback: TargetRewardCallback = TargetRewardCallback(
+        eval_env, target_reward, eval_interval, start)
+    if demonstrations is not None and evaluate_model(eval_env, model) >= target_reward:
+        callback.steps_to_target = 0
+        callback.seconds_to_target = time.perf_counter() - start
+    else:
+        model.learn(total_timesteps=total_timesteps, callback=callback)
+    if demonstrations is not None:
+        model.save(WARM_START_DQN_PATH)
+    return TrainingReport(steps_to_target=callback.steps_to_target, seconds_to_target=callback.seconds_to_target,
+                          final_reward=evaluate_model(eval_env, model))
+
+
+def main():
+    predictions: Dict[str, numpy.ndarray] = get_predictions_dict(WORKLOADS)
+    actual: Dict[str, numpy.ndarray] = get_actual_dict(WORKLOADS)
+    resource_configurer: ResourceConfigurer = ResourceConfigurer(
+        workloads=WORKLOADS,
+        predictions=predictions
+    )
+    # the env reinforcement.py trains in
+    env = TabulatedSimulatorEnv(
+        resource_configurer=resource_configurer,
+        window_size=6,
+        default_reward=0,
+        default_time_step=200,
+        workloads=WORKLOADS,
+        actual_workload_sizes=actual,
+        num_actions=4,
+        duration_low=75,
+        duration_high=150
+    )
+    demonstrations: Demonstrations = load_mpc_demonstrations(env)
+    mpc_reward: float = float(numpy.sum(demonstrations.rewards))
+    # within 5% of the reward of the MPC
+    target_reward: float = mpc_reward - 0.05 * abs(mpc_reward)
+    print(f"The dynamic MPC reached a reward of {mpc_reward:.2f}, the target is {target_reward:.2f}")
+    name: str
+    for name, training_demonstrations in [("from scratch", None), ("warm started", demonstrations)]:
+        report: TrainingReport = train_dqn(
+            env, target_reward, total_timesteps=100000, demonstrations=training_demonstrations)
+        if report.steps_to_target is None:
+            print(f"DQN {name} did not reach the target, its final reward is {report.final_reward:.2f}")
+        else:
+            print(f"DQN {name} reached the target after {report.steps_to_target} steps "
+                  f"and {report.seconds_to_target:.1f} seconds, with a reward of {report.final_reward:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
-from stable_baselines3.common.base_class import BaseAlgorithm
-from simulation.gang_scheduling.reinforcement import SimulatorEnv
 import numpy
 
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import TYPE_CHECKING, Dict, List, Optional
 from simulation.config.config import GANG_SCHEDULING_WINDOW_SIZE, GANG_SCHEDULING_SIMULATION_LENGTH, GANG_SCHEDULING_CHECKPOINT_PENALTY, FORECASTER_WINDOW_SIZE
-from simulation.forecaster.lstm_forecaster import get_predictions_dict
+from simulation.forecaster.forecast_data import get_predictions_dict
 from simulation.shared.workloads import Workload, WORKLOADS
 from simulation.gang_scheduling.resource_configurer import ResourceConfigurer, ConfigurationWindow
+from simulation.gang_scheduling.checkpoint_cost import CheckpointCostModel
+from simulation.gang_scheduling.numpy_policy import Predictor
+
+if TYPE_CHECKING:
+    # imports gym, which the other controllers do not need
+    from simulation.gang_scheduling.reinforcement import SimulatorEnv
 
 
 class MPController(ABC):
@@ -33,10 +37,27 @@ class StaticMPController(MPController):
 
 
 class DynamicMPController(MPController):
-    def __init__(self, resource_configurer: ResourceConfigurer, simulation_length: int, window_size: int):
+    def __init__(self, resource_configurer: ResourceConfigurer, simulation_length: int, window_size: int,
+                 checkpoint_cost_model: Optional[CheckpointCostModel] = None):
         super().__init__(resource_configurer=resource_configurer,
                          simulation_length=simulation_length, window_size=window_size)
         self.length_punishment = 1.02
+        self.checkpoint_cost_model = checkpoint_cost_model
+        self.dp_configs: List[Dict[str, int]] = [{}] * self.window_size
+
+    def calculate_checkpoint_penalty(self, old_config: Dict[str, int], new_config: Dict[str, int]) -> float:
+        """Cost of switching configurations, from the measured cost model if there is one
+
+        Args:
+            old_config (Dict[str, int]): The configuration being replaced
+            new_config (Dict[str, int]): The new configuration
+
+        Returns:
+            float: The checkpoint penalty
+        """
+        if self.checkpoint_cost_model is None:
+            return GANG_SCHEDULING_CHECKPOINT_PENALTY
+        return self.checkpoint_cost_model.estimate(old_config, new_config)
 
     def calculate_duration(self, configuration_window: ConfigurationWindow) -> float:
         resource_configuration: Dict[str, int] = self.resource_configurer.calculate_resource_configurations(
@@ -54,20 +75,27 @@ class DynamicMPController(MPController):
         """
         window_size: int
         window_durations: Dict[int, float] = {}
+        window_configs: Dict[int, Dict[str, int]] = {}
         for window_size in range(1, min(self.window_size - start, self.simulation_length - time_step, FORECASTER_WINDOW_SIZE - 5) + 1):
             configuration_window: ConfigurationWindow = ConfigurationWindow(
                 simulation_time_step=time_step, window_size=window_size, starting_prediction=start)
             end: int = window_size + start
+            resource_configuration: Dict[str, int] = self.resource_configurer.calculate_resource_configurations(
+                configuration_window=configuration_window)
             additional_duration: float = self.dp_durations[end] + \
-                GANG_SCHEDULING_CHECKPOINT_PENALTY if end < self.window_size else 0
-            duration: float = self.calculate_duration(
-                configuration_window) * pow(self.length_punishment, window_size)
+                self.calculate_checkpoint_penalty(
+                    resource_configuration, self.dp_configs[end]) if end < self.window_size else 0
+            duration: float = self.resource_configurer.calculate_estimated_runtime(
+                resource_configuration=resource_configuration,
+                configuration_window=configuration_window) * pow(self.length_punishment, window_size)
 
             window_durations[window_size] = duration + additional_duration
+            window_configs[window_size] = resource_configuration
         min_window: int = min(window_durations,
                               key=window_durations.get)  # type: ignore
         self.dp_durations[start] = window_durations[min_window]
         self.dp_window_sizes[start] = min_window
+        self.dp_configs[start] = window_configs[min_window]
 
     def calculate_time_horizon_for_current_config(self, time_step: int, current_config: Dict[str, int]) -> None:
         min_duration = float("inf")
@@ -78,7 +106,8 @@ class DynamicMPController(MPController):
                     simulation_time_step=time_step, window_size=config_keep_length)
             ) * pow(self.length_punishment, config_keep_length)
             additional_duration: float = self.dp_durations[config_keep_length] + \
-                GANG_SCHEDULING_CHECKPOINT_PENALTY if config_keep_length < GANG_SCHEDULING_WINDOW_SIZE else 0
+                self.calculate_checkpoint_penalty(
+                    current_config, self.dp_configs[config_keep_length]) if config_keep_length < self.window_size else 0
             min_duration = min(
                 min_duration, config_duration + additional_duration)
         if min_duration < self.dp_durations[0]:
@@ -88,12 +117,14 @@ class DynamicMPController(MPController):
     def calculate_time_horizon(self, time_step: int, current_config: Dict[str, int] = {}) -> int:
         self.dp_durations = numpy.zeros(self.window_size, dtype="float64")
         self.dp_window_sizes = numpy.zeros(self.window_size, dtype="int")
+        self.dp_configs = [{}] * self.window_size
 
         for start in reversed(range(min(self.window_size, self.simulation_length - time_step))):
             self.calculate_time_horizon_from_start(
                 time_step=time_step, start=start)
         if time_step != 0:
-            self.dp_durations[0] += GANG_SCHEDULING_CHECKPOINT_PENALTY
+            self.dp_durations[0] += self.calculate_checkpoint_penalty(
+                current_config, self.dp_configs[0]) if len(current_config) != 0 else GANG_SCHEDULING_CHECKPOINT_PENALTY
         if len(current_config) != 0:
             self.calculate_time_horizon_for_current_config(
                 time_step, current_config)
@@ -101,7 +132,7 @@ class DynamicMPController(MPController):
 
 
 class ReinforcementMPController(MPController):
-    def __init__(self, model: BaseAlgorithm, env: SimulatorEnv, resource_configurer: ResourceConfigurer, simulation_length: int, window_size: int):
+    def __init__(self, model: Predictor, env: "SimulatorEnv", resource_configurer: ResourceConfigurer, simulation_length: int, window_size: int):
         super().__init__(resource_configurer=resource_configurer,
                          simulation_length=simulation_length, window_size=window_size)
         self.model = model
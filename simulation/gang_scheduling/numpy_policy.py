@@ -0,0 +1,233 @@
+import collections
+import io
+import json
+import pickle
+import time
+import zipfile
+import numpy
+
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+
+ACTIVATIONS: Dict[str, Callable[[numpy.ndarray], numpy.ndarray]] = {
+    "ReLU": lambda values: numpy.maximum(values, 0),
+    "Tanh": numpy.tanh,
+}
+# The activation stable-baselines3 uses when policy_kwargs do not set activation_fn, by policy module
+DEFAULT_ACTIVATIONS: Dict[str, str] = {
+    "stable_baselines3.dqn.policies": "ReLU",
+    "stable_baselines3.common.policies": "Tanh",
+}
+# The layers of the network that picks the action, in order, by policy module
+LAYER_PREFIXES: Dict[str, List[str]] = {
+    "stable_baselines3.dqn.policies": ["q_net.q_net."],
+    "stable_baselines3.common.policies": ["mlp_extractor.shared_net.", "mlp_extractor.policy_net.", "action_net."],
+}
+STORAGE_TYPES: Dict[str, type] = {
+    "FloatStorage": numpy.float32,
+    "DoubleStorage": numpy.float64,
+    "HalfStorage": numpy.float16,
+    "LongStorage": numpy.int64,
+    "IntStorage": numpy.int32,
+}
+
+
+class Predictor(Protocol):
+    """Anything that picks actions like a stable-baselines3 model, e.g. a NumpyMlpPolicy
+    """
+
+    def predict(self, observation: numpy.ndarray, state: Any = None, mask: Any = None,
+                deterministic: bool = False) -> Tuple[numpy.ndarray, Any]:
+        ...
+
+
+class StateDictUnpickler(pickle.Unpickler):
+    """Reads the state dict PyTorch saves in its zip format into NumPy arrays, without importing PyTorch
+
+    Only the classes a state dict of tensors is made of may be loaded.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, prefix: str):
+        super().__init__(io.BytesIO(archive.read(f"{prefix}/data.pkl")))
+        self.archive = archive
+        self.prefix = prefix
+
+    def find_class(self, module: str, name: str) -> Any:
+        if (module, name) == ("collections", "OrderedDict"):
+            return collections.OrderedDict
+        if (module, name) == ("torch._utils", "_rebuild_tensor_v2"):
+            return rebuild_tensor
+        if module == "torch" and name in STORAGE_TYPES:
+            return STORAGE_TYPES[name]
+        raise pickle.UnpicklingError(
+            f"{module}.{name} is not part of a state dict of tensors")
+
+    def persistent_load(self, pid: Tuple) -> numpy.ndarray:
+        _, storage_type, key, _, _ = pid
+        return numpy.frombuffer(self.archive.read(f"{self.prefix}/data/{key}"), dtype=storage_type)
+
+
+def rebuild_tensor(storage: numpy.ndarray, storage_offset: int, size: Tuple[int, ...], stride: Tuple[int, ...],
+                   *_) -> numpy.ndarray:
+    return numpy.lib.stride_tricks.as_strided(storage[storage_offset:], shape=size,
+                                              strides=[step * storage.itemsize for step in stride]).copy()
+
+
+def load_state_dict(data: bytes) -> Dict[str, numpy.ndarray]:
+    archive: zipfile.ZipFile = zipfile.ZipFile(io.BytesIO(data))
+    prefix: str = archive.namelist()[0].split("/")[0]
+    return StateDictUnpickler(archive, prefix).load()
+
+
+class NumpyMlpPolicy:
+    """The MLP of a stable-baselines3 DQN or A2C policy, evaluated with NumPy
+
+    predict works like the predict of the stable-baselines3 model, on one observation or a batch of them,
+    and always picks the deterministic action: the largest Q-value or action logit. The layers are evaluated
+    in float32, like PyTorch does.
+
+    Args:
+        weights (List[numpy.ndarray]): The weight of every linear layer, of shape (outputs, inputs)
+        biases (List[numpy.ndarray]): The bias of every linear layer
+        activation (str): The activation between the layers, a key of ACTIVATIONS
+        observation_shape (Tuple[int, ...]): The shape of one observation
+    """
+
+    def __init__(self, weights: List[numpy.ndarray], biases: List[numpy.ndarray], activation: str,
+                 observation_shape: Tuple[int, ...]):
+        # transposed once, so that a batch is multiplied from the left
+        self.weights: List[numpy.ndarray] = [numpy.ascontiguousarray(
+            weight.T, dtype="float32") for weight in weights]
+        self.biases: List[numpy.ndarray] = [
+            numpy.asarray(bias, dtype="float32") for bias in biases]
+        self.activation = activation
+        self.activation_function: Callable[[numpy.ndarray], numpy.ndarray] = ACTIVATIONS[activation]
+        self.observation_shape: Tuple[int, ...] = tuple(observation_shape)
+
+    @staticmethod
+    def from_stable_baselines(model_path: str) -> "NumpyMlpPolicy":
+        """Convert the policy of a model saved by stable-baselines3, without importing PyTorch or stable-baselines3
+
+        Args:
+            model_path (str): The saved model, with or without its .zip extension
+
+        Returns:
+            NumpyMlpPolicy: The policy
+        """
+        with zipfile.ZipFile(model_path if model_path.endswith(".zip") else f"{model_path}.zip") as model_file:
+            data: Dict[str, Any] = json.loads(model_file.read("data"))
+            state_dict: Dict[str, numpy.ndarray] = load_state_dict(
+                model_file.read("policy.pth"))
+        policy_module: str = data["policy_class"]["__module__"]
+        if policy_module not in LAYER_PREFIXES:
+            raise ValueError(f"Policies from {policy_module} are not supported")
+        activation: str = DEFAULT_ACTIVATIONS[policy_module]
+        activation_class: Optional[str] = data["policy_kwargs"].get("activation_fn")
+        if activation_class is not None:
+            activation = activation_class.split(".")[-1].rstrip("'>")
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"The activation {activation_class} is not supported")
+        weights: List[numpy.ndarray] = []
+        biases: List[numpy.ndarray] = []
+        prefix: str
+        for prefix in LAYER_PREFIXES[policy_module]:
+            # Sequential modules number their layers, a single Linear module has its parameters directly under the prefix
+            layer_names: List[str] = sorted({name[len(prefix):].rpartition(".")[0] for name in state_dict if name.startswith(prefix)},
+                                            key=lambda layer_name: int(layer_name) if layer_name.isdigit() else -1)
+            layer_name: str
+            for layer_name in layer_names:
+                layer: str = f"{prefix}{layer_name}." if layer_name else prefix
+                weights.append(state_dict[f"{layer}weight"])
+                biases.append(state_dict[f"{layer}bias"])
+        return NumpyMlpPolicy(weights, biases, activation, tuple(data["observation_space"]["shape"]))
+
+    def save(self, path: str) -> None:
+        numpy.savez(path, activation=self.activation, observation_shape=self.observation_shape,
+                    **{f"weight_{index}": weight.T for index, weight in enumerate(self.weights)},
+                    **{f"bias_{index}": bias for index, bias in enumerate(self.biases)})
+
+    @staticmethod
+    def load(path: str) -> "NumpyMlpPolicy":
+        with numpy.load(path) as policy_file:
+            num_layers: int = sum(name.startswith("weight_") for name in policy_file.files)
+            return NumpyMlpPolicy([policy_file[f"weight_{index}"] for index in range(num_layers)],
+                                  [policy_file[f"bias_{index}"]
+                                      for index in range(num_layers)],
+                                  str(policy_file["activation"]), tuple(policy_file["observation_shape"]))
+
+    def get_action_values(self, observations: numpy.ndarray) -> numpy.ndarray:
+        """Get the Q-values or action logits of a batch of observations
+
+        Returns:
+            numpy.ndarray: The values, of shape (observations, actions)
+        """
+        values: numpy.ndarray = numpy.asarray(observations, dtype="float32").reshape(
+            len(observations), -1)
+        index: int
+        for index, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            values = values @ weight + bias
+            if index < len(self.weights) - 1:
+                values = self.activation_function(values)
+        return values
+
+    def predict(self, observation: numpy.ndarray, state: Any = None, mask: Any = None,
+                deterministic: bool = True) -> Tuple[numpy.ndarray, Any]:
+        """Pick the action of an observation or a batch of observations, like the stable-baselines3 model
+
+        Returns:
+            Tuple[numpy.ndarray, Any]: The action or actions, and the unchanged state
+        """
+        observation = numpy.asarray(observation)
+        vectorized: bool = observation.shape != self.observation_shape
+        observations: numpy.ndarray = observation if vectorized else observation[None]
+        actions: numpy.ndarray = numpy.argmax(
+            self.get_action_values(observations), axis=1)
+        return (actions if vectorized else actions[0]), state
+
+
+def compare_with_stable_baselines(model_path: str, policy: NumpyMlpPolicy, observations: numpy.ndarray) -> None:
+    """Check that a policy picks the same actions as the stable-baselines3 model it was converted from, and time both
+    """
+    from stable_baselines3 import A2C, DQN
+    with zipfile.ZipFile(f"{model_path}.zip") as model_file:
+        algorithm = DQN if json.loads(model_file.read("data"))[
+            "policy_class"]["__module__"].startswith("stable_baselines3.dqn") else A2C
+    model = algorithm.load(model_path)
+    start: float = time.perf_counter()
+    expected: numpy.ndarray = numpy.array([model.predict(
+        observation, deterministic=True)[0] for observation in observations])
+    model_latency: float = (time.perf_counter() - start) / len(observations)
+    start = time.perf_counter()
+    actual: numpy.ndarray = numpy.array(
+        [policy.predict(observation)[0] for observation in observations])
+    policy_latency: float = (time.perf_counter() - start) / len(observations)
+    if not numpy.array_equal(expected, actual):
+        raise AssertionError(
+            f"{numpy.sum(expected != actual)} of {len(observations)} actions differ from {model_path}")
+    if not numpy.array_equal(policy.predict(observations)[0], actual):
+        raise AssertionError("Batched actions differ from the actions of single observations")
+    print(f"{model_path} matches on {len(observations)} observations, "
+          f"{model_latency * 1e6:.1f} us per decision with stable-baselines3, {policy_latency * 1e6:.1f} us with NumPy")
+
+
+def main():
+    from simulation.gang_scheduling.reinforcement import A2C_PATH, DQN_PATH
+    rng: numpy.random.Generator = numpy.random.default_rng(0)
+    model_path: str
+    for model_path in [DQN_PATH, A2C_PATH]:
+        policy: NumpyMlpPolicy = NumpyMlpPolicy.from_stable_baselines(
+            model_path)
+        policy.save(f"{model_path}.npz")
+        # normalized durations, mostly within the observation space of [0, 1]
+        observations: numpy.ndarray = rng.uniform(
+            -0.5, 1.5, size=(1000, *policy.observation_shape))
+        compare_with_stable_baselines(model_path, policy, observations)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
+import hashlib
+import os
 import numpy
 from gym import Env
 from gym.spaces import Space, Discrete, Box
-from stable_baselines3 import DQN, A2C
 
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any, Sequence
 
 import sys
 from pathlib import Path
@@ -12,10 +13,11 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 
 
 from simulation.gang_scheduling.resource_configurer import ConfigurationWindow, ResourceConfigurer
-from simulation.forecaster.lstm_forecaster import get_actual_dict, get_predictions_dict
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict
 from simulation.shared.workloads import WORKLOADS, Workload
-from simulation.config.config import (SIMULATION_DIR, GANG_SCHEDULING_CHECKPOINT_PENALTY,
-                                      GANG_SCHEDULING_SIMULATION_LENGTH, GANG_SCHEDULING_STARTING_SHARES)
+from simulation.config.config import (SIMULATION_DIR, GANG_SCHEDULING_CHECKPOINT_PENALTY, GANG_SCHEDULING_MAX_SHARES,
+                                      GANG_SCHEDULING_SHARE_INCREMENT, GANG_SCHEDULING_SIMULATION_LENGTH,
+                                      GANG_SCHEDULING_STARTING_SHARES)
 
 
 MODEL_PATH: str = f"{SIMULATION_DIR}/gang_scheduling/models"
@@ -24,19 +26,33 @@ DQN_PATH: str = f"{MODEL_PATH}/DQN_MlpPolicy_scaled"
 
 
 class SimulatorEnv(Env):
+    """Gym environment in which an agent picks how many time steps the next resource configuration is planned for
+
+    The observation has a row for every action, with the normalized runtimes the next window_size time steps
+    are predicted to take after it. Action 0 keeps the current configuration and every other action plans a
+    new configuration for that many time steps.
+
+    Only the row of action 0 depends on the configuration the agent has chosen. With precompute_observations,
+    the rows and configurations of every other action are calculated once for every time step and cached in
+    observation_cache_dir, so steps only predict the runtimes of the current configuration.
+    """
+
     def __init__(self,
                  resource_configurer: ResourceConfigurer,
                  window_size: int,
                  default_reward: int,
                  default_time_step: int,
-                 workloads: List[Workload],
+                 workloads: Sequence[Workload],
                  actual_workload_sizes: Dict[str, numpy.ndarray],
                  num_actions: int,
                  duration_low: float,
                  duration_high: float,
                  checkpoint_penalty: int = GANG_SCHEDULING_CHECKPOINT_PENALTY,
                  min_shares: int = GANG_SCHEDULING_STARTING_SHARES,
-                 simulation_length: int = GANG_SCHEDULING_SIMULATION_LENGTH):
+                 simulation_length: int = GANG_SCHEDULING_SIMULATION_LENGTH,
+                 precompute_observations: bool = False,
+                 observation_cache_dir: str = MODEL_PATH,
+                 simulation_resource_configurer: Optional[ResourceConfigurer] = None):
 
         self.resource_configurer: ResourceConfigurer = resource_configurer
         self.window_size = window_size
@@ -55,20 +71,92 @@ class SimulatorEnv(Env):
         self.action_space: Space = Discrete(num_actions)
         self.observation_space: Space = Box(low=0, high=1, shape=(
             num_actions, window_size), dtype="float64")
+        # indexed by time step - default_time_step and action - 1
+        self.action_observations: Optional[numpy.ndarray] = None
+        self.action_configurations: Optional[numpy.ndarray] = None
+        if precompute_observations:
+            self.load_action_observations(observation_cache_dir)
         self.state = self.get_state_from_time_step(self.time_step)
-        self.simulation_resource_configurer = ResourceConfigurer(
-            workloads=self.workloads,
-            predictions=actual_workload_sizes
-        )
+        self.simulation_resource_configurer = simulation_resource_configurer if simulation_resource_configurer is not None \
+            else ResourceConfigurer(
+                workloads=self.workloads,
+                predictions=actual_workload_sizes
+            )
 
-    def get_durations_from_action(self, time_step: int, action: int) -> numpy.ndarray:
+    def get_observation_fingerprint(self) -> str:
+        """Hash everything the rows of actions other than 0 depend on, to tell whether a cache is still valid
+
+        Besides the environment and the workloads, this is the share budget and share levels the resource
+        configurer allocates with.
+        """
+        fingerprint = hashlib.sha256()
+        fingerprint.update(repr((self.window_size, self.num_actions, self.default_time_step, self.simulation_length,
+                                 self.duration_low, self.duration_high, self.min_shares,
+                                 self.resource_configurer.total_shares, GANG_SCHEDULING_STARTING_SHARES,
+                                 GANG_SCHEDULING_MAX_SHARES, GANG_SCHEDULING_SHARE_INCREMENT)).encode("utf-8"))
+        workload: Workload
+        for workload in self.workloads:
+            fingerprint.update(workload.task.task_name.encode("utf-8"))
+            fingerprint.update(numpy.ascontiguousarray(
+                self.resource_configurer.predictions[workload.task.task_name], dtype="float64").tobytes())
+        fingerprint.update(
+            self.resource_configurer.profiling_df.to_csv().encode("utf-8"))
+        return fingerprint.hexdigest()
+
+    def precompute_action_observations(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Calculate the configuration and observation row of every action other than 0 at every time step
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The observations, of shape (time steps, actions - 1, window_size), and the
+                CPU shares of every workload, of shape (time steps, actions - 1, workloads)
+        """
+        num_time_steps: int = self.simulation_length + 1
+        observations: numpy.ndarray = numpy.empty(
+            (num_time_steps, self.num_actions - 1, self.window_size))
+        configurations: numpy.ndarray = numpy.empty(
+            (num_time_steps, self.num_actions - 1, len(self.workloads)), dtype="int64")
+        index: int
+        for index in range(num_time_steps):
+            time_step: int = self.default_time_step + index
+            action: int
+            for action in range(1, self.num_actions):
+                config: Dict[str, int] = self.resource_configurer.calculate_resource_configurations(
+                    configuration_window=ConfigurationWindow(simulation_time_step=time_step, window_size=action))
+                observations[index, action - 1] = self.get_durations_from_config(time_step, config)
+                configurations[index, action - 1] = [config[workload.task.task_name]
+                                                     for workload in self.workloads]
+        return observations, configurations
+
+    def load_action_observations(self, observation_cache_dir: str) -> None:
+        """Load the precomputed rows of every action other than 0, or precompute and cache them
+        """
+        cache_path: str = f"{observation_cache_dir}/observations_{self.get_observation_fingerprint()[:16]}.npz"
+        if os.path.exists(cache_path):
+            with numpy.load(cache_path) as cache:
+                self.action_observations = cache["observations"]
+                self.action_configurations = cache["configurations"]
+            return
+        print(f"Precomputing the observations of {self.simulation_length + 1} time steps")
+        self.action_observations, self.action_configurations = self.precompute_action_observations()
+        os.makedirs(observation_cache_dir, exist_ok=True)
+        # written under a temporary name first, so an interrupted run does not leave a partial cache behind
+        temporary_path: str = f"{cache_path}.tmp.npz"
+        numpy.savez(temporary_path, observations=self.action_observations,
+                    configurations=self.action_configurations)
+        os.replace(temporary_path, cache_path)
+
+    def calculate_configuration(self, time_step: int, action: int) -> Dict[str, int]:
+        configurations: Optional[numpy.ndarray] = self.action_configurations
+        index: int = time_step - self.default_time_step
+        if configurations is not None and 0 <= index < len(configurations):
+            shares: numpy.ndarray = configurations[index, action - 1]
+            return {workload.task.task_name: int(cpu_shares) for workload, cpu_shares in zip(self.workloads, shares)}
+        return self.resource_configurer.calculate_resource_configurations(configuration_window=ConfigurationWindow(
+            simulation_time_step=time_step, window_size=action
+        ))
+
+    def get_durations_from_config(self, time_step: int, config: Dict[str, int]) -> numpy.ndarray:
         durations: numpy.ndarray = numpy.empty((self.window_size,))
-        if action == 0:
-            config = self.current_config
-        else:
-            config = self.resource_configurer.calculate_resource_configurations(configuration_window=ConfigurationWindow(
-                simulation_time_step=time_step, window_size=action
-            ))
         for step in range(self.window_size):
             config_window = ConfigurationWindow(
                 simulation_time_step=time_step,
@@ -81,7 +169,21 @@ class SimulatorEnv(Env):
             ) - self.duration_low) * 1.0 / (self.duration_high - self.duration_low)
         return durations
 
+    def get_durations_from_action(self, time_step: int, action: int) -> numpy.ndarray:
+        if action == 0:
+            return self.get_durations_from_config(time_step, self.current_config)
+        observations: Optional[numpy.ndarray] = self.action_observations
+        index: int = time_step - self.default_time_step
+        if observations is not None and 0 <= index < len(observations):
+            return observations[index, action - 1].copy()
+        return self.get_durations_from_config(time_step, self.calculate_configuration(time_step, action))
+
     def get_state_from_time_step(self, time_step: int) -> numpy.ndarray:
+        observations: Optional[numpy.ndarray] = self.action_observations
+        index: int = time_step - self.default_time_step
+        if observations is not None and 0 <= index < len(observations):
+            return numpy.vstack([self.get_durations_from_config(time_step, self.current_config),
+                                 observations[index]])
         predicted_durations: List[numpy.ndarray] = []
         for action in range(self.num_actions):
             action_durations: numpy.ndarray = self.get_durations_from_action(
@@ -101,13 +203,8 @@ class SimulatorEnv(Env):
 
         if action != 0:
             reward -= self.checkpoint_penalty
-            configuration_window = ConfigurationWindow(
-                simulation_time_step=self.time_step,
-                window_size=action
-            )
-            self.current_config = self.resource_configurer.calculate_resource_configurations(
-                configuration_window
-            )
+            self.current_config = self.calculate_configuration(
+                self.time_step, action)
 
         reward -= self.simulation_resource_configurer.calculate_estimated_runtime(
             resource_configuration=self.current_config,
@@ -131,6 +228,8 @@ class SimulatorEnv(Env):
 
 
 def main():
+    # imported here, so that the simulator can use the env without loading PyTorch
+    from stable_baselines3 import DQN
     predictions: Dict[str, numpy.ndarray] = get_predictions_dict(WORKLOADS)
     actual: Dict[str, numpy.ndarray] = get_actual_dict(WORKLOADS)
     resource_configurer: ResourceConfigurer = ResourceConfigurer(
@@ -146,7 +245,8 @@ def main():
         actual_workload_sizes=actual,
         num_actions=4,
         duration_low=75,
-        duration_high=150
+        duration_high=150,
+        precompute_observations=True
     )
     model = DQN("MlpPolicy", env, verbose=2)
     model.learn(total_timesteps=100000, log_interval=1)
@@ -1,15 +1,16 @@
+import copy
 import pandas
 import numpy
 import statistics
 from operator import attrgetter
-from scipy import interpolate
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Sequence
 
 from simulation.shared.workloads import Workload, WORKLOADS
-from simulation.forecaster.lstm_forecaster import get_predictions_dict, get_actual_dict
+from simulation.forecaster.forecast_data import get_predictions_dict, get_actual_dict
+from simulation.gang_scheduling.workload_models import RefinedWorkloadModel, WorkloadModel, create_workload_model
 from simulation.config.config import (GANG_SCHEDULING_MAX_SHARES, GANG_SCHEDULING_SHARE_INCREMENT, GANG_SCHEDULING_STARTING_SHARES,
-                                      GANG_SCHEDULING_TOTAL_SHARES, PROFILER_MAX_SHARES, PROFILER_MIN_SHARES, PROFILER_OUTPUT_PATH, PROFILER_SHARE_INCREMENT, SIMULATION_DIR, SIMULATION_MAX_WORKLOAD, SIMULATION_MIN_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT)
+                                      GANG_SCHEDULING_TOTAL_SHARES, PROFILER_OUTPUT_PATH, SIMULATION_DIR, SIMULATION_MAX_WORKLOAD, SIMULATION_MIN_WORKLOAD)
 
 
 @dataclass(frozen=True)
@@ -27,42 +28,151 @@ class ConfigurationWindow:
     starting_prediction: int = 0
 
 
+def load_profiling_df() -> pandas.DataFrame:
+    """Read the profiler output, with a row of task name, workload size, CPU shares and duration for every point
+    """
+    return pandas.read_csv(SIMULATION_DIR + PROFILER_OUTPUT_PATH, dtype={0: str, 1: "float64", 2: "float64", 3: "float64"})
+
+
 class ResourceConfigurer:
-    def __init__(self, workloads: List[Workload], predictions: Dict[str, numpy.ndarray]) -> None:
-        self.profiling_df: pandas.Dataframe = pandas.read_csv(
-            SIMULATION_DIR + PROFILER_OUTPUT_PATH, dtype={0: str, 1: "float64", 2: "float64", 3: "float64"})
-        self.workloads: List[Workload] = workloads
-        self.workload_models: Dict[str,
-                                   interpolate.RectBivariateSpline] = self.create_workload_models()
+    """Plans the CPU shares of a gang from the profiles of its workloads
+
+    Args:
+        workloads (Sequence[Workload]): The workloads of the gang
+        predictions (Dict[str, numpy.ndarray]): The predicted workload sizes of every job
+        profiling_df (Optional[pandas.DataFrame], optional): The profile, in the format of the profiler output,
+            e.g. of synthetic workloads. Defaults to the profiler output.
+        total_shares (int, optional): The CPU shares the gang is planned with. Defaults to GANG_SCHEDULING_TOTAL_SHARES.
+    """
+
+    def __init__(self, workloads: Sequence[Workload], predictions: Dict[str, numpy.ndarray],
+                 profiling_df: Optional[pandas.DataFrame] = None, total_shares: int = GANG_SCHEDULING_TOTAL_SHARES) -> None:
+        self.profiling_df: pandas.DataFrame = profiling_df if profiling_df is not None else load_profiling_df()
+        # a point is profiled again if the profiler stopped after logging it but before finishing it
+        self.profiling_df = self.profiling_df.drop_duplicates(
+            subset=list(self.profiling_df.columns[:3]), keep="last")
+        self.workloads: List[Workload] = list(workloads)
+        self.workload_models: Dict[str, WorkloadModel] = self.create_workload_models()
         self.predictions: Dict[str, numpy.ndarray] = predictions
         self.delta = 0.95
+        self.total_shares = total_shares
+        self.drifted_workloads: Set[str] = set()
+
+    def for_workloads(self, workloads: Sequence[Workload]) -> "ResourceConfigurer":
+        """Get a resource configurer for some of the workloads, which shares the profile, workload models and
+        predictions of this one rather than copying them
+        """
+        resource_configurer: ResourceConfigurer = copy.copy(self)
+        resource_configurer.workloads = list(workloads)
+        return resource_configurer
+
+    def update_predictions(self, time_step: int, forecasts: Dict[str, numpy.ndarray]) -> None:
+        """Store the forecasts made at a time step, so that configuration windows starting at that time step use them
+
+        The predictions of a job grow as needed, and the rows after the latest stored time step are zeros.
+
+        Args:
+            time_step (int): The simulation time step the forecasts were made at
+            forecasts (Dict[str, numpy.ndarray]): The forecasted workload sizes of every job
+        """
+        job_name: str
+        for job_name, forecast in forecasts.items():
+            job_predictions: numpy.ndarray = self.predictions.get(
+                job_name, numpy.zeros((0, len(forecast))))
+            if len(job_predictions) <= time_step:
+                # doubled, so that streaming T time steps copies O(T) rows rather than O(T^2)
+                grown: numpy.ndarray = numpy.zeros(
+                    (max(time_step + 1, 2 * len(job_predictions)), len(forecast)), dtype="float64")
+                grown[:len(job_predictions)] = job_predictions
+                self.predictions[job_name] = grown
+            self.predictions[job_name][time_step] = forecast
+
+    def stream_resource_configurations(self, forecast_stream: Iterable[Dict[str, numpy.ndarray]],
+                                       window_size: int) -> Iterator[Dict[str, int]]:
+        """Calculate a resource configuration from every forecast of a live forecast stream
+
+        Args:
+            forecast_stream (Iterable[Dict[str, numpy.ndarray]]): The forecasts of every time step, e.g. OnlineForecaster.stream
+            window_size (int): Number of forecasted time steps every configuration is calculated for
+
+        Yields:
+            Iterator[Dict[str, int]]: The resource configuration of every time step
+        """
+        time_step: int
+        forecasts: Dict[str, numpy.ndarray]
+        for time_step, forecasts in enumerate(forecast_stream):
+            self.update_predictions(time_step, forecasts)
+            yield self.calculate_resource_configurations(ConfigurationWindow(
+                simulation_time_step=time_step, window_size=window_size))
 
-    def create_workload_models(self) -> Dict[str, interpolate.RectBivariateSpline]:
-        workload_models: Dict[str, interpolate.RectBivariateSpline] = {}
+    def create_workload_models(self) -> Dict[str, WorkloadModel]:
+        workload_models: Dict[str, WorkloadModel] = {}
+        # split once rather than scanning the whole profile for every workload
+        task_profiles: Dict[str, pandas.DataFrame] = dict(
+            list(self.profiling_df.groupby(self.profiling_df.columns[0], sort=False)))
         workload: Workload
-        cpu_shares: numpy.ndarray = numpy.arange(
-            PROFILER_MIN_SHARES, PROFILER_MAX_SHARES, PROFILER_SHARE_INCREMENT)
-        workloads: numpy.ndarray = numpy.arange(
-            SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT
-        )
         for workload in self.workloads:
-            workload_values: numpy.ndarray = self.profiling_df[self.profiling_df[self.profiling_df.columns[0]] ==
-                                                               workload.task.task_name].sort_values(by=[self.profiling_df.columns[1],
-                                                                                                        self.profiling_df.columns[2]]).values
-            durations: numpy.ndarray = numpy.reshape(
-                workload_values[:, 3], (len(workloads), len(cpu_shares)))
-
-            workload_models[workload.task.task_name] = interpolate.RectBivariateSpline(
-                workloads,
-                cpu_shares,
-                durations)
+            workload_values: numpy.ndarray = task_profiles[workload.task.task_name].sort_values(
+                by=[self.profiling_df.columns[1], self.profiling_df.columns[2]]).values
+            # the profile is either the full grid of workload sizes and CPU shares, or scattered adaptively sampled points
+            workload_models[workload.task.task_name] = create_workload_model(
+                workload_values[:, 1].astype("float64"),
+                workload_values[:, 2].astype("float64"),
+                workload_values[:, 3].astype("float64"))
         return workload_models
 
-    def get_slowest_job(self, resource_configuration: Dict[str, int], configuration_window: ConfigurationWindow, forecast_step: int) -> RunResult:
+    def refine_workload_models(self) -> None:
+        """Correct the workload models with the runtimes passed to observe_runtimes from now on
+        """
+        job_name: str
+        for job_name, workload_model in self.workload_models.items():
+            if not isinstance(workload_model, RefinedWorkloadModel):
+                self.workload_models[job_name] = RefinedWorkloadModel(
+                    workload_model)
+
+    def observe_runtimes(self, run_results: List[RunResult]) -> None:
+        """Fold the runtimes a superstep measured into the refined workload models, and report the workloads
+        that have drifted from their profile
+
+        Does nothing for workload models that are not refined.
+        """
+        run_result: RunResult
+        for run_result in run_results:
+            job_name: str = run_result.workload.task.task_name
+            workload_model: WorkloadModel = self.workload_models[job_name]
+            if not isinstance(workload_model, RefinedWorkloadModel):
+                continue
+            workload_model.observe(
+                run_result.workload_size, run_result.cpu_shares, run_result.runtime)
+            if workload_model.drift_detected and job_name not in self.drifted_workloads:
+                self.drifted_workloads.add(job_name)
+                print(f"The runtimes of {job_name} have drifted from its profile after "
+                      f"{workload_model.num_observations} observations, it should be profiled again")
+
+    def calculate_runtimes(self, workload_sizes: numpy.ndarray, cpu_shares: numpy.ndarray) -> numpy.ndarray:
+        """Predict the runtimes of a batch of points at once, with one call of every workload model
+
+        Args:
+            workload_sizes (numpy.ndarray): The workload sizes, with a last axis over self.workloads
+            cpu_shares (numpy.ndarray): The CPU shares, of the same shape
+
+        Returns:
+            numpy.ndarray: The runtimes, of the same shape
+        """
+        runtimes: numpy.ndarray = numpy.empty(numpy.shape(workload_sizes))
+        index: int
+        workload: Workload
+        for index, workload in enumerate(self.workloads):
+            runtimes[..., index] = numpy.reshape(self.workload_models[workload.task.task_name](
+                numpy.ravel(workload_sizes[..., index]), numpy.ravel(cpu_shares[..., index]), grid=False), runtimes.shape[:-1])
+        return runtimes
+
+    def get_run_results(self, resource_configuration: Dict[str, int], configuration_window: ConfigurationWindow,
+                        forecast_step: int) -> List[RunResult]:
         results: List[RunResult] = []
 
         for workload in self.workloads:
-            workload_model: interpolate.RectBivariateSpline = self.workload_models[
+            workload_model: WorkloadModel = self.workload_models[
                 workload.task.task_name]
             workload_size: int = self.predictions[workload.task.task_name][
                 configuration_window.simulation_time_step][configuration_window.starting_prediction + forecast_step]
@@ -73,16 +183,20 @@ class ResourceConfigurer:
             results.append(RunResult(workload=workload, runtime=duration,
                            workload_size=workload_size, cpu_shares=cpu_shares))
             # print(f"{duration}, {workload.task.task_name}, {workload_size}")
-        return max(results, key=lambda result: result.runtime)
+        return results
+
+    def get_slowest_job(self, resource_configuration: Dict[str, int], configuration_window: ConfigurationWindow, forecast_step: int) -> RunResult:
+        return max(self.get_run_results(resource_configuration, configuration_window, forecast_step),
+                   key=lambda result: result.runtime)
 
     def find_largest_improvement(self, slowest_jobs: List[RunResult]) -> str:
         improvements: Dict[str, float] = {}
 
         for count, job in enumerate(slowest_jobs):
-            workload_model: interpolate.RectBivariateSpline = self.workload_models[
+            workload_model: WorkloadModel = self.workload_models[
                 job.workload.task.task_name]
-            new_runtime: int = workload_model(
-                job.workload_size, job.cpu_shares + GANG_SCHEDULING_SHARE_INCREMENT)
+            new_runtime: float = float(workload_model(
+                job.workload_size, job.cpu_shares + GANG_SCHEDULING_SHARE_INCREMENT)[0][0])
             # if job.runtime < new_runtime:
             # print(f"{job} has decreased runtime with increased CPU Shares")
             improvement: float = pow(self.delta, count) * \
@@ -112,7 +226,7 @@ class ResourceConfigurer:
             workload.task.task_name: GANG_SCHEDULING_STARTING_SHARES for workload in self.workloads}
 
         for _ in range(GANG_SCHEDULING_STARTING_SHARES * len(self.workloads),
-                       GANG_SCHEDULING_TOTAL_SHARES, GANG_SCHEDULING_SHARE_INCREMENT):
+                       self.total_shares, GANG_SCHEDULING_SHARE_INCREMENT):
             self.increment_configuration(
                 resource_configuration=resource_configuration, configuration_window=configuration_window)
         return resource_configuration
@@ -123,13 +237,13 @@ class ResourceConfigurer:
             [SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD]))
         job_runtimes: List[RunResult] = []
         for workload in self.workloads:
-            workload_model: interpolate.RectBivariateSpline = self.workload_models[
+            workload_model: WorkloadModel = self.workload_models[
                 workload.task.task_name]
             cpu_shares: int = resource_configuration[workload.task.task_name]
             if cpu_shares < GANG_SCHEDULING_MAX_SHARES:
                 job_runtimes.append(RunResult(
-                    workload=workload, runtime=workload_model(
-                        workload_size, cpu_shares),
+                    workload=workload, runtime=float(workload_model(
+                        workload_size, cpu_shares)[0][0]),
                     workload_size=workload_size, cpu_shares=cpu_shares))
         slowest_result: RunResult = max(
             job_runtimes, key=attrgetter("runtime"))
@@ -139,7 +253,7 @@ class ResourceConfigurer:
         resource_configuration: Dict[str, int] = {
             workload.task.task_name: GANG_SCHEDULING_STARTING_SHARES for workload in self.workloads}
         for _ in range(GANG_SCHEDULING_STARTING_SHARES * len(self.workloads),
-                       GANG_SCHEDULING_TOTAL_SHARES, GANG_SCHEDULING_SHARE_INCREMENT):
+                       self.total_shares, GANG_SCHEDULING_SHARE_INCREMENT):
             self.increment_static_configuration(
                 resource_configuration=resource_configuration)
         return resource_configuration
@@ -0,0 +1,97 @@
+import csv
+import os
+import statistics
+from dataclasses import dataclass, astuple, fields
+from typing import Dict, List
+
+from simulation.gang_scheduling.resource_configurer import ResourceConfigurer
+from simulation.shared.telemetry import SuperstepRecord
+
+
+@dataclass(frozen=True)
+class TaskSuperstep:
+    """How one task spent a superstep of the simulation, from the record its job published
+
+    Times are in seconds.
+    """
+    time_step: int
+    job_name: str
+    cpu_shares: int
+    workload_size: int
+    compute_time: float
+    # Time spent waiting at the barrier for the slowest task
+    wait_time: float
+    throttled_time: float
+    nr_throttled: int
+    nr_periods: int
+    # Runtime the workload model predicted for the workload size and CPU shares
+    predicted_time: float
+    # Time the simulator measured for the whole superstep
+    barrier_time: float
+
+
+def create_task_supersteps(time_step: int, records: Dict[str, SuperstepRecord], configuration: Dict[str, int],
+                           barrier_time: float, resource_configurer: ResourceConfigurer) -> List[TaskSuperstep]:
+    """Combine the records of every task in a superstep with the configuration they ran under
+
+    Args:
+        time_step (int): The superstep
+        records (Dict[str, SuperstepRecord]): The record of every task that published one
+        configuration (Dict[str, int]): The CPU shares of every task
+        barrier_time (float): The time the simulator measured for the superstep
+        resource_configurer (ResourceConfigurer): Holds the workload models the configuration was planned with
+
+    Returns:
+        List[TaskSuperstep]: The superstep of every task with a record
+    """
+    if len(records) == 0:
+        return []
+    slowest_compute_time: float = max(
+        record.compute_time for record in records.values())
+    return [TaskSuperstep(time_step=time_step, job_name=job_name, cpu_shares=configuration[job_name],
+                          workload_size=record.workload_size, compute_time=record.compute_time,
+                          wait_time=slowest_compute_time - record.compute_time,
+                          throttled_time=record.throttled_time, nr_throttled=record.nr_throttled,
+                          nr_periods=record.nr_periods,
+                          predicted_time=float(resource_configurer.workload_models[job_name](
+                              record.workload_size, configuration[job_name])[0][0]),
+                          barrier_time=barrier_time)
+            for job_name, record in records.items()]
+
+
+def save_task_supersteps(file_path: str, task_supersteps: List[TaskSuperstep]) -> None:
+    """Append task supersteps to a CSV, like the reconfiguration events
+    """
+    write_header: bool = not os.path.exists(file_path)
+    with open(file_path, "a", newline="") as csv_file:
+        csv_writer = csv.writer(csv_file)
+        if write_header:
+            csv_writer.writerow([field.name for field in fields(TaskSuperstep)])
+        for task_superstep in task_supersteps:
+            csv_writer.writerow(astuple(task_superstep))
+
+
+def print_telemetry_summary(task_supersteps: List[TaskSuperstep]) -> None:
+    """Print the compute, wait and throttled time of every task, how often it was the straggler and how far
+    its compute time was from the workload model's prediction
+    """
+    if len(task_supersteps) == 0:
+        return
+    print(f"{'job':>10}{'compute':>10}{'wait':>10}{'throttled':>11}{'straggler':>11}{'model error':>13}")
+    job_name: str
+    for job_name in dict.fromkeys(task_superstep.job_name for task_superstep in task_supersteps):
+        job_supersteps: List[TaskSuperstep] = [
+            task_superstep for task_superstep in task_supersteps if task_superstep.job_name == job_name]
+        print(f"{job_name:>10}"
+              f"{statistics.mean(step.compute_time for step in job_supersteps):>10.3f}"
+              f"{statistics.mean(step.wait_time for step in job_supersteps):>10.3f}"
+              f"{statistics.mean(step.throttled_time for step in job_supersteps):>11.3f}"
+              f"{sum(step.wait_time == 0 for step in job_supersteps):>11}"
+              f"{statistics.mean(step.compute_time - step.predicted_time for step in job_supersteps):>13.3f}")
+    slowest_supersteps: Dict[int, TaskSuperstep] = {}
+    for task_superstep in task_supersteps:
+        if task_superstep.wait_time == 0:
+            slowest_supersteps[task_superstep.time_step] = task_superstep
+    barrier_overheads: List[float] = [task_superstep.barrier_time - task_superstep.compute_time
+                                      for task_superstep in slowest_supersteps.values()]
+    print(f"Mean barrier overhead per superstep {statistics.mean(barrier_overheads):.3f} seconds")
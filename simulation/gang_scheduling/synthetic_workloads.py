@@ -0,0 +1,148 @@
+import time
+import numpy
+import pandas
+from dataclasses import dataclass
+from numpy.lib.stride_tricks import sliding_window_view
+
+from typing import Dict, List, Optional, Sequence
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+
+from simulation.gang_scheduling.resource_configurer import ConfigurationWindow, ResourceConfigurer, load_profiling_df
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict
+from simulation.shared.workloads import WORKLOADS, Task, Workload
+from simulation.config.config import GANG_SCHEDULING_TOTAL_SHARES, SIMULATION_MAX_WORKLOAD, SIMULATION_MIN_WORKLOAD
+
+
+@dataclass(frozen=True)
+class SyntheticWorkloads:
+    """Workloads cloned from profiled ones, with their own profiles and series
+
+    The Series of a clone names the file of the workload it was cloned from, its perturbed workload sizes
+    are only kept here.
+    """
+    workloads: List[Workload]
+    actual: Dict[str, numpy.ndarray]
+    predictions: Dict[str, numpy.ndarray]
+    profiling_df: pandas.DataFrame
+
+    def create_resource_configurer(self, predictions: Optional[Dict[str, numpy.ndarray]] = None) -> ResourceConfigurer:
+        """Create a resource configurer of the clones, with as many CPU shares per workload as the profiled gang has
+        """
+        return ResourceConfigurer(workloads=self.workloads,
+                                  predictions=predictions if predictions is not None else self.predictions,
+                                  profiling_df=self.profiling_df,
+                                  total_shares=GANG_SCHEDULING_TOTAL_SHARES * len(self.workloads) // len(WORKLOADS))
+
+
+def perturb_durations(durations: numpy.ndarray, cpu_shares: numpy.ndarray, rng: numpy.random.Generator) -> numpy.ndarray:
+    """Make a workload run slower or faster by a random factor that also changes with the CPU shares, as if
+    it ran on another cluster
+    """
+    return durations * (rng.uniform(0.6, 1.6) * (cpu_shares / 4000) ** rng.uniform(-0.3, 0.3))
+
+
+def perturb_series(actual: numpy.ndarray, predictions: numpy.ndarray, rng: numpy.random.Generator,
+                   noise_scale: float) -> Dict[str, numpy.ndarray]:
+    """Shift the workload sizes of a workload by a random number of time steps and add noise to them
+
+    Every row of the actual and predicted workload sizes is a window of the series, so the noise is added
+    to the series and windowed like it. The predictions get the same noise as the actual workload sizes,
+    which keeps their errors.
+
+    Args:
+        actual (numpy.ndarray): The actual workload sizes, a window of the series at every time step
+        predictions (numpy.ndarray): The predicted workload sizes, of the same shape
+        rng (numpy.random.Generator): The random number generator
+        noise_scale (float): The standard deviation of the noise, relative to the simulated workload range
+
+    Returns:
+        Dict[str, numpy.ndarray]: The perturbed "actual" and "predictions"
+    """
+    offset: int = int(rng.integers(len(actual)))
+    noise_series: numpy.ndarray = rng.normal(0, noise_scale * (SIMULATION_MAX_WORKLOAD - SIMULATION_MIN_WORKLOAD),
+                                             len(actual) + actual.shape[1] - 1)
+    noise: numpy.ndarray = sliding_window_view(noise_series, actual.shape[1])
+
+    def perturb(values: numpy.ndarray) -> numpy.ndarray:
+        return numpy.clip(numpy.roll(values, offset, axis=0) + noise, SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD)
+
+    return {"actual": perturb(actual), "predictions": perturb(predictions)}
+
+
+def generate_synthetic_workloads(num_workloads: int, base_workloads: Sequence[Workload] = WORKLOADS, seed: int = 0,
+                                 noise_scale: float = 0.05,
+                                 profiling_df: Optional[pandas.DataFrame] = None) -> SyntheticWorkloads:
+    """Clone profiled workloads round robin until there are num_workloads, perturbing the profile and series of every clone
+
+    Clone i of a workload is named after its task, e.g. affinity-i. It runs the same task, and its profile
+    and series are perturbed with perturb_durations and perturb_series.
+
+    Args:
+        num_workloads (int): Number of workloads to generate
+        base_workloads (Sequence[Workload], optional): The workloads to clone. Defaults to WORKLOADS.
+        seed (int, optional): Seed of the perturbations. Defaults to 0.
+        noise_scale (float, optional): The noise of the series, see perturb_series. Defaults to 0.05.
+        profiling_df (Optional[pandas.DataFrame], optional): The profile of the base workloads. Defaults to the profiler output.
+
+    Returns:
+        SyntheticWorkloads: The clones
+    """
+    rng: numpy.random.Generator = numpy.random.default_rng(seed)
+    profiling_df = profiling_df if profiling_df is not None else load_profiling_df()
+    task_column, _, shares_column, duration_column = profiling_df.columns[:4]
+    task_profiles: Dict[str, pandas.DataFrame] = dict(
+        list(profiling_df.groupby(task_column, sort=False)))
+    base_actual: Dict[str, numpy.ndarray] = get_actual_dict(base_workloads)
+    base_predictions: Dict[str, numpy.ndarray] = get_predictions_dict(
+        base_workloads)
+    workloads: List[Workload] = []
+    actual: Dict[str, numpy.ndarray] = {}
+    predictions: Dict[str, numpy.ndarray] = {}
+    profiles: List[pandas.DataFrame] = []
+    index: int
+    for index in range(num_workloads):
+        base_workload: Workload = base_workloads[index % len(base_workloads)]
+        base_name: str = base_workload.task.task_name
+        task_name: str = f"{base_name}-{index // len(base_workloads)}"
+        workloads.append(Workload(time_series=base_workload.time_series,
+                                  task=Task(task_name=task_name, workload_param=base_workload.task.workload_param,
+                                            workload_modifier=base_workload.task.workload_modifier)))
+        profile: pandas.DataFrame = task_profiles[base_name].copy()
+        profile[task_column] = task_name
+        profile[duration_column] = perturb_durations(
+            profile[duration_column].values, profile[shares_column].values, rng)
+        profiles.append(profile)
+        series: Dict[str, numpy.ndarray] = perturb_series(
+            base_actual[base_name], base_predictions[base_name], rng, noise_scale)
+        actual[task_name] = series["actual"]
+        predictions[task_name] = series["predictions"]
+    return SyntheticWorkloads(workloads=workloads, actual=actual, predictions=predictions,
+                              profiling_df=pandas.concat(profiles, ignore_index=True))
+
+
+def main():
+    num_workloads: int
+    for num_workloads in [8, 32, 128, 512]:
+        start: float = time.perf_counter()
+        synthetic_workloads: SyntheticWorkloads = generate_synthetic_workloads(
+            num_workloads)
+        resource_configurer: ResourceConfigurer = synthetic_workloads.create_resource_configurer()
+        setup_time: float = time.perf_counter() - start
+        start = time.perf_counter()
+        resource_configurer.calculate_static_configuration()
+        static_time: float = time.perf_counter() - start
+        start = time.perf_counter()
+        resource_configurer.calculate_resource_configurations(
+            ConfigurationWindow(simulation_time_step=0, window_size=1))
+        dynamic_time: float = time.perf_counter() - start
+        print(f"{num_workloads} workloads: generated in {setup_time:.2f} seconds, static configuration in "
+              f"{static_time:.2f} seconds, configuration of a one time step window in {dynamic_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
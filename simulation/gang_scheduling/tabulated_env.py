@@ -0,0 +1,209 @@
+import os
+import numpy
+from dataclasses import dataclass
+
+from typing import Any, Callable, Dict, List, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+
+from simulation.gang_scheduling.numpy_policy import NumpyMlpPolicy
+from simulation.gang_scheduling.reinforcement import DQN_PATH, SimulatorEnv
+from simulation.gang_scheduling.resource_configurer import ResourceConfigurer
+from simulation.forecaster.forecast_data import get_actual_dict
+from simulation.shared.workloads import WORKLOADS
+
+
+# Maps an observation to an action
+Policy = Callable[[numpy.ndarray], int]
+
+
+@dataclass(frozen=True)
+class EpisodeEvaluation:
+    total_reward: float
+    # Sum of the runtimes of every time step, without the checkpoint penalties
+    total_runtime: float
+    num_checkpoints: int
+
+
+class TabulatedSimulatorEnv(SimulatorEnv):
+    """SimulatorEnv whose steps are table lookups
+
+    The configuration of an episode is either the starting configuration or the configuration one of the
+    actions other than 0 planned at an earlier time step, so a state is a time step and the origin of its
+    configuration. The runtimes of every configuration at every time step and the observation rows of
+    keeping it are precomputed, on top of the precomputed rows of the other actions. Since the dynamics are
+    deterministic, a policy is evaluated exactly by one episode and the optimal policy is found by backward
+    induction over the tables.
+
+    Takes the same arguments as SimulatorEnv, with precompute_observations always on.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs["precompute_observations"] = True
+        super().__init__(*args, **kwargs)
+        if self.action_observations is None or self.action_configurations is None:
+            raise ValueError("The observations of the actions were not precomputed")
+        # the precomputed rows of the actions other than 0, which are always set here
+        self.precomputed_observations: numpy.ndarray = self.action_observations
+        num_time_steps: int = self.simulation_length + 1
+        # configuration 0 is the starting configuration, configuration 1 + index * (num_actions - 1) + action - 1
+        # is the one planned by action at time step default_time_step + index
+        self.configuration_shares: numpy.ndarray = numpy.vstack([
+            numpy.full((1, len(self.workloads)), self.min_shares),
+            self.action_configurations.reshape(-1, len(self.workloads))])
+        self.runtimes: numpy.ndarray = numpy.full(
+            (len(self.configuration_shares), num_time_steps), numpy.nan)
+        self.current_observations: numpy.ndarray = numpy.full(
+            (len(self.configuration_shares), num_time_steps, self.window_size), numpy.nan)
+        configuration: int
+        for configuration in range(len(self.configuration_shares)):
+            self.tabulate_configuration(configuration)
+        self.configuration: int = 0
+
+    def get_configuration(self, index: int, action: int) -> int:
+        """Get the configuration that an action other than 0 plans at a time step, by the index of the time step
+        """
+        return 1 + index * (self.num_actions - 1) + action - 1
+
+    def tabulate_configuration(self, configuration: int) -> None:
+        """Predict the runtimes of a configuration and the observation rows of keeping it, from the time step it is planned at
+        """
+        start: int = 0 if configuration == 0 else (
+            configuration - 1) // (self.num_actions - 1)
+        time_steps: numpy.ndarray = numpy.arange(
+            self.default_time_step + start, self.default_time_step + self.simulation_length + 1)
+        cpu_shares: numpy.ndarray = self.configuration_shares[configuration]
+        resource_configurer: ResourceConfigurer = self.resource_configurer.for_workloads(
+            self.workloads)
+        predicted_sizes: numpy.ndarray = numpy.stack([resource_configurer.predictions[workload.task.task_name][time_steps, :self.window_size]
+                                                      for workload in self.workloads], axis=-1)
+        self.current_observations[configuration, start:] = (numpy.max(resource_configurer.calculate_runtimes(
+            predicted_sizes, numpy.broadcast_to(cpu_shares, predicted_sizes.shape)), axis=-1) -
+            self.duration_low) * 1.0 / (self.duration_high - self.duration_low)
+        simulation_resource_configurer: ResourceConfigurer = self.simulation_resource_configurer.for_workloads(
+            self.workloads)
+        actual_sizes: numpy.ndarray = numpy.column_stack([simulation_resource_configurer.predictions[workload.task.task_name][time_steps, 0]
+                                                          for workload in self.workloads])
+        self.runtimes[configuration, start:] = numpy.max(simulation_resource_configurer.calculate_runtimes(
+            actual_sizes, numpy.broadcast_to(cpu_shares, actual_sizes.shape)), axis=-1)
+
+    def get_reward(self, runtimes: numpy.ndarray, checkpoint: Any) -> numpy.ndarray:
+        reward = self.default_reward - self.checkpoint_penalty * checkpoint - runtimes
+        return (reward + self.duration_high) / (self.duration_high - self.duration_low)
+
+    def get_tabulated_state(self) -> numpy.ndarray:
+        index: int = self.time_step - self.default_time_step
+        return numpy.vstack([self.current_observations[self.configuration, index], self.precomputed_observations[index]])
+
+    def step(self, action) -> Tuple[numpy.ndarray, float, bool, Dict[Any, Any]]:
+        index: int = self.time_step - self.default_time_step
+        if action != 0:
+            self.configuration = self.get_configuration(index, action)
+            self.current_config = {workload.task.task_name: int(cpu_shares) for workload, cpu_shares in
+                                   zip(self.workloads, self.configuration_shares[self.configuration])}
+        reward: float = float(self.get_reward(
+            self.runtimes[self.configuration, index], action != 0))
+        self.time_step += 1
+        self.state = self.get_tabulated_state()
+        done = self.time_step == self.simulation_length + self.default_time_step
+        return self.state, reward, done, {}
+
+    def reset(self):
+        super().reset()
+        self.configuration = 0
+        return self.state
+
+    def evaluate_policy(self, policy: Policy) -> EpisodeEvaluation:
+        """Run one episode with a deterministic policy, which is its exact return
+        """
+        observation: numpy.ndarray = self.reset()
+        total_reward: float = 0
+        total_runtime: float = 0
+        num_checkpoints: int = 0
+        done: bool = False
+        while not done:
+            action: int = int(policy(observation))
+            num_checkpoints += int(action != 0)
+            observation, reward, done, _ = self.step(action)
+            total_reward += reward
+            total_runtime += self.runtimes[self.configuration,
+                                           self.time_step - self.default_time_step - 1]
+        return EpisodeEvaluation(total_reward=total_reward, total_runtime=total_runtime, num_checkpoints=num_checkpoints)
+
+    def value_iteration(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Find the optimal values and actions of every state by backward induction over the time steps
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The values, of shape (simulation_length + 1, configurations) with
+                the values after the last time step 0, and the optimal actions, of shape (simulation_length, configurations)
+        """
+        values: numpy.ndarray = numpy.zeros(
+            (self.simulation_length + 1, len(self.configuration_shares)))
+        actions: numpy.ndarray = numpy.zeros(
+            (self.simulation_length, len(self.configuration_shares)), dtype="int64")
+        index: int
+        for index in reversed(range(self.simulation_length)):
+            action_values: numpy.ndarray = numpy.empty(
+                (self.num_actions, len(self.configuration_shares)))
+            # unreachable configurations, planned after this time step, have no runtime yet
+            action_values[0] = numpy.nan_to_num(self.get_reward(
+                self.runtimes[:, index], False), nan=-numpy.inf) + values[index + 1]
+            action: int
+            for action in range(1, self.num_actions):
+                configuration: int = self.get_configuration(index, action)
+                action_values[action] = self.get_reward(
+                    self.runtimes[configuration, index], True) + values[index + 1, configuration]
+            actions[index] = numpy.argmax(action_values, axis=0)
+            values[index] = numpy.max(action_values, axis=0)
+        return values, actions
+
+    def get_optimal_policy(self) -> Policy:
+        """Get the optimal policy, which acts on the state of the env rather than on the observation
+        """
+        _, actions = self.value_iteration()
+        return lambda _: int(actions[self.time_step - self.default_time_step, self.configuration])
+
+
+def main():
+    actual: Dict[str, numpy.ndarray] = get_actual_dict(WORKLOADS)
+    resource_configurer: ResourceConfigurer = ResourceConfigurer(
+        workloads=WORKLOADS,
+        predictions=actual
+    )
+    # the parameters the model in rl_simulator.py is run with
+    env = TabulatedSimulatorEnv(
+        resource_configurer=resource_configurer,
+        window_size=5,
+        default_reward=100,
+        default_time_step=0,
+        workloads=WORKLOADS,
+        actual_workload_sizes=actual,
+        num_actions=3,
+        duration_low=75,
+        duration_high=150
+    )
+    policies: Dict[str, Policy] = {
+        "optimal": env.get_optimal_policy(),
+        "never reconfigure after the first time step": lambda _: int(env.time_step == env.default_time_step),
+    }
+    action: int
+    for action in range(1, env.num_actions):
+        policies[f"reconfigure every {action} time steps"] = lambda _, action=action: \
+            action if (env.time_step - env.default_time_step) % action == 0 else 0
+    if os.path.exists(f"{DQN_PATH}.zip"):
+        model: NumpyMlpPolicy = NumpyMlpPolicy.from_stable_baselines(DQN_PATH)
+        policies["DQN"] = lambda observation: model.predict(observation)[0]
+    name: str
+    policy: Policy
+    for name, policy in policies.items():
+        evaluation: EpisodeEvaluation = env.evaluate_policy(policy)
+        print(f"{name}: reward {evaluation.total_reward:.2f}, runtime {evaluation.total_runtime:.2f} seconds, "
+              f"{evaluation.num_checkpoints} checkpoints")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import math
+import numpy
+from scipy import interpolate
+from typing import Union
+
+from simulation.config.config import (GANG_SCHEDULING_MAX_SHARES, GANG_SCHEDULING_SHARE_INCREMENT, GANG_SCHEDULING_STARTING_SHARES,
+                                      PROFILER_MAX_SHARES, PROFILER_MIN_SHARES, SIMULATION_MAX_WORKLOAD, SIMULATION_MIN_WORKLOAD)
+
+
+class ScatteredWorkloadModel:
+    """Runtime model of a workload fitted on profiled points that do not need to form a full grid
+
+    The points are interpolated with a thin-plate spline over the workload size and CPU shares, both
+    normalized to the profiled ranges. The model is called like a RectBivariateSpline.
+
+    Args:
+        workload_sizes (numpy.ndarray): The workload size of every profiled point
+        cpu_shares (numpy.ndarray): The CPU shares of every profiled point
+        durations (numpy.ndarray): The measured duration of every profiled point
+        smoothing (float, optional): Smoothing of the spline, 0 interpolates the points exactly. Defaults to 0.
+    """
+
+    def __init__(self, workload_sizes: numpy.ndarray, cpu_shares: numpy.ndarray, durations: numpy.ndarray,
+                 smoothing: float = 0):
+        self.points: numpy.ndarray = self.normalize(
+            numpy.asarray(workload_sizes, dtype="float64"), numpy.asarray(cpu_shares, dtype="float64"))
+        self.durations: numpy.ndarray = numpy.asarray(
+            durations, dtype="float64")
+        self.smoothing = smoothing
+        self.interpolator: interpolate.RBFInterpolator = interpolate.RBFInterpolator(
+            self.points, self.durations, kernel="thin_plate_spline", smoothing=smoothing)
+
+    @staticmethod
+    def normalize(workload_sizes: numpy.ndarray, cpu_shares: numpy.ndarray) -> numpy.ndarray:
+        return numpy.column_stack([
+            (workload_sizes - SIMULATION_MIN_WORKLOAD) /
+            (SIMULATION_MAX_WORKLOAD - SIMULATION_MIN_WORKLOAD),
+            (cpu_shares - PROFILER_MIN_SHARES) / (PROFILER_MAX_SHARES - PROFILER_MIN_SHARES)])
+
+    def __call__(self, workload_sizes, cpu_shares, grid=True) -> numpy.ndarray:
+        """Evaluate the model
+
+        Args:
+            workload_sizes: The workload sizes to evaluate at
+            cpu_shares: The CPU shares to evaluate at
+            grid (optional): Evaluate on the grid of both inputs rather than pairwise, like RectBivariateSpline.
+                Defaults to True.
+
+        Returns:
+            numpy.ndarray: The durations, of shape (len(workload_sizes), len(cpu_shares)) on a grid
+        """
+        x: numpy.ndarray = numpy.atleast_1d(
+            numpy.asarray(workload_sizes, dtype="float64"))
+        y: numpy.ndarray = numpy.atleast_1d(
+            numpy.asarray(cpu_shares, dtype="float64"))
+        if grid:
+            grid_x, grid_y = numpy.meshgrid(x, y, indexing="ij")
+            return self.interpolator(self.normalize(grid_x.ravel(), grid_y.ravel())).reshape(len(x), len(y))
+        return self.interpolator(self.normalize(x, y))
+
+    def get_leave_one_out_errors(self) -> numpy.ndarray:
+        """Get the error at every profiled point of the model fitted on all the other points
+        """
+        errors: numpy.ndarray = numpy.zeros(len(self.durations))
+        keep: numpy.ndarray = numpy.ones(len(self.durations), dtype=bool)
+        i: int
+        for i in range(len(self.durations)):
+            keep[i] = False
+            interpolator: interpolate.RBFInterpolator = interpolate.RBFInterpolator(
+                self.points[keep], self.durations[keep], kernel="thin_plate_spline", smoothing=self.smoothing)
+            errors[i] = interpolator(self.points[i:i + 1])[0] - self.durations[i]
+            keep[i] = True
+        return errors
+
+
+ProfiledWorkloadModel = Union[interpolate.RectBivariateSpline, ScatteredWorkloadModel]
+
+
+class RefinedWorkloadModel:
+    """Runtime model of a workload that corrects a profiled model with the runtimes observed while the workload runs
+
+    Every observation is kept as the log ratio of the observed runtime to the profiled model, in the bin of
+    its workload size and CPU shares on the grid the gang scheduler allocates on. The correction is the
+    Gaussian kernel smoothed mean of those ratios, shrunk towards no correction where there are few
+    observations nearby, and the model is the profiled model times its exponential. Older observations are
+    decayed, so the correction follows a workload that keeps changing. The model is called like a
+    RectBivariateSpline.
+
+    A two-sided CUSUM of the log ratios detects when the workload has drifted away from its profile, at
+    which point it should be profiled again.
+
+    Args:
+        profiled_model (ProfiledWorkloadModel): The model fitted on the profile
+        decay (float, optional): Weight an observation keeps after every newer observation. Defaults to 0.98.
+        size_bandwidth (float, optional): Bandwidth of the kernel over the workload size. Defaults to 10.
+        shares_bandwidth (float, optional): Bandwidth of the kernel over the CPU shares. Defaults to 2000.
+        prior_weight (float, optional): Weight of no correction, in observations. Defaults to 1.
+        drift_tolerance (float, optional): Log ratio the CUSUM tolerates every observation. Defaults to 0.05.
+        drift_threshold (float, optional): Accumulated log ratio at which drift is detected. Defaults to 1.
+    """
+
+    def __init__(self, profiled_model: ProfiledWorkloadModel, decay: float = 0.98, size_bandwidth: float = 10,
+                 shares_bandwidth: float = 2000, prior_weight: float = 1, drift_tolerance: float = 0.05,
+                 drift_threshold: float = 1):
+        self.profiled_model = profiled_model
+        self.decay = decay
+        self.prior_weight = prior_weight
+        self.drift_tolerance = drift_tolerance
+        self.drift_threshold = drift_threshold
+        self.workload_sizes: numpy.ndarray = numpy.arange(
+            SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD + 1, dtype="float64")
+        self.cpu_shares: numpy.ndarray = numpy.arange(min(PROFILER_MIN_SHARES, GANG_SCHEDULING_STARTING_SHARES),
+                                                      max(PROFILER_MAX_SHARES, GANG_SCHEDULING_MAX_SHARES) +
+                                                      GANG_SCHEDULING_SHARE_INCREMENT,
+                                                      GANG_SCHEDULING_SHARE_INCREMENT, dtype="float64")
+        self.size_kernel: numpy.ndarray = self.create_kernel(
+            self.workload_sizes, size_bandwidth)
+        self.shares_kernel: numpy.ndarray = self.create_kernel(
+            self.cpu_shares, shares_bandwidth)
+        self.ratio_sums: numpy.ndarray = numpy.zeros(
+            (len(self.workload_sizes), len(self.cpu_shares)))
+        self.weights: numpy.ndarray = numpy.zeros(
+            (len(self.workload_sizes), len(self.cpu_shares)))
+        self.correction: numpy.ndarray = numpy.zeros(
+            (len(self.workload_sizes), len(self.cpu_shares)))
+        self.num_observations: int = 0
+        self.upper_drift: float = 0.0
+        self.lower_drift: float = 0.0
+
+    @staticmethod
+    def create_kernel(values: numpy.ndarray, bandwidth: float) -> numpy.ndarray:
+        return numpy.exp(-0.5 * numpy.square((values[:, None] - values[None, :]) / bandwidth))
+
+    @staticmethod
+    def get_index(value: float, grid_values: numpy.ndarray) -> int:
+        """Get the index of the grid value nearest to a value
+        """
+        index: int = round((float(value) - grid_values[0]) /
+                           (grid_values[1] - grid_values[0]))
+        return min(max(index, 0), len(grid_values) - 1)
+
+    @staticmethod
+    def get_indices(values, grid_values: numpy.ndarray) -> numpy.ndarray:
+        indices: numpy.ndarray = numpy.rint((numpy.atleast_1d(numpy.asarray(values, dtype="float64")) - grid_values[0]) /
+                                            (grid_values[1] - grid_values[0])).astype(int)
+        return numpy.clip(indices, 0, len(grid_values) - 1)
+
+    @property
+    def drift_detected(self) -> bool:
+        return max(self.upper_drift, self.lower_drift) > self.drift_threshold
+
+    def __call__(self, workload_sizes, cpu_shares, grid=True) -> numpy.ndarray:
+        """Evaluate the profiled model times the correction, like the profiled model
+        """
+        runtimes: numpy.ndarray = self.profiled_model(
+            workload_sizes, cpu_shares, grid=grid)
+        if self.num_observations == 0:
+            return runtimes
+        if numpy.ndim(workload_sizes) == 0 and numpy.ndim(cpu_shares) == 0:
+            # the resource configurer evaluates one point at a time, so this is the common case
+            return runtimes * math.exp(self.correction[self.get_index(workload_sizes, self.workload_sizes),
+                                                       self.get_index(cpu_shares, self.cpu_shares)])
+        size_indices: numpy.ndarray = self.get_indices(
+            workload_sizes, self.workload_sizes)
+        shares_indices: numpy.ndarray = self.get_indices(
+            cpu_shares, self.cpu_shares)
+        correction: numpy.ndarray = self.correction[numpy.ix_(size_indices, shares_indices)] if grid \
+            else self.correction[size_indices, shares_indices]
+        return runtimes * numpy.exp(correction)
+
+    def observe(self, workload_size: float, cpu_shares: float, runtime: float) -> None:
+        """Fold the runtime observed at a workload size and CPU shares into the correction
+
+        Costs two small matrix products, so it can run between supersteps.
+        """
+        profiled_runtime: float = float(numpy.ravel(
+            self.profiled_model(workload_size, cpu_shares))[0])
+        if runtime <= 0 or profiled_runtime <= 0:
+            return
+        ratio: float = math.log(runtime / profiled_runtime)
+        self.upper_drift = max(
+            0.0, self.upper_drift + ratio - self.drift_tolerance)
+        self.lower_drift = max(
+            0.0, self.lower_drift - ratio - self.drift_tolerance)
+        size_index: int = self.get_index(workload_size, self.workload_sizes)
+        shares_index: int = self.get_index(cpu_shares, self.cpu_shares)
+        self.ratio_sums *= self.decay
+        self.weights *= self.decay
+        self.ratio_sums[size_index, shares_index] += ratio
+        self.weights[size_index, shares_index] += 1
+        self.num_observations += 1
+        self.correction = (self.size_kernel @ self.ratio_sums @ self.shares_kernel) / \
+            (self.prior_weight + self.size_kernel @ self.weights @ self.shares_kernel)
+
+    def reset_drift(self) -> None:
+        self.upper_drift = 0.0
+        self.lower_drift = 0.0
+
+
+WorkloadModel = Union[interpolate.RectBivariateSpline, ScatteredWorkloadModel, RefinedWorkloadModel]
+
+
+def create_workload_model(workload_sizes: numpy.ndarray, cpu_shares: numpy.ndarray, durations: numpy.ndarray) -> ProfiledWorkloadModel:
+    """Fit a runtime model to the profiled points of a workload
+
+    Points on a full grid of workload sizes and CPU shares are fitted with a RectBivariateSpline,
+    any other set of points with a ScatteredWorkloadModel.
+
+    Returns:
+        ProfiledWorkloadModel: The runtime model of the workload
+    """
+    unique_sizes: numpy.ndarray = numpy.unique(workload_sizes)
+    unique_shares: numpy.ndarray = numpy.unique(cpu_shares)
+    order: numpy.ndarray = numpy.lexsort((cpu_shares, workload_sizes))
+    num_points: int = len(set(zip(numpy.asarray(workload_sizes).tolist(),
+                                   numpy.asarray(cpu_shares).tolist())))
+    if num_points == len(durations) == len(unique_sizes) * len(unique_shares) \
+            and len(unique_sizes) > 3 and len(unique_shares) > 3:
+        return interpolate.RectBivariateSpline(unique_sizes, unique_shares,
+                                               numpy.asarray(durations, dtype="float64")[order].reshape(
+                                                   len(unique_sizes), len(unique_shares)))
+    return ScatteredWorkloadModel(workload_sizes, cpu_shares, durations)
@@ -0,0 +1,90 @@
+import json
+import subprocess
+import statistics
+from dataclasses import dataclass
+from typing import List
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+
+REPOSITORY_DIR: str = str(Path(__file__).parent.parent.absolute())
+# The modules of the fake simulation path
+BENCHMARKED_MODULES: List[str] = [
+    "simulation.simulator",
+    "simulation.gang_scheduling.mpc",
+    "simulation.forecaster.online_forecaster",
+]
+# The cluster clients and ML stacks, which the fake simulation path must not load
+HEAVY_MODULES: List[str] = ["kazoo", "kubernetes", "gym", "stable_baselines3", "torch",
+                            "tensorflow", "keras", "sklearn", "matplotlib"]
+# Imports a module and builds a fake simulator, then reports the import time and every loaded module
+IMPORT_CODE: str = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - start
+from simulation.simulator import StaticSimulator
+from simulation.gang_scheduling.resource_configurer import ResourceConfigurer
+from simulation.forecaster.forecast_data import get_actual_dict
+from simulation.shared.workloads import WORKLOADS
+from simulation.config.config import ZOOKEEPER_CLIENT_ENDPOINT, ZOOKEEPER_BARRIER_PATH
+actual = get_actual_dict(WORKLOADS)
+StaticSimulator(resource_configurer=ResourceConfigurer(workloads=WORKLOADS, predictions=actual), workloads=WORKLOADS,
+                actual=actual, zookeeper_client_endpoint=ZOOKEEPER_CLIENT_ENDPOINT,
+                zookeeper_barrier_path=ZOOKEEPER_BARRIER_PATH, real_simulation=False)
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+# Slowest cold import of a benchmarked module allowed, in seconds
+IMPORT_TIME_BUDGET: float = 2.0
+
+
+@dataclass(frozen=True)
+class ImportMeasurement:
+    module: str
+    # Median of the cold imports, each in a new interpreter
+    seconds: float
+    # The heavy modules that were loaded by importing the module and building a fake simulator
+    heavy_modules: List[str]
+
+
+def measure_import(module: str, repeats: int = 5) -> ImportMeasurement:
+    """Import a module in new interpreters, so that every import is cold
+
+    Args:
+        module (str): The module to import
+        repeats (int, optional): Number of interpreters to import it in. Defaults to 5.
+
+    Returns:
+        ImportMeasurement: The import time and the heavy modules that were loaded
+    """
+    seconds: List[float] = []
+    heavy_modules: List[str] = []
+    for _ in range(repeats):
+        output: str = subprocess.run([sys.executable, "-c", IMPORT_CODE, module], cwd=REPOSITORY_DIR, check=True,
+                                     capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        seconds.append(result["seconds"])
+        heavy_modules = sorted({loaded.split(".")[0] for loaded in result["modules"]} & set(HEAVY_MODULES))
+    return ImportMeasurement(module=module, seconds=statistics.median(seconds), heavy_modules=heavy_modules)
+
+
+def main():
+    measurements: List[ImportMeasurement] = [
+        measure_import(module) for module in BENCHMARKED_MODULES]
+    measurement: ImportMeasurement
+    for measurement in measurements:
+        print(f"{measurement.module}: {measurement.seconds * 1000:.0f} ms, "
+              f"heavy modules: {', '.join(measurement.heavy_modules) or 'none'}")
+    failures: List[str] = [f"{measurement.module} loads {', '.join(measurement.heavy_modules)}"
+                           for measurement in measurements if len(measurement.heavy_modules) > 0]
+    failures += [f"{measurement.module} takes {measurement.seconds:.2f} seconds to import, over {IMPORT_TIME_BUDGET}"
+                 for measurement in measurements if measurement.seconds > IMPORT_TIME_BUDGET]
+    if len(failures) > 0:
+        raise AssertionError("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,13 @@ import numpy as np
 import os
 
 NUM_ITERATIONS: int = int(os.getenv("NUM_ITERATIONS", 30))
+MATRIX_SIZE: int = int(os.getenv("MATRIX_SIZE", 500))
 
 
 def main():
     for i in range(NUM_ITERATIONS):
         print("Eigendecomposition", i)
-        print(np.linalg.eig(np.random.randint(10, size=(500, 500))))
+        print(np.linalg.eig(np.random.randint(10, size=(MATRIX_SIZE, MATRIX_SIZE))))
 
 
 if __name__ == '__main__':
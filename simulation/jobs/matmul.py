@@ -2,13 +2,14 @@ import numpy as np
 import os
 
 NUM_ITERATIONS: int = int(os.getenv("NUM_ITERATIONS", 30))
+MATRIX_SIZE: int = int(os.getenv("MATRIX_SIZE", 5000))
 
 
 def main():
     # Basic matrix multiplication workload
     for i in range(NUM_ITERATIONS):
         print("Multiplication ", i)
-        print(np.square(np.random.randint(10, size=(5000, 5000))))
+        print(np.square(np.random.randint(10, size=(MATRIX_SIZE, MATRIX_SIZE))))
 
 
 if __name__ == '__main__':
@@ -1,9 +1,14 @@
+import json
 import subprocess
 import os
+import time
+from typing import Dict
 from kazoo.client import KazooClient
 from kazoo.recipe.barrier import DoubleBarrier
 from kazoo.recipe.queue import LockingQueue
 from simulation.shared.env_vars import EnvVarName
+from simulation.shared.telemetry import (SuperstepRecord, create_superstep_record, parse_stress_ng_metrics, publish_record,
+                                         read_cpu_stat)
 
 NUM_TASKS: int = int(os.getenv(EnvVarName.NUM_TASKS.value, 1))
 JOB_NAME: str = os.getenv(EnvVarName.JOB_NAME.value, "TestJob")
@@ -13,11 +18,31 @@ NUM_INSTANCES: int = int(os.getenv(EnvVarName.NUM_INSTANCES.value, 0))
 ZOOKEEPER_CLIENT_ENDPOINT: str = os.getenv(
     EnvVarName.ZOOKEEPER_CLIENT_ENDPOINT.value, "zookeeper:2181")
 BARRIER_PATH: str = os.getenv(EnvVarName.BARRIER_PATH.value, "/barrier")
+WARM_POOL_PATH: str = os.getenv(EnvVarName.WARM_POOL_PATH.value, "")
+TELEMETRY_PATH: str = os.getenv(EnvVarName.TELEMETRY_PATH.value, "/telemetry")
 
 
 STRESS_NG_COMMAND: str = "stress-ng"
 
 
+def wait_for_assignment(zk: KazooClient) -> Dict[str, str]:
+    """Idle in the warm pool until the coordinator assigns this pod a task
+
+    Args:
+        zk (KazooClient): The ZooKeeper client
+
+    Returns:
+        Dict[str, str]: The environment variables of the assigned task
+    """
+    pool_queue: LockingQueue = LockingQueue(
+        zk, f"{WARM_POOL_PATH}/{JOB_NAME}")
+    print(f"{JOB_NAME} is warm")
+    assignment: Dict[str, str] = json.loads(
+        pool_queue.get().decode("utf-8"))
+    pool_queue.consume()
+    return assignment
+
+
 def main() -> None:
     """This job will run stress-ng benchmark and wait for commands
     from a Redis queue.
@@ -29,19 +54,49 @@ def main() -> None:
     if zk.connected:
         print(f"{JOB_NAME} has connected to Zookeeper")
 
-    zk_queue: LockingQueue = LockingQueue(zk, f"/{JOB_NAME}")
+    job_name: str = JOB_NAME
+    op_name: str = OP_NAME
+    workload_modifier: int = WORKLOAD_MODIFIER
+    num_tasks: int = NUM_TASKS
+    num_instances: int = NUM_INSTANCES
+    barrier_path: str = BARRIER_PATH
+    telemetry_path: str = TELEMETRY_PATH
+    if WARM_POOL_PATH:
+        assignment: Dict[str, str] = wait_for_assignment(zk)
+        job_name = assignment[EnvVarName.JOB_NAME.value]
+        op_name = assignment[EnvVarName.OP_NAME.value]
+        workload_modifier = int(
+            assignment[EnvVarName.WORKLOAD_MODIFIER.value])
+        num_tasks = int(assignment[EnvVarName.NUM_TASKS.value])
+        num_instances = int(assignment[EnvVarName.NUM_INSTANCES.value])
+        barrier_path = assignment.get(
+            EnvVarName.BARRIER_PATH.value, BARRIER_PATH)
+        telemetry_path = assignment.get(
+            EnvVarName.TELEMETRY_PATH.value, TELEMETRY_PATH)
+
+    zk_queue: LockingQueue = LockingQueue(zk, f"/{job_name}")
     zk_barrier: DoubleBarrier = DoubleBarrier(
-        zk, BARRIER_PATH, NUM_TASKS + 1)
+        zk, barrier_path, num_tasks + 1)
 
+    superstep: int = 0
     while True:
         print("Job is ready")
         workload: int = int.from_bytes(zk_queue.get(), byteorder="little")
         zk_queue.consume()
         zk_barrier.enter()
         print(f"Starting with workload: {workload}")
-        subprocess.check_output(
-            [STRESS_NG_COMMAND, "--metrics", f"--{JOB_NAME}", str(NUM_INSTANCES), OP_NAME, str(WORKLOAD_MODIFIER * workload)])
+        start_stat: Dict[str, int] = read_cpu_stat()
+        start: float = time.perf_counter()
+        output: bytes = subprocess.check_output(
+            [STRESS_NG_COMMAND, "--metrics", f"--{job_name}", str(num_instances), op_name, str(workload_modifier * workload)],
+            stderr=subprocess.STDOUT)
+        compute_time: float = time.perf_counter() - start
+        # the record is published before leaving, so the coordinator finds it once the barrier is left
+        record: SuperstepRecord = create_superstep_record(superstep, workload, compute_time, start_stat, read_cpu_stat(),
+                                                          parse_stress_ng_metrics(output.decode("utf-8", "replace"), job_name))
+        publish_record(zk, telemetry_path, job_name, record)
         zk_barrier.leave()
+        superstep += 1
 
 
 if __name__ == '__main__':
@@ -1,13 +1,13 @@
 from simulation.simulator import MPCSimulator
 from simulation.gang_scheduling.mpc import ReinforcementMPController
 from typing import Dict
-from stable_baselines3 import DQN
 from simulation.config.config import (GANG_SCHEDULING_SIMULATION_LENGTH,
                                       GANG_SCHEDULING_WINDOW_SIZE, ZOOKEEPER_BARRIER_PATH, ZOOKEEPER_CLIENT_ENDPOINT)
 from simulation.gang_scheduling.reinforcement import SimulatorEnv, A2C_PATH, DQN_PATH
+from simulation.gang_scheduling.numpy_policy import NumpyMlpPolicy
 from simulation.gang_scheduling.resource_configurer import ResourceConfigurer
 from simulation.shared.workloads import WORKLOADS
-from simulation.forecaster.lstm_forecaster import get_actual_dict, get_predictions_dict
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict
 
 
 def main() -> None:
@@ -28,7 +28,7 @@ def main() -> None:
         duration_high=150
     )
     env.reset()
-    model = DQN.load(DQN_PATH)
+    model: NumpyMlpPolicy = NumpyMlpPolicy.from_stable_baselines(DQN_PATH)
 
     reinforcement_mpc: ReinforcementMPController = ReinforcementMPController(
         model=model,
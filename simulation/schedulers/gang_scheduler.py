@@ -0,0 +1,183 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from simulation.schedulers.node_inventory import BEST_FIT, NodeInventory
+
+GANG_NAME_LABEL: str = "gang-name"
+GANG_SIZE_LABEL: str = "gang-size"
+GANG_TIMEOUT: float = 60
+
+
+def get_pod_gang(pod: Any) -> Optional[Tuple[str, int]]:
+    """Get the gang name and size from the labels of a pod, or None if the pod is not part of a gang
+    """
+    labels: Dict[str, str] = pod.metadata.labels or {}
+    if GANG_NAME_LABEL not in labels or GANG_SIZE_LABEL not in labels:
+        return None
+    return labels[GANG_NAME_LABEL], int(labels[GANG_SIZE_LABEL])
+
+
+@dataclass
+class PendingGang:
+    name: str
+    size: int
+    # When the first member of the gang arrived
+    arrival_time: float
+    # When the gang joined the back of the scheduling queue
+    queue_time: float
+    # When the gang started holding its current reservation
+    attempt_start: float
+    # The members that are not bound yet, with their CPU requests
+    members: Dict[str, int] = field(default_factory=dict)
+    reservations: Dict[str, str] = field(default_factory=dict)
+    # Members already bound by an attempt in which another member failed to bind
+    num_bound: int = 0
+
+    def is_complete(self) -> bool:
+        return len(self.members) + self.num_bound >= self.size
+
+
+class GangScheduler:
+    """Binds the members of a gang together once capacity for the whole gang is reserved
+
+    Pending members are collected until the whole gang has arrived, then capacity is reserved for all
+    of them in the inventory and they are bound together. Gangs that do not fit hold no capacity, except
+    the gang that has waited longest: it keeps a partial reservation that grows as capacity frees up, so
+    that large gangs are not starved by smaller ones. If that reservation is not completed within the
+    timeout, it is released so that other gangs can use the capacity. A member whose binding fails stays
+    queued with its gang, without capacity, and is bound when the gang is retried.
+
+    Args:
+        inventory (NodeInventory): The cluster inventory to reserve capacity in
+        bind (Callable[[str, str], bool]): Binds a pod key to a node, returning whether the binding succeeded
+        timeout (float, optional): Seconds a gang may hold a partial reservation. Defaults to GANG_TIMEOUT.
+        policy (str, optional): The node placement policy. Defaults to BEST_FIT.
+        clock (Callable[[], float], optional): The time source. Defaults to time.monotonic.
+    """
+
+    def __init__(self,
+                 inventory: NodeInventory,
+                 bind: Callable[[str, str], bool],
+                 timeout: float = GANG_TIMEOUT,
+                 policy: str = BEST_FIT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.inventory = inventory
+        self.bind = bind
+        self.timeout = timeout
+        self.policy = policy
+        self.clock = clock
+        self.gangs: Dict[str, PendingGang] = {}
+        # Pods of bound gangs, whose late or re-listed Pending events must not start a new gang
+        self.bound_keys: Set[str] = set()
+        self.time_to_full_gang: List[float] = []
+        self.num_timeouts: int = 0
+
+    def add_pod(self, key: str, gang_name: str, gang_size: int, cpu_request: int) -> bool:
+        """Add a pending pod to its gang and try to schedule the gang
+
+        Returns:
+            bool: True if the gang was bound
+        """
+        if key in self.bound_keys:
+            return True
+        if gang_name not in self.gangs:
+            now: float = self.clock()
+            self.gangs[gang_name] = PendingGang(
+                name=gang_name, size=gang_size, arrival_time=now, queue_time=now, attempt_start=now)
+        gang: PendingGang = self.gangs[gang_name]
+        gang.members[key] = cpu_request
+        self.retry_gangs()
+        return gang_name not in self.gangs
+
+    def remove_pod(self, key: str, gang_name: str) -> None:
+        self.bound_keys.discard(key)
+        if gang_name in self.gangs:
+            gang: PendingGang = self.gangs[gang_name]
+            gang.members.pop(key, None)
+            gang.reservations.pop(key, None)
+            self.inventory.release(key)
+            if len(gang.members) == 0:
+                del self.gangs[gang_name]
+
+    def sync_pods(self, keys: Set[str]) -> None:
+        """Forget the pods that are no longer listed, after events may have been missed
+
+        Args:
+            keys (Set[str]): The keys of every listed pod
+        """
+        self.bound_keys &= keys
+        gang: PendingGang
+        for gang in list(self.gangs.values()):
+            for key in [key for key in gang.members if key not in keys]:
+                self.remove_pod(key, gang.name)
+
+    def schedule_gang(self, gang: PendingGang, hold_reservation: bool) -> bool:
+        """Reserve capacity for every member of a complete gang and bind them together
+
+        Args:
+            gang (PendingGang): The gang to schedule
+            hold_reservation (bool): Whether to keep a partial reservation if the whole gang does not fit
+
+        Returns:
+            bool: True if the gang was bound
+        """
+        key: str
+        cpu_request: int
+        if not gang.is_complete():
+            return False
+        for key, cpu_request in gang.members.items():
+            if key not in gang.reservations:
+                node: Optional[str] = self.inventory.select_node(
+                    cpu_request, self.policy)
+                if node is None:
+                    if not hold_reservation:
+                        self.release_gang(gang)
+                    return False
+                if len(gang.reservations) == 0:
+                    gang.attempt_start = self.clock()
+                self.inventory.reserve(key, node, cpu_request)
+                gang.reservations[key] = node
+        if len(gang.reservations) + gang.num_bound < gang.size:
+            return False
+
+        for key, node in list(gang.reservations.items()):
+            self.inventory.release(key)
+            del gang.reservations[key]
+            # Capacity is only accounted for pods that reached their node
+            if self.bind(key, node):
+                self.inventory.add_pod(key, node, gang.members.pop(key))
+                self.bound_keys.add(key)
+                gang.num_bound += 1
+        if len(gang.members) > 0:
+            return False
+        self.time_to_full_gang.append(self.clock() - gang.arrival_time)
+        del self.gangs[gang.name]
+        return True
+
+    def release_gang(self, gang: PendingGang) -> None:
+        for key in gang.reservations:
+            self.inventory.release(key)
+        gang.reservations.clear()
+
+    def expire_gangs(self) -> None:
+        """Release the reservations of every gang that has held them for longer than the timeout
+        """
+        gang: PendingGang
+        for gang in self.gangs.values():
+            if len(gang.reservations) > 0 and self.clock() - gang.attempt_start > self.timeout:
+                self.release_gang(gang)
+                gang.queue_time = self.clock()
+                self.num_timeouts += 1
+
+    def retry_gangs(self) -> None:
+        """Try to schedule the pending gangs again in queue order, where gangs that timed out go to the back
+        """
+        gang: PendingGang
+        hold_reservation: bool = True
+        for gang in sorted(self.gangs.values(), key=lambda gang: gang.queue_time):
+            if not gang.is_complete():
+                continue
+            # Only the first complete gang that does not fit may hold on to capacity
+            if not self.schedule_gang(gang, hold_reservation):
+                hold_reservation = False
@@ -0,0 +1,216 @@
+import heapq
+import random
+import statistics
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.schedulers.node_inventory import BEST_FIT, NodeInventory
+from simulation.schedulers.gang_scheduler import GangScheduler
+
+
+ARRIVAL_EVENT: str = "arrival"
+FINISH_EVENT: str = "finish"
+TICK_EVENT: str = "tick"
+
+
+@dataclass(frozen=True)
+class GangSimulationResult:
+    gang_aware: bool
+    gangs_completed: int
+    num_gangs: int
+    mean_time_to_full_gang: float
+    max_time_to_full_gang: float
+    # Fraction of cluster CPU-time spent running fully placed gangs
+    utilization: float
+    # Fraction of cluster CPU-time held by members of gangs that could not run yet
+    held_idle_fraction: float
+    num_timeouts: int
+    makespan: float
+
+
+class GangSimulation:
+    """Discrete-event simulation of many concurrent gangs arriving at a cluster
+
+    Each gang runs only once all of its members are placed. With gang_aware=False every pod is bound
+    as soon as it fits, which is how the scheduler behaved before gang binding. With gang_aware=True
+    pods go through the GangScheduler, which binds whole gangs at once.
+
+    Args:
+        num_nodes (int): Number of nodes in the cluster
+        node_cpu (int): Allocatable millicores per node
+        num_gangs (int): Number of gangs to submit
+        gang_size (int): Members per gang (BSP tasks plus the coordinator)
+        cpu_requests (List[int]): The millicore requests members are drawn from
+        arrival_interval (float): Mean seconds between gang submissions
+        member_spread (float): Members of a gang arrive uniformly within this many seconds of submission
+        runtime (float): Seconds a gang runs once fully placed
+        timeout (float): Gang reservation timeout
+        gang_aware (bool): Whether to use gang binding
+        policy (str, optional): The node placement policy. Defaults to BEST_FIT.
+        seed (int, optional): Random seed. Defaults to 0.
+        max_time (float, optional): The simulation stops at this time. Defaults to 1e5.
+    """
+
+    def __init__(self,
+                 num_nodes: int,
+                 node_cpu: int,
+                 num_gangs: int,
+                 gang_size: int,
+                 cpu_requests: List[int],
+                 arrival_interval: float,
+                 member_spread: float,
+                 runtime: float,
+                 timeout: float,
+                 gang_aware: bool,
+                 policy: str = BEST_FIT,
+                 seed: int = 0,
+                 max_time: float = 1e5):
+        self.num_gangs = num_gangs
+        self.gang_size = gang_size
+        self.runtime = runtime
+        self.timeout = timeout
+        self.gang_aware = gang_aware
+        self.policy = policy
+        self.max_time = max_time
+        self.capacity: int = num_nodes * node_cpu
+        self.random: random.Random = random.Random(seed)
+
+        self.now: float = 0
+        self.events: List[Tuple[float, int, str, Any]] = []
+        self.num_events: int = 0
+        self.inventory: NodeInventory = NodeInventory()
+        for node in range(num_nodes):
+            self.inventory.add_node(f"node-{node}", node_cpu)
+        self.gang_scheduler: GangScheduler = GangScheduler(
+            self.inventory, self.bind, timeout=timeout, policy=policy, clock=lambda: self.now)
+
+        self.pod_requests: Dict[str, int] = {}
+        self.gang_arrival: Dict[str, float] = {}
+        self.gang_bound: Dict[str, List[str]] = {}
+        self.running_cpu: int = 0
+        self.waiting_pods: List[str] = []
+        self.time_to_full_gang: List[float] = []
+        self.useful_cpu_time: float = 0
+        self.held_cpu_time: float = 0
+        self.gangs_completed: int = 0
+
+        submit_time: float = 0
+        for gang in range(num_gangs):
+            submit_time += self.random.expovariate(1 / arrival_interval)
+            for member in range(gang_size):
+                self.push_event(submit_time + self.random.uniform(0, member_spread), ARRIVAL_EVENT,
+                                (f"gang-{gang}", f"gang-{gang}/member-{member}", self.random.choice(cpu_requests)))
+        if gang_aware:
+            self.push_event(timeout / 4, TICK_EVENT, None)
+
+    def push_event(self, event_time: float, event_type: str, payload: Any) -> None:
+        heapq.heappush(self.events, (event_time, self.num_events,
+                       event_type, payload))
+        self.num_events += 1
+
+    @staticmethod
+    def get_gang_name(key: str) -> str:
+        return key.split("/")[0]
+
+    def bind(self, key: str, node: str) -> bool:
+        gang_name: str = self.get_gang_name(key)
+        self.inventory.add_pod(key, node, self.pod_requests[key])
+        self.gang_bound.setdefault(gang_name, []).append(key)
+        if len(self.gang_bound[gang_name]) == self.gang_size:
+            self.time_to_full_gang.append(
+                self.now - self.gang_arrival[gang_name])
+            self.running_cpu += sum(self.pod_requests[member]
+                                    for member in self.gang_bound[gang_name])
+            self.push_event(self.now + self.runtime, FINISH_EVENT, gang_name)
+        return True
+
+    def bind_waiting_pods(self) -> None:
+        for key in list(self.waiting_pods):
+            node = self.inventory.select_node(
+                self.pod_requests[key], self.policy)
+            if node is not None:
+                self.waiting_pods.remove(key)
+                self.bind(key, node)
+
+    def handle_arrival(self, gang_name: str, key: str, cpu_request: int) -> None:
+        self.gang_arrival.setdefault(gang_name, self.now)
+        self.pod_requests[key] = cpu_request
+        if self.gang_aware:
+            self.gang_scheduler.add_pod(
+                key, gang_name, self.gang_size, cpu_request)
+        else:
+            self.waiting_pods.append(key)
+            self.bind_waiting_pods()
+
+    def handle_finish(self, gang_name: str) -> None:
+        for key in self.gang_bound.pop(gang_name):
+            self.inventory.delete_pod(key)
+            self.running_cpu -= self.pod_requests[key]
+        self.gangs_completed += 1
+        if self.gang_aware:
+            self.gang_scheduler.retry_gangs()
+        else:
+            self.bind_waiting_pods()
+
+    def advance(self, event_time: float) -> None:
+        held_cpu: int = sum(self.inventory.requested.values()) + \
+            sum(self.inventory.reserved.values()) - self.running_cpu
+        self.useful_cpu_time += self.running_cpu * (event_time - self.now)
+        self.held_cpu_time += held_cpu * (event_time - self.now)
+        self.now = event_time
+
+    def run(self) -> GangSimulationResult:
+        while self.events and self.gangs_completed < self.num_gangs:
+            event_time, _, event_type, payload = heapq.heappop(self.events)
+            if event_time > self.max_time:
+                break
+            self.advance(event_time)
+            if event_type == ARRIVAL_EVENT:
+                self.handle_arrival(*payload)
+            elif event_type == FINISH_EVENT:
+                self.handle_finish(payload)
+            else:
+                self.gang_scheduler.expire_gangs()
+                self.gang_scheduler.retry_gangs()
+                self.push_event(self.now + self.timeout / 4, TICK_EVENT, None)
+
+        cpu_time: float = self.capacity * self.now if self.now > 0 else 1
+        return GangSimulationResult(
+            gang_aware=self.gang_aware,
+            gangs_completed=self.gangs_completed,
+            num_gangs=self.num_gangs,
+            mean_time_to_full_gang=statistics.mean(
+                self.time_to_full_gang) if self.time_to_full_gang else float("inf"),
+            max_time_to_full_gang=max(
+                self.time_to_full_gang) if self.time_to_full_gang else float("inf"),
+            utilization=self.useful_cpu_time / cpu_time,
+            held_idle_fraction=self.held_cpu_time / cpu_time,
+            num_timeouts=self.gang_scheduler.num_timeouts,
+            makespan=self.now
+        )
+
+
+def main() -> None:
+    gang_aware: bool
+    for gang_aware in [False, True]:
+        simulation: GangSimulation = GangSimulation(
+            num_nodes=4,
+            node_cpu=16000,
+            num_gangs=50,
+            gang_size=9,
+            cpu_requests=list(range(1000, 4001, 500)),
+            arrival_interval=5,
+            member_spread=20,
+            runtime=120,
+            timeout=30,
+            gang_aware=gang_aware)
+        print(simulation.run())
+
+
+if __name__ == "__main__":
+    main()
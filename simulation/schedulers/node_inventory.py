@@ -0,0 +1,166 @@
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from simulation.shared.types import Json
+
+BEST_FIT: str = "best_fit"
+WORST_FIT: str = "worst_fit"
+TERMINAL_PHASES: Tuple[str, str] = ("Succeeded", "Failed")
+
+
+def parse_cpu_quantity(quantity: str) -> int:
+    """Convert a Kubernetes CPU quantity (e.g. "500m", "2", "1.5") to millicores
+    """
+    quantity = str(quantity)
+    if quantity.endswith("m"):
+        return int(quantity[:-1])
+    return int(float(quantity) * 1000)
+
+
+def get_pod_key(pod: Any) -> str:
+    return f"{pod.metadata.namespace}/{pod.metadata.name}"
+
+
+def get_pod_cpu_request(pod: Any) -> int:
+    cpu_request: int = 0
+    for container in pod.spec.containers:
+        if container.resources is not None and container.resources.requests:
+            cpu_request += parse_cpu_quantity(
+                container.resources.requests.get("cpu", "0"))
+    return cpu_request
+
+
+def is_node_schedulable(node: Any) -> bool:
+    if node.spec is not None and node.spec.unschedulable:
+        return False
+    return any(status.type == "Ready" and status.status == "True" for status in node.status.conditions or [])
+
+
+class NodeInventory:
+    """Cached view of node CPU capacity and pod CPU requests, kept current by watch events
+
+    Scheduling decisions are made against this cache, so they do not need an API round trip.
+    """
+
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        # Allocatable millicores of every schedulable node
+        self.allocatable: Dict[str, int] = {}
+        # Millicores requested on every node by the pods bound to it
+        self.requested: Dict[str, int] = {}
+        # The node and CPU request of every bound, non-terminal pod
+        self.pods: Dict[str, Tuple[str, int]] = {}
+        # Capacity held for pods that are not bound yet
+        self.reserved: Dict[str, int] = {}
+        self.reservations: Dict[str, Tuple[str, int]] = {}
+
+    def add_node(self, name: str, allocatable_cpu: int) -> None:
+        with self.lock:
+            self.allocatable[name] = allocatable_cpu
+            self.requested.setdefault(name, 0)
+            self.reserved.setdefault(name, 0)
+
+    def update_node(self, node: Any) -> None:
+        if is_node_schedulable(node):
+            self.add_node(node.metadata.name, parse_cpu_quantity(
+                node.status.allocatable["cpu"]))
+        else:
+            self.delete_node(node.metadata.name)
+
+    def sync_nodes(self, nodes: List[Any]) -> None:
+        """Replace the nodes with a fresh listing, dropping the nodes that are no longer listed
+        """
+        names: List[str] = [node.metadata.name for node in nodes]
+        name: str
+        for name in list(self.allocatable):
+            if name not in names:
+                self.delete_node(name)
+        for node in nodes:
+            self.update_node(node)
+
+    def delete_node(self, name: str) -> None:
+        with self.lock:
+            self.allocatable.pop(name, None)
+
+    def add_pod(self, key: str, node: str, cpu_request: int) -> None:
+        with self.lock:
+            self._remove_pod(key)
+            self.pods[key] = (node, cpu_request)
+            self.requested[node] = self.requested.get(node, 0) + cpu_request
+
+    def delete_pod(self, key: str) -> None:
+        with self.lock:
+            self._remove_pod(key)
+
+    def _remove_pod(self, key: str) -> None:
+        if key in self.pods:
+            node, cpu_request = self.pods.pop(key)
+            self.requested[node] -= cpu_request
+
+    def update_pod(self, pod: Any) -> None:
+        key: str = get_pod_key(pod)
+        if pod.spec.node_name is None or pod.status.phase in TERMINAL_PHASES:
+            self.delete_pod(key)
+        else:
+            self.add_pod(key, pod.spec.node_name, get_pod_cpu_request(pod))
+
+    def sync_pods(self, pods: List[Any]) -> None:
+        """Replace the pods with a fresh listing, dropping the pods that are no longer listed
+        """
+        keys: Set[str] = {get_pod_key(pod) for pod in pods}
+        key: str
+        for key in list(self.pods):
+            if key not in keys:
+                self.delete_pod(key)
+        for pod in pods:
+            self.update_pod(pod)
+
+    def reserve(self, key: str, node: str, cpu_request: int) -> None:
+        with self.lock:
+            self._release(key)
+            self.reservations[key] = (node, cpu_request)
+            self.reserved[node] = self.reserved.get(node, 0) + cpu_request
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            self._release(key)
+
+    def _release(self, key: str) -> None:
+        if key in self.reservations:
+            node, cpu_request = self.reservations.pop(key)
+            self.reserved[node] -= cpu_request
+
+    def apply_node_event(self, event: Json) -> None:
+        if event["type"] == "DELETED":
+            self.delete_node(event["object"].metadata.name)
+        else:
+            self.update_node(event["object"])
+
+    def apply_pod_event(self, event: Json) -> None:
+        if event["type"] == "DELETED":
+            self.delete_pod(get_pod_key(event["object"]))
+        else:
+            self.update_pod(event["object"])
+
+    def get_free_cpu(self, node: str) -> int:
+        return self.allocatable[node] - self.requested.get(node, 0) - self.reserved.get(node, 0)
+
+    def select_node(self, cpu_request: int, policy: str = BEST_FIT) -> Optional[str]:
+        """Pick a node with enough free CPU for the request
+
+        Args:
+            cpu_request (int): The requested millicores
+            policy (str, optional): BEST_FIT picks the node with the least free CPU left over,
+                WORST_FIT the node with the most. Defaults to BEST_FIT.
+
+        Returns:
+            Optional[str]: The name of the chosen node, or None if no node fits the request
+        """
+        with self.lock:
+            fitting_nodes: Dict[str, int] = {
+                node: self.get_free_cpu(node) for node in self.allocatable if self.get_free_cpu(node) >= cpu_request}
+        if len(fitting_nodes) == 0:
+            return None
+        if policy == WORST_FIT:
+            return max(fitting_nodes, key=fitting_nodes.get)  # type: ignore
+        return min(fitting_nodes, key=fitting_nodes.get)  # type: ignore
@@ -3,24 +3,34 @@
 This script is a scheduler to scheduler kubernetes jobs
 """
 
-import random
 import json
+import statistics
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
+import urllib3
 from kubernetes import client, config, watch
 
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.schedulers.node_inventory import BEST_FIT, TERMINAL_PHASES, NodeInventory, get_pod_cpu_request, get_pod_key
+from simulation.schedulers.gang_scheduler import GANG_TIMEOUT, GangScheduler, get_pod_gang
+from simulation.shared.types import Json
+
 config.load_kube_config()
 v1 = client.CoreV1Api()
 
 SCHEDULER_NAME = "evanScheduler"
-
-
-def nodes_available():
-    ready_nodes = []
-    for node in v1.list_node().items:
-        for status in node.status.conditions:
-            if status.status == "True" and status.type == "Ready":
-                ready_nodes.append(node.metadata.name)
-    return ready_nodes
+PLACEMENT_POLICY = BEST_FIT
+LATENCY_REPORT_INTERVAL = 100
+# Seconds to wait before listing the nodes again after the node watch failed
+NODE_WATCH_RETRY_INTERVAL = 5
+# Seconds to wait before listing the pods again after the pod watch failed
+POD_WATCH_RETRY_INTERVAL = 5
 
 
 def scheduler(name, node, namespace="default"):
@@ -36,19 +46,206 @@ def scheduler(name, node, namespace="default"):
     body = client.V1Binding(target=target)
     body.metadata = meta
 
-    return v1.create_namespaced_binding(namespace, body)
+    # The client cannot deserialize the binding response, so it is returned unparsed
+    return v1.create_namespaced_binding(namespace, body, _preload_content=False)
 
 
-def main():
+def watch_nodes(inventory: NodeInventory, resource_version: Optional[str], on_nodes_changed: Callable[[], None]) -> None:
+    """Keep the nodes of the inventory current, calling on_nodes_changed after every node event
+
+    If the watch fails, e.g. with 410 Gone once its resource version has expired or when the connection
+    drops, the nodes are listed again to rebuild the inventory and the watch restarts from the resource
+    version of that listing.
+    """
+    watcher = watch.Watch()
+    while True:
+        try:
+            if resource_version is None:
+                nodes = v1.list_node()
+                inventory.sync_nodes(nodes.items)
+                resource_version = nodes.metadata.resource_version
+                on_nodes_changed()
+            for event in watcher.stream(v1.list_node, resource_version=resource_version):
+                if event["type"] == "ERROR":
+                    # the object is a Status, e.g. of an expired resource version
+                    raise client.rest.ApiException(status=event["raw_object"].get("code"),
+                                                   reason=event["raw_object"].get("message"))
+                inventory.apply_node_event(event)
+                resource_version = event["object"].metadata.resource_version
+                on_nodes_changed()
+        except client.rest.ApiException as e:
+            print(f"The node watch failed with {e.status} {e.reason}, listing the nodes again")
+            resource_version = None
+            time.sleep(NODE_WATCH_RETRY_INTERVAL)
+        except urllib3.exceptions.HTTPError as e:
+            print(f"The node watch lost its connection with {e}, listing the nodes again")
+            resource_version = None
+            time.sleep(NODE_WATCH_RETRY_INTERVAL)
+
+
+def watch_pods(on_pods_listed: Callable[[List[Any]], None], on_pod_event: Callable[[Json], None],
+               on_stream_end: Callable[[], None]) -> None:
+    """Handle every pod event, listing the pods first and again whenever the watch fails
+
+    The stream ends every GANG_TIMEOUT seconds so that on_stream_end can release stuck gang reservations,
+    and restarts from the resource version of the last event. If the watch fails, e.g. with 410 Gone once
+    its resource version has expired or when the connection drops, events may have been missed, so the
+    pods are listed again and the watch restarts from the resource version of that listing.
+    """
     watcher = watch.Watch()
-    for event in watcher.stream(v1.list_namespaced_pod, "default"):
-        if event['object'].status.phase == "Pending" \
-                and event['object'].spec.scheduler_name == SCHEDULER_NAME:
-            try:
-                scheduler(event['object'].metadata.name,
-                          random.choice(nodes_available()))
-            except client.rest.ApiException as e:
-                print(json.loads(e.body)['message'])
+    resource_version: Optional[str] = None
+    while True:
+        try:
+            if resource_version is None:
+                pods = v1.list_pod_for_all_namespaces()
+                on_pods_listed(pods.items)
+                resource_version = pods.metadata.resource_version
+            for event in watcher.stream(v1.list_pod_for_all_namespaces, resource_version=resource_version,
+                                        timeout_seconds=int(GANG_TIMEOUT)):
+                if event["type"] == "ERROR":
+                    # the object is a Status, e.g. of an expired resource version
+                    raise client.rest.ApiException(status=event["raw_object"].get("code"),
+                                                   reason=event["raw_object"].get("message"))
+                on_pod_event(event)
+                resource_version = event["object"].metadata.resource_version
+            on_stream_end()
+        except client.rest.ApiException as e:
+            print(f"The pod watch failed with {e.status} {e.reason}, listing the pods again")
+            resource_version = None
+            time.sleep(POD_WATCH_RETRY_INTERVAL)
+        except urllib3.exceptions.HTTPError as e:
+            print(f"The pod watch lost its connection with {e}, listing the pods again")
+            resource_version = None
+            time.sleep(POD_WATCH_RETRY_INTERVAL)
+
+
+def create_inventory() -> Tuple[NodeInventory, str]:
+    """List the nodes once, the pods are listed when the pod watch starts
+
+    Returns:
+        Tuple[NodeInventory, str]: The inventory, and the resource version of the node listing to start the node watch from
+    """
+    inventory: NodeInventory = NodeInventory()
+    nodes = v1.list_node()
+    for node in nodes.items:
+        inventory.update_node(node)
+    return inventory, nodes.metadata.resource_version
+
+
+def report_latency(latencies: List[float]) -> None:
+    print(f"Scheduled {len(latencies)} pods, mean decision latency {statistics.mean(latencies) * 1e6:.1f}us, "
+          f"max {max(latencies) * 1e6:.1f}us")
+
+
+def bind_pod_key(key: str, node: str) -> bool:
+    """Bind a pod to a node by its key
+
+    Returns:
+        bool: False if the binding failed
+    """
+    namespace, name = key.split("/")
+    try:
+        scheduler(name, node, namespace)
+    except client.rest.ApiException as e:
+        print(json.loads(e.body)['message'])
+        return False
+    return True
+
+
+def schedule_pod(inventory: NodeInventory, pod, latencies: List[float]) -> bool:
+    """Bind a pod to a node chosen from the inventory
+
+    Returns:
+        bool: False if no node currently has enough free CPU for the pod, or the binding failed
+    """
+    start: float = time.perf_counter()
+    cpu_request: int = get_pod_cpu_request(pod)
+    node = inventory.select_node(cpu_request, PLACEMENT_POLICY)
+    latencies.append(time.perf_counter() - start)
+    if len(latencies) % LATENCY_REPORT_INTERVAL == 0:
+        report_latency(latencies)
+    if node is None:
+        print(f"No node has {cpu_request}m CPU free for {pod.metadata.name}")
+        return False
+    try:
+        scheduler(pod.metadata.name, node, pod.metadata.namespace)
+    except client.rest.ApiException as e:
+        print(json.loads(e.body)['message'])
+        return False
+    # Account for the pod before the watch reports the binding
+    inventory.add_pod(get_pod_key(pod), node, cpu_request)
+    return True
+
+
+def main():
+    inventory, node_resource_version = create_inventory()
+    gang_scheduler: GangScheduler = GangScheduler(
+        inventory, bind_pod_key, policy=PLACEMENT_POLICY)
+    latencies: List[float] = []
+    unschedulable: Dict[str, Any] = {}
+    # held while handling a pod event or retrying, since node events retry from the node watch thread
+    lock: threading.Lock = threading.Lock()
+
+    def retry_pending() -> None:
+        """Retry the pods and gangs that did not fit before, after CPU was freed or added
+        """
+        gang_scheduler.retry_gangs()
+        for pending_key, pending_pod in list(unschedulable.items()):
+            if schedule_pod(inventory, pending_pod, latencies):
+                del unschedulable[pending_key]
+
+    def on_nodes_changed() -> None:
+        with lock:
+            retry_pending()
+
+    def handle_pod_event(event: Json) -> None:
+        pod = event['object']
+        key: str = get_pod_key(pod)
+        gang: Optional[Tuple[str, int]] = get_pod_gang(pod)
+        inventory.apply_pod_event(event)
+        if event['type'] == "DELETED" or pod.status.phase in TERMINAL_PHASES:
+            unschedulable.pop(key, None)
+            if gang is not None:
+                gang_scheduler.remove_pod(key, gang[0])
+            retry_pending()
+        elif pod.spec.node_name is not None:
+            # bound, so it no longer waits for capacity
+            unschedulable.pop(key, None)
+        elif pod.status.phase == "Pending" and pod.spec.scheduler_name == SCHEDULER_NAME:
+            if gang is not None:
+                gang_scheduler.add_pod(
+                    key, gang[0], gang[1], get_pod_cpu_request(pod))
+            elif not schedule_pod(inventory, pod, latencies):
+                unschedulable[key] = pod
+        gang_scheduler.expire_gangs()
+
+    def on_pods_listed(pods: List[Any]) -> None:
+        """Rebuild the pod state from a fresh listing, forgetting the pods deleted while the watch was down
+        """
+        with lock:
+            keys: Set[str] = {get_pod_key(pod) for pod in pods}
+            inventory.sync_pods(pods)
+            gang_scheduler.sync_pods(keys)
+            for pending_key in [pending_key for pending_key in unschedulable if pending_key not in keys]:
+                del unschedulable[pending_key]
+            for pod in pods:
+                handle_pod_event({"type": "MODIFIED", "object": pod})
+
+    def on_pod_event(event: Json) -> None:
+        with lock:
+            handle_pod_event(event)
+
+    def on_stream_end() -> None:
+        with lock:
+            gang_scheduler.expire_gangs()
+            gang_scheduler.retry_gangs()
+        if len(gang_scheduler.time_to_full_gang) > 0:
+            print(f"Bound {len(gang_scheduler.time_to_full_gang)} gangs, mean time to full gang "
+                  f"{statistics.mean(gang_scheduler.time_to_full_gang):.2f}s, {gang_scheduler.num_timeouts} timeouts")
+
+    threading.Thread(target=watch_nodes, args=(
+        inventory, node_resource_version, on_nodes_changed), daemon=True).start()
+    watch_pods(on_pods_listed, on_pod_event, on_stream_end)
 
 
 if __name__ == '__main__':
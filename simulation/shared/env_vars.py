@@ -11,3 +11,5 @@ class EnvVarName(Enum):
     NUM_INSTANCES: str = "NUM_INSTANCES"
     ZOOKEEPER_CLIENT_ENDPOINT: str = "ZOOKEEPER_CLIENT_ENDPOINT"
     BARRIER_PATH: str = "BARRIER_PATH"
+    WARM_POOL_PATH: str = "WARM_POOL_PATH"
+    TELEMETRY_PATH: str = "TELEMETRY_PATH"
@@ -0,0 +1,66 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+from simulation.shared.env_vars import EnvVarName
+
+
+class JobResizer(ABC):
+    """Creates stress jobs and changes their CPU shares while they are running
+    """
+
+    @abstractmethod
+    def create_job(self, env_vars: Dict[str, str], cpu_shares: int) -> None:
+        pass
+
+    @abstractmethod
+    def resize_job(self, env_vars: Dict[str, str], cpu_shares: int) -> bool:
+        """Change the CPU request and limit of a running job
+
+        Args:
+            env_vars (Dict[str, str]): The environment variables the job was created with
+            cpu_shares (int): The new CPU shares (in millicores) of the job
+
+        Returns:
+            bool: True if the job was resized in place, False if it had to be recreated
+        """
+        pass
+
+    @abstractmethod
+    def delete_job(self, job_name: str) -> None:
+        pass
+
+
+class LocalJobResizer(JobResizer):
+    """Cluster-free stand-in that only keeps track of the CPU shares of each job
+
+    Args:
+        in_place (bool, optional): Whether resizes succeed in place. Defaults to True.
+    """
+
+    def __init__(self, in_place: bool = True):
+        self.in_place = in_place
+        self.job_shares: Dict[str, int] = {}
+        self.num_resized: int = 0
+        self.num_recreated: int = 0
+        self.events: List[str] = []
+
+    def create_job(self, env_vars: Dict[str, str], cpu_shares: int) -> None:
+        job_name: str = env_vars[EnvVarName.JOB_NAME.value]
+        self.job_shares[job_name] = cpu_shares
+        self.events.append(f"create {job_name} {cpu_shares}")
+
+    def resize_job(self, env_vars: Dict[str, str], cpu_shares: int) -> bool:
+        job_name: str = env_vars[EnvVarName.JOB_NAME.value]
+        if not self.in_place or job_name not in self.job_shares:
+            self.delete_job(job_name)
+            self.create_job(env_vars, cpu_shares)
+            self.num_recreated += 1
+            return False
+        self.job_shares[job_name] = cpu_shares
+        self.events.append(f"resize {job_name} {cpu_shares}")
+        self.num_resized += 1
+        return True
+
+    def delete_job(self, job_name: str) -> None:
+        if self.job_shares.pop(job_name, None) is not None:
+            self.events.append(f"delete {job_name}")
@@ -1,20 +1,46 @@
 import time
+from functools import lru_cache
 from kubernetes import client, config, watch
 from typing import List, Dict
 
 from kubernetes.client.exceptions import ApiException
 from simulation.shared.types import Json
 from simulation.shared.env_vars import EnvVarName
+from simulation.shared.job_resizer import JobResizer
 
 DEFAULT_NAMESPACE: str = "default"
 STRESS_NG_IMAGE: str = "evanw1999/stress-ng:public"
+PAUSE_IMAGE: str = "registry.k8s.io/pause:3.9"
+PREPULL_NAME: str = "stress-ng-prepull"
 
-# config.load_incluster_config()
-config.load_kube_config()
-api_instance: client.BatchV1Api = client.BatchV1Api()
 
+@lru_cache(maxsize=None)
+def load_kube_config() -> None:
+    """Load the kubeconfig the first time a client is needed, rather than when the module is imported
+    """
+    # config.load_incluster_config()
+    config.load_kube_config()
 
-def create_stress_body(env_vars: Dict[str, str], cpu_shares: int):
+
+@lru_cache(maxsize=None)
+def get_batch_api() -> client.BatchV1Api:
+    load_kube_config()
+    return client.BatchV1Api()
+
+
+@lru_cache(maxsize=None)
+def get_core_api() -> client.CoreV1Api:
+    load_kube_config()
+    return client.CoreV1Api()
+
+
+@lru_cache(maxsize=None)
+def get_apps_api() -> client.AppsV1Api:
+    load_kube_config()
+    return client.AppsV1Api()
+
+
+def create_stress_body(env_vars: Dict[str, str], cpu_shares: int, image_pull_policy: str = "Always"):
     job_name: str = env_vars[EnvVarName.JOB_NAME.value]
 
     metadata: client.V1ObjectMeta = client.V1ObjectMeta(
@@ -27,8 +53,11 @@ def create_stress_body(env_vars: Dict[str, str], cpu_shares: int):
     job_env_vars: List[client.V1EnvVar] = [client.V1EnvVar(
         name=name, value=value) for name, value in env_vars.items()]
     container = client.V1Container(
-        name=job_name, env=job_env_vars, image=STRESS_NG_IMAGE, image_pull_policy="Always")
+        name=job_name, env=job_env_vars, image=STRESS_NG_IMAGE, image_pull_policy=image_pull_policy)
     container.resources = resource_requirements
+    # Allow the CPU to be resized without restarting the container
+    container.resize_policy = [client.V1ContainerResizePolicy(
+        resource_name="cpu", restart_policy="NotRequired")]
     spec = client.V1PodSpec(
         containers=[container], restart_policy="Never")
 
@@ -41,14 +70,51 @@ def create_stress_body(env_vars: Dict[str, str], cpu_shares: int):
     return body
 
 
-def kube_create_stress_job(env_vars: Dict[str, str], cpu_shares: int):
+def kube_create_stress_job(env_vars: Dict[str, str], cpu_shares: int, image_pull_policy: str = "Always"):
     try:
-        api_instance.create_namespaced_job(
-            DEFAULT_NAMESPACE, create_stress_body(env_vars, cpu_shares))
+        get_batch_api().create_namespaced_job(
+            DEFAULT_NAMESPACE, create_stress_body(env_vars, cpu_shares, image_pull_policy))
     except ApiException as e:
         time.sleep(20)
         # print(e)
-        kube_create_stress_job(env_vars, cpu_shares)
+        kube_create_stress_job(env_vars, cpu_shares, image_pull_policy)
+
+
+def create_prepull_body() -> client.V1DaemonSet:
+    """Create a DaemonSet that pulls the stress-ng image onto every node and then idles
+    """
+    labels: Dict[str, str] = {"name": PREPULL_NAME}
+    metadata: client.V1ObjectMeta = client.V1ObjectMeta(
+        namespace=DEFAULT_NAMESPACE, name=PREPULL_NAME, labels=labels)
+
+    prepull_container = client.V1Container(
+        name="prepull", image=STRESS_NG_IMAGE, image_pull_policy="Always", command=["true"])
+    pause_container = client.V1Container(name="pause", image=PAUSE_IMAGE)
+    spec = client.V1PodSpec(
+        init_containers=[prepull_container], containers=[pause_container])
+
+    template = client.V1PodTemplateSpec(
+        metadata=client.V1ObjectMeta(labels=labels), spec=spec)
+
+    body = client.V1DaemonSet(api_version="apps/v1", kind="DaemonSet")
+    body.metadata = metadata
+    body.spec = client.V1DaemonSetSpec(
+        selector=client.V1LabelSelector(match_labels=labels), template=template)
+    return body
+
+
+def kube_create_prepull_daemon_set():
+    try:
+        get_apps_api().create_namespaced_daemon_set(
+            DEFAULT_NAMESPACE, create_prepull_body())
+    except ApiException as e:
+        # The DaemonSet already exists
+        if e.status != 409:
+            raise
+
+
+def kube_delete_prepull_daemon_set():
+    get_apps_api().delete_namespaced_daemon_set(PREPULL_NAME, DEFAULT_NAMESPACE)
 
 
 def kube_update_stress_job(env_vars: Dict[str, str], cpu_shares: int):
@@ -56,27 +122,84 @@ def kube_update_stress_job(env_vars: Dict[str, str], cpu_shares: int):
     kube_create_stress_job(env_vars, cpu_shares)
 
 
+def create_resize_body(job_name: str, cpu_shares: int) -> Json:
+    resource_requests: Json = {"cpu": f"{cpu_shares}m"}
+    return {"spec": {"containers": [{"name": job_name, "resources": {
+        "requests": resource_requests, "limits": resource_requests}}]}}
+
+
+def get_running_job_pods(job_name: str) -> List[client.V1Pod]:
+    pods: List[client.V1Pod] = get_core_api().list_namespaced_pod(
+        DEFAULT_NAMESPACE, label_selector=f"job-name={job_name}").items
+    return [pod for pod in pods if pod.status.phase == "Running"]
+
+
+def kube_resize_stress_job(env_vars: Dict[str, str], cpu_shares: int) -> bool:
+    """Resize the CPU of a running stress job in place, recreating the job if the cluster does not support it
+
+    Args:
+        env_vars (Dict[str, str]): The environment variables of the job
+        cpu_shares (int): The new CPU shares of the job
+
+    Returns:
+        bool: True if the job was resized in place, False if it was recreated
+    """
+    job_name: str = env_vars[EnvVarName.JOB_NAME.value]
+    pods: List[client.V1Pod] = get_running_job_pods(job_name)
+    if len(pods) == 0:
+        kube_update_stress_job(env_vars, cpu_shares)
+        return False
+
+    # Newer clusters only accept resource changes through the resize subresource
+    core_api: client.CoreV1Api = get_core_api()
+    patch_pod = getattr(core_api, "patch_namespaced_pod_resize",
+                        core_api.patch_namespaced_pod)
+    try:
+        for pod in pods:
+            patch_pod(pod.metadata.name, DEFAULT_NAMESPACE,
+                      create_resize_body(job_name, cpu_shares))
+    except ApiException:
+        kube_update_stress_job(env_vars, cpu_shares)
+        return False
+    return True
+
+
 def kube_delete_job(job_name: str):
-    api_instance.delete_namespaced_job(
+    get_batch_api().delete_namespaced_job(
         job_name, DEFAULT_NAMESPACE, propagation_policy="Foreground")
 
 
+class KubeJobResizer(JobResizer):
+    """Resizes stress jobs on the Kubernetes cluster
+    """
+
+    def create_job(self, env_vars: Dict[str, str], cpu_shares: int) -> None:
+        kube_create_stress_job(env_vars, cpu_shares)
+
+    def resize_job(self, env_vars: Dict[str, str], cpu_shares: int) -> bool:
+        return kube_resize_stress_job(env_vars, cpu_shares)
+
+    def delete_job(self, job_name: str) -> None:
+        kube_delete_job(job_name)
+
+
 def get_job_duration() -> int:
     w = watch.Watch()
-    for event in w.stream(api_instance.list_namespaced_job,
+    for event in w.stream(get_batch_api().list_namespaced_job,
                           namespace=DEFAULT_NAMESPACE,
                           label_selector=f"job-name=matrix"):
         job = event["object"]
         if job.status.succeeded:
             duration = (job.status.completion_time -
                         job.status.start_time).total_seconds()
-            api_instance.delete_namespaced_job(
+            get_batch_api().delete_namespaced_job(
                 "matrix", DEFAULT_NAMESPACE, propagation_policy="Background")
             return duration
     return -1
 
 
 def get_available_resources():
+    load_kube_config()
     cust: client.CustomObjectsApi = client.CustomObjectsApi()
     response: Json = cust.list_cluster_custom_object(
         'metrics.k8s.io', 'v1beta1', 'nodes')
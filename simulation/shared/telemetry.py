@@ -0,0 +1,164 @@
+import os
+import re
+from dataclasses import dataclass, astuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from kazoo.client import KazooClient
+
+CGROUP_V2_CPU_STAT_PATH: str = "/sys/fs/cgroup/cpu.stat"
+CGROUP_V1_CPU_STAT_PATHS: List[str] = [
+    "/sys/fs/cgroup/cpu,cpuacct/cpu.stat", "/sys/fs/cgroup/cpu/cpu.stat"]
+CGROUP_V1_CPU_USAGE_PATHS: List[str] = [
+    "/sys/fs/cgroup/cpu,cpuacct/cpuacct.usage", "/sys/fs/cgroup/cpuacct/cpuacct.usage"]
+RECORD_PREFIX: str = "record-"
+
+
+@dataclass(frozen=True)
+class SuperstepRecord:
+    """What a job measured during one superstep, published to the coordinator
+
+    Times are in seconds. The throttling counters are the increase in the cgroup's cpu.stat over the superstep.
+    """
+    superstep: int
+    workload_size: int
+    # From leaving the start of the barrier until the work was done
+    compute_time: float
+    cpu_time: float
+    nr_periods: int
+    nr_throttled: int
+    throttled_time: float
+    # From the stress-ng metrics, 0 if they could not be parsed
+    bogo_ops: int
+    bogo_ops_per_second: float
+
+    def to_bytes(self) -> bytes:
+        return ",".join(str(value) for value in astuple(self)).encode("utf-8")
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "SuperstepRecord":
+        (superstep, workload_size, compute_time, cpu_time, nr_periods, nr_throttled, throttled_time, bogo_ops,
+         bogo_ops_per_second) = data.decode("utf-8").split(",")
+        return SuperstepRecord(superstep=int(superstep), workload_size=int(workload_size),
+                               compute_time=float(compute_time), cpu_time=float(cpu_time), nr_periods=int(nr_periods),
+                               nr_throttled=int(nr_throttled), throttled_time=float(throttled_time),
+                               bogo_ops=int(bogo_ops), bogo_ops_per_second=float(bogo_ops_per_second))
+
+
+def read_first_file(file_paths: List[str]) -> Optional[str]:
+    file_path: str
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            with open(file_path) as stat_file:
+                return stat_file.read()
+    return None
+
+
+def read_cpu_stat() -> Dict[str, int]:
+    """Read the CPU usage and throttling counters of this container's cgroup, on cgroup v2 or v1
+
+    Returns:
+        Dict[str, int]: usage_usec, nr_periods, nr_throttled and throttled_usec, or no counters outside a cgroup
+    """
+    cpu_stat: Optional[str] = read_first_file([CGROUP_V2_CPU_STAT_PATH])
+    if cpu_stat is not None:
+        counters: Dict[str, int] = {name: int(value) for name, value in (
+            line.split() for line in cpu_stat.splitlines() if line.strip())}
+        return {name: counters.get(name, 0) for name in ["usage_usec", "nr_periods", "nr_throttled", "throttled_usec"]}
+    cpu_stat = read_first_file(CGROUP_V1_CPU_STAT_PATHS)
+    if cpu_stat is None:
+        return {}
+    counters = {name: int(value) for name, value in (
+        line.split() for line in cpu_stat.splitlines() if line.strip())}
+    cpu_usage: Optional[str] = read_first_file(CGROUP_V1_CPU_USAGE_PATHS)
+    # cgroup v1 counts in nanoseconds
+    return {"usage_usec": int(cpu_usage) // 1000 if cpu_usage is not None else 0,
+            "nr_periods": counters.get("nr_periods", 0),
+            "nr_throttled": counters.get("nr_throttled", 0),
+            "throttled_usec": counters.get("throttled_time", 0) // 1000}
+
+
+def parse_stress_ng_metrics(output: str, stressor: str) -> Tuple[int, float]:
+    """Parse the bogo ops of a stressor from the output of stress-ng --metrics
+
+    The metrics line of a stressor starts with its name, followed by the bogo ops, the real, user and
+    system time and the bogo ops per second of real time.
+
+    Returns:
+        Tuple[int, float]: The bogo ops and bogo ops per second, or zeros if the stressor has no metrics line
+    """
+    metrics_line: re.Pattern = re.compile(
+        rf"\]\s+{re.escape(stressor)}\s+(\d+)\s+[\d.]+\s+[\d.]+\s+[\d.]+\s+([\d.]+)")
+    match: Optional[re.Match] = metrics_line.search(output)
+    if match is None:
+        return 0, 0.0
+    return int(match.group(1)), float(match.group(2))
+
+
+def create_superstep_record(superstep: int, workload_size: int, compute_time: float, start_stat: Dict[str, int],
+                            end_stat: Dict[str, int], metrics: Tuple[int, float]) -> SuperstepRecord:
+    def get_delta(name: str) -> int:
+        return end_stat.get(name, 0) - start_stat.get(name, 0)
+
+    return SuperstepRecord(superstep=superstep, workload_size=workload_size, compute_time=compute_time,
+                           cpu_time=get_delta("usage_usec") / 1e6, nr_periods=get_delta("nr_periods"),
+                           nr_throttled=get_delta("nr_throttled"), throttled_time=get_delta("throttled_usec") / 1e6,
+                           bogo_ops=metrics[0], bogo_ops_per_second=metrics[1])
+
+
+def publish_record(zk: "KazooClient", telemetry_path: str, job_name: str, record: SuperstepRecord) -> None:
+    """Publish a record as a sequential znode under the job's telemetry path, for the coordinator to collect
+    """
+    zk.create(f"{telemetry_path}/{job_name}/{RECORD_PREFIX}",
+              record.to_bytes(), sequence=True, makepath=True)
+
+
+class TelemetryCollector:
+    """Collects the records that jobs publish, all jobs at once
+
+    The listings of every job and the reads of every pending record are each sent together, and their
+    deletes are committed in a single transaction, so collecting costs three round trips to ZooKeeper
+    however many jobs and records there are.
+
+    Args:
+        zk (KazooClient): A started ZooKeeper client
+        telemetry_path (str): The path the jobs publish under
+        job_names (List[str]): The jobs to collect from
+    """
+
+    def __init__(self, zk: "KazooClient", telemetry_path: str, job_names: List[str]):
+        self.zk = zk
+        self.telemetry_path = telemetry_path
+        self.job_names = job_names
+
+    def collect(self) -> Dict[str, List[SuperstepRecord]]:
+        """Take every record published since the last collection
+
+        Returns:
+            Dict[str, List[SuperstepRecord]]: The records of every job, in the order they were published
+        """
+        from kazoo.exceptions import NoNodeError
+        children_requests = {job_name: self.zk.get_children_async(f"{self.telemetry_path}/{job_name}")
+                             for job_name in self.job_names}
+        record_paths: Dict[str, List[str]] = {}
+        job_name: str
+        for job_name, request in children_requests.items():
+            try:
+                children: List[str] = request.get()
+            except NoNodeError:
+                # the job has not published anything yet
+                continue
+            record_paths[job_name] = [f"{self.telemetry_path}/{job_name}/{child}"
+                                      for child in sorted(children) if child.startswith(RECORD_PREFIX)]
+        record_requests = {job_name: [self.zk.get_async(path) for path in paths]
+                           for job_name, paths in record_paths.items()}
+        records: Dict[str, List[SuperstepRecord]] = {job_name: [SuperstepRecord.from_bytes(request.get()[0])
+                                                                for request in requests]
+                                                     for job_name, requests in record_requests.items()}
+        if sum(len(paths) for paths in record_paths.values()) > 0:
+            transaction = self.zk.transaction()
+            for paths in record_paths.values():
+                for path in paths:
+                    transaction.delete(path)
+            transaction.commit()
+        return records
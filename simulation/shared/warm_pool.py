@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from kazoo.client import KazooClient
+from kazoo.recipe.queue import LockingQueue
+
+from simulation.config.config import WARM_POOL_PATH, WARM_POOL_SIZE
+from simulation.shared.env_vars import EnvVarName
+from simulation.shared.job_resizer import JobResizer
+from simulation.shared.kube_api import (KubeJobResizer, kube_create_prepull_daemon_set, kube_create_stress_job,
+                                         kube_delete_job, kube_delete_prepull_daemon_set)
+from simulation.shared.workloads import get_warm_pool_env_vars
+
+
+@dataclass(frozen=True)
+class WarmPoolStats:
+    claims: int
+    hits: int
+    hit_rate: float
+    mean_claim_latency: float
+
+
+class WarmPool(JobResizer):
+    """Keeps pre-started stress-ng pods idle for each CPU tier and hands them tasks instead of creating new jobs
+
+    Each warm pod waits on its own ZooKeeper queue under the pool path. Claiming a pod puts the task's
+    environment variables on that queue, after which the pod joins the barrier as that task.
+    Claims for tiers without an idle pod fall back to creating a job. Claimed pods are replenished in the
+    background, so a claim never waits on creating the next warm pod.
+
+    Args:
+        zk (KazooClient): A started ZooKeeper client
+        cpu_tiers (List[int]): The CPU shares to keep warm pods for
+        pool_size (int, optional): The number of idle pods per tier. Defaults to WARM_POOL_SIZE.
+        pool_path (str, optional): The ZooKeeper path of the pool queues. Defaults to WARM_POOL_PATH.
+        fallback (JobResizer, optional): Used for jobs that miss the pool. Defaults to KubeJobResizer.
+        replenish (bool, optional): Whether to start a new warm pod for every claimed one. Defaults to True.
+    """
+
+    def __init__(self,
+                 zk: KazooClient,
+                 cpu_tiers: List[int],
+                 pool_size: int = WARM_POOL_SIZE,
+                 pool_path: str = WARM_POOL_PATH,
+                 fallback: Optional[JobResizer] = None,
+                 replenish: bool = True):
+        self.zk = zk
+        self.cpu_tiers = cpu_tiers
+        self.pool_size = pool_size
+        self.pool_path = pool_path
+        self.fallback: JobResizer = fallback if fallback is not None else KubeJobResizer()
+        self.replenish = replenish
+        self.idle_jobs: Dict[int, List[str]] = {
+            cpu_shares: [] for cpu_shares in cpu_tiers}
+        # Maps the task name to the warm job that is running it
+        self.claimed_jobs: Dict[str, str] = {}
+        self.num_warm_jobs: int = 0
+        self.claim_latencies: List[float] = []
+        self.num_hits: int = 0
+        # Guards idle_jobs and num_warm_jobs, which the replenisher changes in the background
+        self.lock: threading.Lock = threading.Lock()
+        self.replenisher: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+        self.replenishments: List[Future] = []
+
+    def create_warm_job(self, cpu_shares: int) -> None:
+        with self.lock:
+            job_name: str = f"warm-{cpu_shares}-{self.num_warm_jobs}"
+            self.num_warm_jobs += 1
+        kube_create_stress_job(get_warm_pool_env_vars(
+            job_name, self.pool_path), cpu_shares, image_pull_policy="IfNotPresent")
+        with self.lock:
+            self.idle_jobs[cpu_shares].append(job_name)
+
+    def wait_for_replenishments(self) -> None:
+        """Wait until every claimed pod has been replaced, raising the error of a replacement that failed
+        """
+        while len(self.replenishments) > 0:
+            self.replenishments.pop(0).result()
+
+    def fill(self) -> None:
+        """Pre-pull the stress-ng image onto every node and start warm pods until every tier has pool_size idle pods
+        """
+        cpu_shares: int
+        kube_create_prepull_daemon_set()
+        for cpu_shares in self.cpu_tiers:
+            while len(self.idle_jobs[cpu_shares]) < self.pool_size:
+                self.create_warm_job(cpu_shares)
+
+    def create_job(self, env_vars: Dict[str, str], cpu_shares: int) -> None:
+        start: float = time.time()
+        task_name: str = env_vars[EnvVarName.JOB_NAME.value]
+        with self.lock:
+            idle_jobs: List[str] = self.idle_jobs.get(cpu_shares, [])
+            job_name: Optional[str] = idle_jobs.pop(
+                0) if len(idle_jobs) > 0 else None
+        if job_name is None:
+            self.fallback.create_job(env_vars, cpu_shares)
+            self.claim_latencies.append(time.time() - start)
+            return
+        LockingQueue(self.zk, f"{self.pool_path}/{job_name}").put(
+            json.dumps(env_vars).encode("utf-8"))
+        self.claimed_jobs[task_name] = job_name
+        self.num_hits += 1
+        self.claim_latencies.append(time.time() - start)
+        if self.replenish:
+            self.replenishments.append(
+                self.replenisher.submit(self.create_warm_job, cpu_shares))
+
+    def resize_job(self, env_vars: Dict[str, str], cpu_shares: int) -> bool:
+        self.delete_job(env_vars[EnvVarName.JOB_NAME.value])
+        self.create_job(env_vars, cpu_shares)
+        return False
+
+    def delete_job(self, job_name: str) -> None:
+        if job_name in self.claimed_jobs:
+            kube_delete_job(self.claimed_jobs.pop(job_name))
+        else:
+            self.fallback.delete_job(job_name)
+
+    def drain(self) -> None:
+        """Delete every idle warm pod along with the pool queues and the pre-pull DaemonSet
+        """
+        cpu_shares: int
+        # a pod replenished after draining would be left running
+        self.wait_for_replenishments()
+        for cpu_shares in self.cpu_tiers:
+            while len(self.idle_jobs[cpu_shares]) > 0:
+                kube_delete_job(self.idle_jobs[cpu_shares].pop())
+        if self.zk.exists(self.pool_path):
+            self.zk.delete(self.pool_path, recursive=True)
+        kube_delete_prepull_daemon_set()
+
+    def get_stats(self) -> WarmPoolStats:
+        claims: int = len(self.claim_latencies)
+        return WarmPoolStats(
+            claims=claims,
+            hits=self.num_hits,
+            hit_rate=self.num_hits / claims if claims > 0 else 0.0,
+            mean_claim_latency=sum(self.claim_latencies) /
+            claims if claims > 0 else 0.0
+        )
@@ -1,8 +1,13 @@
 from dataclasses import dataclass
+import csv
 import os
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Sequence, Union, overload
 from simulation.shared.env_vars import EnvVarName
-from simulation.config.config import ZOOKEEPER_BARRIER_PATH, ZOOKEEPER_CLIENT_ENDPOINT
+from simulation.config.config import (SIMULATION_DIR, WORKLOADS_CATALOG_PATH, ZOOKEEPER_BARRIER_PATH, ZOOKEEPER_CLIENT_ENDPOINT,
+                                      ZOOKEEPER_TELEMETRY_PATH)
+
+CATALOG_HEADER: List[str] = ["task_name", "workload_param", "workload_modifier",
+                             "file_name", "target_col", "n_rows", "n_test"]
 
 
 @dataclass(frozen=True)
@@ -26,34 +31,85 @@ class Workload:
     task: Task
 
 
-WORKLOADS: List[Workload] = [
-    Workload(time_series=Series(file_name="nyc_taxi_1.csv"),
-             task=Task(task_name="affinity", workload_param="--affinity-ops", workload_modifier=400000)),
-    Workload(time_series=Series(file_name="nyc_taxi_2.csv"),
-     task=Task(task_name="atomic", workload_param="--atomic-ops", workload_modifier=250000)),
-    Workload(time_series=Series(file_name="nyc_taxi_3.csv"),
-             task=Task(task_name="bsearch", workload_param="--bsearch-ops", workload_modifier=4000)),
-    Workload(time_series=Series(file_name="nyc_taxi_4.csv"),
-             task=Task(task_name="cap", workload_param="--cap-ops", workload_modifier=2000000)),
-    Workload(time_series=Series(file_name="art_daily_small_noise.csv"),
-             task=Task(task_name="chmod", workload_param="--chmod-ops", workload_modifier=4000)),
-    Workload(time_series=Series(file_name="ambient_temperature_system_failure_1.csv"),
-             task=Task(task_name="memcpy", workload_param="--memcpy-ops", workload_modifier=4000)),
-    Workload(time_series=Series(file_name="ambient_temperature_system_failure_2.csv"),
-             task=Task(task_name="vecmath", workload_param="--vecmath-ops", workload_modifier=10000)),
-    Workload(time_series=Series(file_name="ambient_temperature_system_failure_3.csv"),
-             task=Task(task_name="zero", workload_param="--zero-ops", workload_modifier=1000000))
-
-
-    # Temporarily only test with 8 jobs
-    # Workload(time_series=Series(file_name="ambient_temperature_system_failure_1.csv"),
-    #          task=Task(task_name="matrix", workload_param="--matrix-ops", workload_modifier=40000)),
-    # Workload(time_series=Series(file_name="nyc_taxi_2.csv"),
-    #          task=Task(task_name="atomic", workload_param="--atomic-ops", workload_modifier=250000))
-]
-
-
-def get_env_vars(task: Task, num_tasks: int = len(WORKLOADS)) -> Dict[str, str]:
+class WorkloadCatalog(Sequence[Workload]):
+    """The workloads of a CSV catalog, one per row, with the columns of CATALOG_HEADER
+
+    The catalog is read the first time it is used, and a row is only turned into a Workload when it is
+    looked up, so catalogs of thousands of workloads are cheap to open. A workload is looked up by its
+    task name or by its id, which is its row in the catalog. A catalog is a sequence of its workloads,
+    so it can be passed wherever a list of workloads is read.
+
+    Args:
+        path (str): The catalog file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows: Optional[List[Dict[str, str]]] = None
+        self.ids: Dict[str, int] = {}
+        self.loaded_workloads: Dict[int, Workload] = {}
+
+    def get_rows(self) -> List[Dict[str, str]]:
+        if self.rows is None:
+            with open(self.path, newline="") as catalog_file:
+                reader: csv.DictReader = csv.DictReader(catalog_file)
+                missing_columns: List[str] = [column for column in CATALOG_HEADER
+                                              if column not in (reader.fieldnames or [])]
+                if len(missing_columns) > 0:
+                    raise ValueError(f"{self.path} has no {', '.join(missing_columns)} columns")
+                self.rows = list(reader)
+            self.ids = {row["task_name"]: workload_id for workload_id,
+                        row in enumerate(self.rows)}
+            if len(self.ids) != len(self.rows):
+                raise ValueError(f"The task names of {self.path} are not unique")
+        return self.rows
+
+    def __len__(self) -> int:
+        return len(self.get_rows())
+
+    def __iter__(self) -> Iterator[Workload]:
+        return (self[workload_id] for workload_id in range(len(self)))
+
+    @overload
+    def __getitem__(self, workload_id: int) -> Workload:
+        ...
+
+    @overload
+    def __getitem__(self, workload_id: slice) -> List[Workload]:
+        ...
+
+    def __getitem__(self, workload_id: Union[int, slice]) -> Union[Workload, List[Workload]]:
+        if isinstance(workload_id, slice):
+            return [self.get_workload(index) for index in range(len(self))[workload_id]]
+        return self.get_workload(range(len(self))[workload_id])
+
+    def get_workload(self, workload_id: int) -> Workload:
+        if workload_id not in self.loaded_workloads:
+            row: Dict[str, str] = self.get_rows()[workload_id]
+            self.loaded_workloads[workload_id] = Workload(
+                time_series=Series(file_name=row["file_name"], target_col=row["target_col"],
+                                   n_rows=int(row["n_rows"]), n_test=int(row["n_test"])),
+                task=Task(task_name=row["task_name"], workload_param=row["workload_param"],
+                          workload_modifier=int(row["workload_modifier"])))
+        return self.loaded_workloads[workload_id]
+
+    def get_id(self, task_name: str) -> int:
+        self.get_rows()
+        return self.ids[task_name]
+
+    def get(self, task_name: str) -> Workload:
+        return self[self.get_id(task_name)]
+
+
+# The gang is every workload of the catalog in the config, to simulate a gang of a different size use another catalog
+WORKLOAD_CATALOG: WorkloadCatalog = WorkloadCatalog(
+    SIMULATION_DIR + WORKLOADS_CATALOG_PATH)
+# Every workload of the gang, read from the catalog when it is first used rather than at import
+WORKLOADS: Sequence[Workload] = WORKLOAD_CATALOG
+
+
+def get_env_vars(task: Task, num_tasks: Optional[int] = None) -> Dict[str, str]:
+    num_tasks = num_tasks if num_tasks is not None else len(WORKLOADS)
     return {
         EnvVarName.NUM_TASKS.value: str(num_tasks),
         EnvVarName.JOB_NAME.value: task.task_name,
@@ -63,4 +119,15 @@ def get_env_vars(task: Task, num_tasks: int = len(WORKLOADS)) -> Dict[str, str]:
         EnvVarName.NUM_INSTANCES.value: "0",
         EnvVarName.ZOOKEEPER_CLIENT_ENDPOINT.value: ZOOKEEPER_CLIENT_ENDPOINT,
         EnvVarName.BARRIER_PATH.value: ZOOKEEPER_BARRIER_PATH,
+        EnvVarName.TELEMETRY_PATH.value: ZOOKEEPER_TELEMETRY_PATH,
+    }
+
+
+def get_warm_pool_env_vars(job_name: str, pool_path: str) -> Dict[str, str]:
+    return {
+        EnvVarName.JOB_NAME.value: job_name,
+        EnvVarName.WARM_POOL_PATH.value: pool_path,
+        EnvVarName.PYTHONUNBUFFERED.value: "1",
+        EnvVarName.ZOOKEEPER_CLIENT_ENDPOINT.value: ZOOKEEPER_CLIENT_ENDPOINT,
+        EnvVarName.BARRIER_PATH.value: ZOOKEEPER_BARRIER_PATH,
     }
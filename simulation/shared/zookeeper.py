@@ -1,18 +1,25 @@
-from kazoo.client import KazooClient
-from simulation.config.config import ZOOKEEPER_BARRIER_PATH
+from simulation.config.config import ZOOKEEPER_BARRIER_PATH, ZOOKEEPER_TELEMETRY_PATH
 from simulation.shared.workloads import Workload
-from typing import List
+from typing import TYPE_CHECKING, List, Sequence
 
+if TYPE_CHECKING:
+    from kazoo.client import KazooClient
 
-def delete_zookeeper_barrier(zk: KazooClient):
+
+def delete_zookeeper_barrier(zk: "KazooClient"):
     zk._delete_recursive(ZOOKEEPER_BARRIER_PATH)
 
-def delete_zookeeper_queues(zk: KazooClient, workloads: List[Workload]):
+def delete_zookeeper_queues(zk: "KazooClient", workloads: Sequence[Workload]):
     workload: Workload
     for workload in workloads:
         if zk.exists(workload.task.task_name):
             zk._delete_recursive(f"/{workload.task.task_name}")
 
-def reset_zookeeper(zk: KazooClient, workloads: List[Workload]):
+def delete_zookeeper_telemetry(zk: "KazooClient"):
+    if zk.exists(ZOOKEEPER_TELEMETRY_PATH):
+        zk._delete_recursive(ZOOKEEPER_TELEMETRY_PATH)
+
+def reset_zookeeper(zk: "KazooClient", workloads: Sequence[Workload]):
     delete_zookeeper_barrier(zk)
     delete_zookeeper_queues(zk, workloads)
+    delete_zookeeper_telemetry(zk)
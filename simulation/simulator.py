@@ -1,10 +1,7 @@
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Sequence
 import numpy
 import time
 from abc import ABC, abstractmethod
-from kazoo.client import KazooClient
-from kazoo.recipe.queue import LockingQueue
-from kazoo.recipe.barrier import DoubleBarrier
 
 import sys
 from pathlib import Path
@@ -12,14 +9,23 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 
-from simulation.gang_scheduling.resource_configurer import ResourceConfigurer, ConfigurationWindow
+from simulation.gang_scheduling.resource_configurer import ResourceConfigurer, ConfigurationWindow, RunResult
 from simulation.gang_scheduling.mpc import DynamicMPController, MPController, StaticMPController
-from simulation.forecaster.lstm_forecaster import get_actual_dict, get_predictions_dict
+from simulation.gang_scheduling.checkpoint_cost import (ReconfigurationEvent, create_reconfiguration_event, load_checkpoint_cost_model,
+                                                       save_events)
+from simulation.forecaster.forecast_data import get_actual_dict, get_predictions_dict
+from simulation.forecaster.online_forecaster import OnlineForecaster, get_workload_histories
 from simulation.shared.workloads import WORKLOADS, Workload, get_env_vars
 from simulation.config.config import (GANG_SCHEDULING_CHECKPOINT_PENALTY, GANG_SCHEDULING_STARTING_SHARES, ZOOKEEPER_CLIENT_ENDPOINT,
-                                      ZOOKEEPER_BARRIER_PATH, GANG_SCHEDULING_SIMULATION_LENGTH, GANG_SCHEDULING_WINDOW_SIZE)
-from simulation.shared.kube_api import kube_create_stress_job, kube_delete_job
+                                      ZOOKEEPER_BARRIER_PATH, GANG_SCHEDULING_SIMULATION_LENGTH, GANG_SCHEDULING_WINDOW_SIZE,
+                                      GANG_SCHEDULING_RECONFIGURATION_LOG_PATH, GANG_SCHEDULING_TELEMETRY_LOG_PATH,
+                                      ZOOKEEPER_TELEMETRY_PATH, SIMULATION_DIR)
+from simulation.shared.job_resizer import JobResizer
 from simulation.shared.zookeeper import reset_zookeeper
+from simulation.shared.telemetry import SuperstepRecord, TelemetryCollector
+from simulation.gang_scheduling.synthetic_workloads import perturb_durations
+from simulation.gang_scheduling.superstep_telemetry import (TaskSuperstep, create_task_supersteps, print_telemetry_summary,
+                                                            save_task_supersteps)
 
 
 class Simulator(ABC):
@@ -29,17 +35,26 @@ class Simulator(ABC):
 
     def __init__(self,
                  resource_configurer: ResourceConfigurer,
-                 workloads: List[Workload],
+                 workloads: Sequence[Workload],
                  actual: Dict[str, numpy.ndarray],
                  zookeeper_client_endpoint: str,
                  zookeeper_barrier_path: str,
-                 real_simulation: bool):
+                 real_simulation: bool,
+                 job_resizer: Optional[JobResizer] = None):
 
         self.resource_configurer = resource_configurer
         self.workloads = workloads
         self.actual = actual
         self.real_simulation = real_simulation
+        self.job_resizer: Optional[JobResizer] = job_resizer
         if self.real_simulation:
+            # the ZooKeeper and Kubernetes clients are only loaded for real simulations
+            from kazoo.client import KazooClient
+            from kazoo.recipe.queue import LockingQueue
+            from kazoo.recipe.barrier import DoubleBarrier
+            from simulation.shared.kube_api import KubeJobResizer
+            if self.job_resizer is None:
+                self.job_resizer = KubeJobResizer()
             self.zk = KazooClient(hosts=zookeeper_client_endpoint)
             self.zk.start()
             if self.zk.connected:
@@ -49,6 +64,8 @@ class Simulator(ABC):
             self.zk_queues: Dict[str, LockingQueue] = {
                 workload.task.task_name: LockingQueue(self.zk, f"{workload.task.task_name}") for workload in self.workloads
             }
+            self.telemetry_collector: TelemetryCollector = TelemetryCollector(
+                self.zk, ZOOKEEPER_TELEMETRY_PATH, [workload.task.task_name for workload in self.workloads])
 
         else:
             self.fake_resource_configurer = ResourceConfigurer(
@@ -58,16 +75,47 @@ class Simulator(ABC):
 
         self.current_config: Dict[str, int] = {
             workload.task.task_name: GANG_SCHEDULING_STARTING_SHARES for workload in self.workloads}
+        self.reconfiguration_events: List[ReconfigurationEvent] = []
+        self.reconfiguration_start: Optional[float] = None
+        self.previous_config: Dict[str, int] = {}
+        self.task_supersteps: List[TaskSuperstep] = []
+
+    def get_job_resizer(self) -> JobResizer:
+        """Get the job resizer, which only real simulations have
+
+        Raises:
+            ValueError: If the simulation is not real and was not given a job resizer
+        """
+        if self.job_resizer is None:
+            raise ValueError(
+                "Jobs can only be created, resized or deleted in a real simulation or with a job resizer")
+        return self.job_resizer
 
     def create_workloads_from_configuration(self, configuration: Dict[str, int]) -> None:
         workload: Workload
+        job_resizer: JobResizer = self.get_job_resizer()
         for workload in self.workloads:
-            kube_create_stress_job(env_vars=get_env_vars(
+            job_resizer.create_job(env_vars=get_env_vars(
                 task=workload.task, num_tasks=len(self.workloads)), cpu_shares=configuration[workload.task.task_name])
 
+    def resize_workloads_to_configuration(self, configuration: Dict[str, int]) -> None:
+        """Resize the running jobs whose CPU shares differ from the new configuration
+
+        Args:
+            configuration (Dict[str, int]): The new resource configuration
+        """
+        workload: Workload
+        job_resizer: JobResizer = self.get_job_resizer()
+        for workload in self.workloads:
+            cpu_shares: int = configuration[workload.task.task_name]
+            if cpu_shares != self.current_config[workload.task.task_name]:
+                job_resizer.resize_job(env_vars=get_env_vars(
+                    task=workload.task, num_tasks=len(self.workloads)), cpu_shares=cpu_shares)
+
     def delete_jobs(self) -> None:
+        job_resizer: JobResizer = self.get_job_resizer()
         for workload in self.workloads:
-            kube_delete_job(workload.task.task_name)
+            job_resizer.delete_job(workload.task.task_name)
         reset_zookeeper(self.zk, self.workloads)
 
     def simulate_timestep(self, time_step: int) -> float:
@@ -77,21 +125,51 @@ class Simulator(ABC):
             )
         self.zk_barrier.enter()
         start: float = time.time()
+        if self.reconfiguration_start is not None:
+            # The barrier only fills once every reconfigured job is running again
+            self.reconfiguration_events.append(create_reconfiguration_event(
+                time_step, self.previous_config, self.current_config, start - self.reconfiguration_start))
+            self.reconfiguration_start = None
         self.zk_barrier.leave()
         duration: float = time.time() - start
         print(
             f"Simulation timestep {time_step} has finished with duration {duration}")
+        self.collect_telemetry(time_step, duration)
         return duration
 
+    def collect_telemetry(self, time_step: int, barrier_time: float) -> None:
+        """Collect the records the jobs published during a time step, outside of the timed barrier
+        """
+        records: Dict[str, SuperstepRecord] = {job_name: job_records[-1] for job_name, job_records in
+                                               self.telemetry_collector.collect().items() if len(job_records) > 0}
+        task_supersteps: List[TaskSuperstep] = create_task_supersteps(
+            time_step, records, self.current_config, barrier_time, self.resource_configurer)
+        workloads: Dict[str, Workload] = {
+            workload.task.task_name: workload for workload in self.workloads}
+        self.resource_configurer.observe_runtimes([RunResult(workload=workloads[task_superstep.job_name],
+                                                             runtime=task_superstep.compute_time,
+                                                             workload_size=task_superstep.workload_size,
+                                                             cpu_shares=task_superstep.cpu_shares)
+                                                   for task_superstep in task_supersteps])
+        self.task_supersteps += task_supersteps
+
+    def report_telemetry(self) -> None:
+        save_task_supersteps(
+            SIMULATION_DIR + GANG_SCHEDULING_TELEMETRY_LOG_PATH, self.task_supersteps)
+        print_telemetry_summary(self.task_supersteps)
+
     def fake_simulate_timestep(self, time_step: int) -> float:
-        return self.fake_resource_configurer.calculate_estimated_runtime(
+        run_results: List[RunResult] = self.fake_resource_configurer.get_run_results(
             self.current_config,
             ConfigurationWindow(
                 simulation_time_step=time_step,
                 window_size=1,
                 starting_prediction=0
-            )
+            ),
+            forecast_step=0
         )
+        self.resource_configurer.observe_runtimes(run_results)
+        return max(run_result.runtime for run_result in run_results)
 
     @abstractmethod
     def simulate(self) -> float:
@@ -108,18 +186,20 @@ class StaticSimulator(Simulator):
 
     def __init__(self,
                  resource_configurer: ResourceConfigurer,
-                 workloads: List[Workload],
+                 workloads: Sequence[Workload],
                  actual: Dict[str, numpy.ndarray],
                  zookeeper_client_endpoint: str,
                  zookeeper_barrier_path: str,
-                 real_simulation: bool):
+                 real_simulation: bool,
+                 job_resizer: Optional[JobResizer] = None):
 
         super().__init__(resource_configurer=resource_configurer,
                          workloads=workloads,
                          actual=actual,
                          zookeeper_client_endpoint=zookeeper_client_endpoint,
                          zookeeper_barrier_path=zookeeper_barrier_path,
-                         real_simulation=real_simulation)
+                         real_simulation=real_simulation,
+                         job_resizer=job_resizer)
 
     def simulate(self) -> float:
         time_step: int
@@ -135,6 +215,7 @@ class StaticSimulator(Simulator):
             total_duration += duration
         if self.real_simulation:
             self.delete_jobs()
+            self.report_telemetry()
         print(f"Static simulation took {total_duration} total seconds")
         return total_duration
 
@@ -144,19 +225,31 @@ class MPCSimulator(Simulator):
     def __init__(self,
                  mpc: MPController,
                  resource_configurer: ResourceConfigurer,
-                 workloads: List[Workload],
+                 workloads: Sequence[Workload],
                  actual: Dict[str, numpy.ndarray],
                  zookeeper_client_endpoint: str,
                  zookeeper_barrier_path: str,
-                 real_simulation: bool):
+                 real_simulation: bool,
+                 job_resizer: Optional[JobResizer] = None,
+                 online_forecaster: Optional[OnlineForecaster] = None):
 
         super().__init__(resource_configurer=resource_configurer,
                          workloads=workloads,
                          actual=actual,
                          zookeeper_client_endpoint=zookeeper_client_endpoint,
                          zookeeper_barrier_path=zookeeper_barrier_path,
-                         real_simulation=real_simulation)
+                         real_simulation=real_simulation,
+                         job_resizer=job_resizer)
         self.mpc = mpc
+        # When set, the predictions of every time step come from the workloads observed so far
+        self.online_forecaster = online_forecaster
+
+    def observe_workloads(self) -> Iterator[Dict[str, float]]:
+        """Yield the workload sizes of every job, one time step at a time, as the time steps finish
+        """
+        time_step: int
+        for time_step in range(GANG_SCHEDULING_SIMULATION_LENGTH):
+            yield {job_name: workload_size[time_step][0] for job_name, workload_size in self.actual.items()}
 
     def create_new_configuration_from_window(self, time_step: int, window_size: int) -> None:
         print(f"Creating configuration for window size of {window_size}")
@@ -169,8 +262,11 @@ class MPCSimulator(Simulator):
         )
         if self.real_simulation:
             if time_step != 0:
-                self.delete_jobs()
-            self.create_workloads_from_configuration(new_configuration)
+                self.reconfiguration_start = time.time()
+                self.previous_config = self.current_config
+                self.resize_workloads_to_configuration(new_configuration)
+            else:
+                self.create_workloads_from_configuration(new_configuration)
         self.current_config = new_configuration
         print(new_configuration)
 
@@ -178,7 +274,13 @@ class MPCSimulator(Simulator):
         time_step: int
         total_duration: float = 0
         num_checkpoints: int = 0
+        forecast_stream: Optional[Iterator[Dict[str, numpy.ndarray]]] = self.online_forecaster.stream(
+            self.observe_workloads()) if self.online_forecaster is not None else None
         for time_step in range(GANG_SCHEDULING_SIMULATION_LENGTH):
+            if forecast_stream is not None:
+                # pulls the workloads of the previous time step, which has finished by now
+                self.resource_configurer.update_predictions(
+                    time_step, next(forecast_stream))
             window_size = self.mpc.calculate_time_horizon(
                 time_step, self.current_config)
             if window_size != 0:
@@ -192,6 +294,13 @@ class MPCSimulator(Simulator):
 
         if self.real_simulation:
             self.delete_jobs()
+            save_events(SIMULATION_DIR + GANG_SCHEDULING_RECONFIGURATION_LOG_PATH,
+                        self.reconfiguration_events)
+            self.report_telemetry()
+            print(
+                f"Measured reconfiguration latency was {sum(event.latency for event in self.reconfiguration_events)} total seconds")
+        if self.online_forecaster is not None:
+            self.online_forecaster.report_latency()
         print(
             f"Simulation took {total_duration} total seconds, with {num_checkpoints} Checkpoints")
         print(
@@ -237,6 +346,52 @@ def get_duration_from_plan(resource_configurer: ResourceConfigurer, mpc_plan: nu
     print(f"{duration + checkpoints * GANG_SCHEDULING_CHECKPOINT_PENALTY}")
 
 
+def drift_workload_models(resource_configurer: ResourceConfigurer, seed: int = 0) -> None:
+    """Make the workloads of a resource configurer run slower or faster than profiled, by a random factor
+    for every workload that also changes with the CPU shares, as if the cluster had changed since profiling
+    """
+    rng: numpy.random.Generator = numpy.random.default_rng(seed)
+    profiling_df = resource_configurer.profiling_df
+    task_column, _, shares_column, duration_column = profiling_df.columns[:4]
+    workload: Workload
+    for workload in resource_configurer.workloads:
+        rows = profiling_df[task_column] == workload.task.task_name
+        profiling_df.loc[rows, duration_column] = perturb_durations(
+            profiling_df.loc[rows, duration_column], profiling_df.loc[rows, shares_column], rng)
+    resource_configurer.workload_models = resource_configurer.create_workload_models()
+
+
+def simulate_model_refinement() -> None:
+    """Simulate MPC on workloads that have drifted from their profile, planning with the profiled workload
+    models, with the workload models refined from the observed runtimes, and with the drifted workload models
+    """
+    actual: Dict[str, numpy.ndarray] = get_actual_dict(WORKLOADS)
+    durations: Dict[str, float] = {}
+    planner: str
+    for planner in ["profiled", "refined", "drifted"]:
+        resource_configurer: ResourceConfigurer = ResourceConfigurer(
+            workloads=WORKLOADS, predictions=actual)
+        if planner == "refined":
+            resource_configurer.refine_workload_models()
+        elif planner == "drifted":
+            drift_workload_models(resource_configurer)
+        mpc_simulator: MPCSimulator = MPCSimulator(
+            mpc=StaticMPController(
+                resource_configurer=resource_configurer,
+                window_size=GANG_SCHEDULING_WINDOW_SIZE,
+                simulation_length=GANG_SCHEDULING_SIMULATION_LENGTH),
+            resource_configurer=resource_configurer,
+            workloads=WORKLOADS,
+            actual=actual,
+            zookeeper_client_endpoint=ZOOKEEPER_CLIENT_ENDPOINT,
+            zookeeper_barrier_path=ZOOKEEPER_BARRIER_PATH,
+            real_simulation=False)
+        drift_workload_models(mpc_simulator.fake_resource_configurer)
+        durations[planner] = mpc_simulator.simulate()
+    for planner, duration in durations.items():
+        print(f"Planning with the {planner} workload models took {duration} total seconds")
+
+
 def main() -> None:
 
     predictions: Dict[str, numpy.ndarray] = get_predictions_dict(WORKLOADS)
@@ -273,7 +428,9 @@ def main() -> None:
     dynamic_mpc: MPController = DynamicMPController(
         resource_configurer=resource_configurer,
         window_size=GANG_SCHEDULING_WINDOW_SIZE,
-        simulation_length=GANG_SCHEDULING_SIMULATION_LENGTH
+        simulation_length=GANG_SCHEDULING_SIMULATION_LENGTH,
+        checkpoint_cost_model=load_checkpoint_cost_model(
+            SIMULATION_DIR + GANG_SCHEDULING_RECONFIGURATION_LOG_PATH)
     )
     mpc_simulator = MPCSimulator(
         mpc=dynamic_mpc,
@@ -287,6 +444,25 @@ def main() -> None:
 
     mpc_simulator.simulate()
 
+    # the same dynamic MPC, with predictions from the workloads observed during the simulation
+    online_resource_configurer: ResourceConfigurer = ResourceConfigurer(
+        workloads=WORKLOADS, predictions={})
+    online_simulator: MPCSimulator = MPCSimulator(
+        mpc=DynamicMPController(
+            resource_configurer=online_resource_configurer,
+            window_size=GANG_SCHEDULING_WINDOW_SIZE,
+            simulation_length=GANG_SCHEDULING_SIMULATION_LENGTH),
+        resource_configurer=online_resource_configurer,
+        workloads=WORKLOADS,
+        actual=actual,
+        zookeeper_client_endpoint=ZOOKEEPER_CLIENT_ENDPOINT,
+        zookeeper_barrier_path=ZOOKEEPER_BARRIER_PATH,
+        real_simulation=False,
+        online_forecaster=OnlineForecaster(
+            WORKLOADS).fit(get_workload_histories(WORKLOADS))
+    )
+    online_simulator.simulate()
+
 
 if __name__ == "__main__":
     # main()
@@ -0,0 +1,225 @@
+import numpy
+from typing import Callable, Dict, List, Optional, Tuple, Sequence
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.gang_scheduling.workload_models import ScatteredWorkloadModel
+from simulation.shared.workloads import WORKLOADS, Workload
+from simulation.config.config import (PROFILER_ADAPTIVE_ERROR_TARGET, PROFILER_ADAPTIVE_MAX_FRACTION,
+                                      PROFILER_ADAPTIVE_MIN_IMPROVEMENT, PROFILER_ADAPTIVE_PATIENCE, PROFILER_MAX_SHARES,
+                                      PROFILER_MIN_SHARES, PROFILER_OUTPUT_PATH, PROFILER_SHARE_INCREMENT, SIMULATION_DIR,
+                                      SIMULATION_MAX_WORKLOAD, SIMULATION_MIN_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT)
+
+Point = Tuple[int, int]
+
+
+class AdaptiveSampler:
+    """Chooses the (workload size, CPU shares) points to profile for one workload
+
+    Sampling starts from a coarse grid. After every batch the runtime surface is fitted to the
+    measured points, and the next batch is taken where the leave-one-out error of the nearby points
+    is highest and the measured points are furthest away. Sampling stops once the relative RMS
+    leave-one-out error meets the target, once it has converged, or once the maximum fraction of the full
+    grid has been measured. The error converges to the run-to-run noise of the workload, which is often
+    above the target, so it has converged when the last patience fits improved the best error of the
+    earlier fits by less than min_improvement.
+
+    Args:
+        error_target (float, optional): Target RMS leave-one-out error, relative to the mean duration.
+            Defaults to PROFILER_ADAPTIVE_ERROR_TARGET.
+        max_fraction (float, optional): The most points to measure, as a fraction of the full grid.
+            Defaults to PROFILER_ADAPTIVE_MAX_FRACTION.
+        min_improvement (float, optional): Smallest relative improvement of the error that keeps sampling.
+            Defaults to PROFILER_ADAPTIVE_MIN_IMPROVEMENT.
+        patience (int, optional): Number of fits the error may improve by less than min_improvement.
+            Defaults to PROFILER_ADAPTIVE_PATIENCE.
+        coarse_size (int, optional): Number of values of each axis in the starting grid. Defaults to 4.
+        batch_size (int, optional): Number of points measured between fits. Defaults to 4.
+        num_neighbors (int, optional): Number of measured points whose error is attributed to a candidate. Defaults to 3.
+        candidates (Optional[List[Point]], optional): The points that may be sampled. Defaults to the full grid
+            of workload sizes and CPU shares of the profiler.
+    """
+
+    def __init__(self,
+                 error_target: float = PROFILER_ADAPTIVE_ERROR_TARGET,
+                 max_fraction: float = PROFILER_ADAPTIVE_MAX_FRACTION,
+                 min_improvement: float = PROFILER_ADAPTIVE_MIN_IMPROVEMENT,
+                 patience: int = PROFILER_ADAPTIVE_PATIENCE,
+                 coarse_size: int = 4,
+                 batch_size: int = 4,
+                 num_neighbors: int = 3,
+                 candidates: Optional[List[Point]] = None):
+        self.error_target = error_target
+        self.min_improvement = min_improvement
+        self.patience = patience
+        self.batch_size = batch_size
+        self.num_neighbors = num_neighbors
+        self.workload_sizes: List[int] = list(range(
+            SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT))
+        self.cpu_shares: List[int] = list(
+            range(PROFILER_MIN_SHARES, PROFILER_MAX_SHARES, PROFILER_SHARE_INCREMENT))
+        self.candidates: List[Point] = candidates if candidates is not None else [
+            (workload_size, cpu_shares) for workload_size in self.workload_sizes for cpu_shares in self.cpu_shares]
+        self.max_points: int = int(len(self.candidates) * max_fraction)
+        self.coarse_size = coarse_size
+        self.measurements: Dict[Point, float] = {}
+        self.relative_error: float = float("inf")
+        # The relative error after every fit
+        self.errors: List[float] = []
+        # Why sampling stopped, None while it has not
+        self.stop_reason: Optional[str] = None
+
+    def get_coarse_points(self) -> List[Point]:
+        size_indices: numpy.ndarray = numpy.unique(numpy.linspace(
+            0, len(self.workload_sizes) - 1, self.coarse_size).round().astype(int))
+        share_indices: numpy.ndarray = numpy.unique(numpy.linspace(
+            0, len(self.cpu_shares) - 1, self.coarse_size).round().astype(int))
+        coarse_points: List[Point] = [(self.workload_sizes[i], self.cpu_shares[j])
+                                      for i in size_indices for j in share_indices]
+        return [point for point in coarse_points if point in self.candidates]
+
+    def add_measurement(self, point: Point, duration: float) -> None:
+        self.measurements[point] = duration
+
+    def fit(self) -> Tuple[ScatteredWorkloadModel, numpy.ndarray]:
+        """Fit the surface to the measured points and update the relative error
+
+        Returns:
+            Tuple[ScatteredWorkloadModel, numpy.ndarray]: The model, and the leave-one-out error of every measured point
+        """
+        points: numpy.ndarray = numpy.array(list(self.measurements))
+        durations: numpy.ndarray = numpy.array(
+            list(self.measurements.values()))
+        model: ScatteredWorkloadModel = ScatteredWorkloadModel(
+            points[:, 0], points[:, 1], durations)
+        errors: numpy.ndarray = model.get_leave_one_out_errors()
+        self.relative_error = float(
+            numpy.sqrt(numpy.mean(errors ** 2)) / numpy.mean(numpy.abs(durations)))
+        return model, errors
+
+    def has_converged(self) -> bool:
+        if len(self.errors) <= self.patience:
+            return False
+        return min(self.errors[-self.patience:]) > (1 - self.min_improvement) * min(self.errors[:-self.patience])
+
+    def get_stop_reason(self) -> Optional[str]:
+        if self.relative_error <= self.error_target:
+            return "error target"
+        if self.has_converged():
+            return "converged"
+        if len(self.measurements) >= self.max_points:
+            return "point budget"
+        if len(self.measurements) >= len(self.candidates):
+            return "grid exhausted"
+        return None
+
+    def get_next_points(self, errors: numpy.ndarray) -> List[Point]:
+        """Pick the next batch of points to measure
+
+        Every unmeasured point is scored by the mean absolute leave-one-out error of its nearest measured
+        points, times its distance to the nearest measured point. Points are picked greedily, and each
+        pick counts as measured when scoring the rest of the batch, so a batch is spread out.
+        """
+        unmeasured: List[Point] = [
+            point for point in self.candidates if point not in self.measurements]
+        measured: numpy.ndarray = numpy.array(list(self.measurements))
+        normalized_measured: numpy.ndarray = ScatteredWorkloadModel.normalize(
+            measured[:, 0], measured[:, 1])
+        normalized_unmeasured: numpy.ndarray = ScatteredWorkloadModel.normalize(
+            numpy.array([point[0] for point in unmeasured], dtype="float64"),
+            numpy.array([point[1] for point in unmeasured], dtype="float64"))
+        distances: numpy.ndarray = numpy.linalg.norm(
+            normalized_unmeasured[:, None, :] - normalized_measured[None, :, :], axis=2)
+        nearest: numpy.ndarray = numpy.argsort(distances, axis=1)[
+            :, :self.num_neighbors]
+        uncertainty: numpy.ndarray = numpy.abs(errors)[nearest].mean(axis=1)
+        min_distances: numpy.ndarray = distances.min(axis=1)
+
+        next_points: List[Point] = []
+        for _ in range(min(self.batch_size, len(unmeasured), self.max_points - len(self.measurements))):
+            best: int = int(numpy.argmax(uncertainty * min_distances))
+            next_points.append(unmeasured[best])
+            min_distances = numpy.minimum(min_distances, numpy.linalg.norm(
+                normalized_unmeasured - normalized_unmeasured[best], axis=1))
+        return next_points
+
+    def run(self, measure: Callable[[List[Point]], List[float]]) -> Dict[Point, float]:
+        """Sample the workload until the error target is met, the error has converged or the point budget is spent
+
+        Args:
+            measure (Callable[[List[Point]], List[float]]): Measures the duration of a batch of points
+
+        Returns:
+            Dict[Point, float]: The measured duration of every sampled point
+        """
+        points: List[Point] = self.get_coarse_points()
+        while len(points) > 0:
+            for point, duration in zip(points, measure(points)):
+                self.add_measurement(point, duration)
+            errors: numpy.ndarray = self.fit()[1]
+            self.errors.append(self.relative_error)
+            self.stop_reason = self.get_stop_reason()
+            if self.stop_reason is not None:
+                break
+            points = self.get_next_points(errors)
+        return self.measurements
+
+
+def get_relative_error(model: ScatteredWorkloadModel, points: numpy.ndarray, durations: numpy.ndarray,
+                       mean_duration: float) -> float:
+    errors: numpy.ndarray = model(
+        points[:, 0], points[:, 1], grid=False) - durations
+    return float(numpy.sqrt(numpy.mean(errors ** 2)) / mean_duration)
+
+
+def evaluate_adaptive_sampling(workloads: Sequence[Workload], test_fraction: float = 0.25, seed: int = 0) -> None:
+    """Replay the full-grid profile to compare adaptive sampling against profiling every point
+
+    A random test set of grid points is held out. The full-grid model is fitted on every other point,
+    and the adaptive sampler may only sample those other points. Both are scored on the test set.
+    """
+    # pandas is only a development package, which the profiler image does not install
+    import pandas
+
+    profiling_df: pandas.DataFrame = pandas.read_csv(
+        SIMULATION_DIR + PROFILER_OUTPUT_PATH, skipinitialspace=True)
+    random: numpy.random.Generator = numpy.random.default_rng(seed)
+    print(f"{'task':>10}{'points':>12}{'full-grid error':>18}{'adaptive error':>16}  stop reason")
+    workload: Workload
+    for workload in workloads:
+        task_df: pandas.DataFrame = profiling_df[profiling_df[profiling_df.columns[0]]
+                                                 == workload.task.task_name]
+        durations: Dict[Point, float] = {(int(row[1]), int(row[2])): float(row[3])
+                                         for row in task_df.itertuples(index=False)}
+        points: List[Point] = list(durations)
+        is_test: numpy.ndarray = random.random(len(points)) < test_fraction
+        train_points: List[Point] = [point for point, test in zip(points, is_test) if not test]
+        test_points: numpy.ndarray = numpy.array(
+            [point for point, test in zip(points, is_test) if test])
+        test_durations: numpy.ndarray = numpy.array(
+            [durations[(point[0], point[1])] for point in test_points])
+        mean_duration: float = float(numpy.mean(list(durations.values())))
+
+        sampler: AdaptiveSampler = AdaptiveSampler(candidates=train_points)
+        measurements: Dict[Point, float] = sampler.run(
+            lambda batch: [durations[point] for point in batch])
+        full_model: ScatteredWorkloadModel = ScatteredWorkloadModel(
+            numpy.array([point[0] for point in train_points]), numpy.array([point[1] for point in train_points]),
+            numpy.array([durations[point] for point in train_points]))
+        full_error: float = get_relative_error(
+            full_model, test_points, test_durations, mean_duration)
+        adaptive_error: float = get_relative_error(
+            sampler.fit()[0], test_points, test_durations, mean_duration)
+        print(f"{workload.task.task_name:>10}{len(measurements):>6}/{len(train_points):<5}"
+              f"{full_error:>18.4f}{adaptive_error:>16.4f}  {sampler.stop_reason}")
+
+
+def main():
+    evaluate_adaptive_sampling(WORKLOADS)
+
+
+if __name__ == "__main__":
+    main()
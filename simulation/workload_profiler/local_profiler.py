@@ -0,0 +1,280 @@
+import math
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simulation.shared.workloads import WORKLOADS, Task
+from simulation.workload_profiler.adaptive_sampler import AdaptiveSampler, Point
+from simulation.workload_profiler.profile_store import ProfilePoint, ProfileStore, Timing, is_precise, summarize_durations
+from simulation.config.config import (PROFILER_ADAPTIVE_ERROR_TARGET, PROFILER_MAX_SHARES, PROFILER_MAX_TRIES, PROFILER_MIN_SHARES,
+                                      PROFILER_SHARE_INCREMENT, PROFILER_TRIES, SIMULATION_DIR, SIMULATION_MAX_WORKLOAD,
+                                      SIMULATION_MIN_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT)
+
+STRESS_NG_COMMAND: str = "stress-ng"
+# How often the CPU time of a kernel is checked against its CPU shares, in seconds
+THROTTLE_INTERVAL: float = 0.01
+CLOCK_TICKS: int = os.sysconf("SC_CLK_TCK")
+THREAD_COUNT_VARIABLES: List[str] = [
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+# (task, workload size, CPU shares)
+TaskPoint = Tuple[Task, int, int]
+
+
+@dataclass(frozen=True)
+class PythonKernel:
+    script: str
+    matrix_size: int
+
+
+# In-repo kernels, run with the workload size times the workload modifier as the number of iterations
+PYTHON_KERNELS: Dict[str, PythonKernel] = {
+    "matmul": PythonKernel(script=f"{SIMULATION_DIR}/jobs/matmul.py", matrix_size=2000),
+    "eigen": PythonKernel(script=f"{SIMULATION_DIR}/jobs/eigen.py", matrix_size=300),
+}
+LOCAL_TASKS: List[Task] = [Task(task_name=task_name, workload_param="NUM_ITERATIONS", workload_modifier=1)
+                           for task_name in PYTHON_KERNELS]
+
+
+def get_kernel_command(task: Task, workload_size: int, num_cores: int) -> Tuple[List[str], Dict[str, str]]:
+    """Get the command and environment that run a task locally
+
+    In-repo kernels run as Python scripts, every other task runs the same stress-ng command as the
+    stress-ng job, with one stress-ng instance per core.
+
+    Returns:
+        Tuple[List[str], Dict[str, str]]: The command and its environment variables
+    """
+    env: Dict[str, str] = dict(os.environ)
+    for variable in THREAD_COUNT_VARIABLES:
+        env[variable] = str(num_cores)
+    operations: str = str(task.workload_modifier * workload_size)
+    if task.task_name in PYTHON_KERNELS:
+        kernel: PythonKernel = PYTHON_KERNELS[task.task_name]
+        env[task.workload_param] = operations
+        env["MATRIX_SIZE"] = str(kernel.matrix_size)
+        return [sys.executable, kernel.script], env
+    return [STRESS_NG_COMMAND, "--metrics", f"--{task.task_name}", str(num_cores), task.workload_param, operations], env
+
+
+def get_session_cpu_time(session_id: int) -> float:
+    """Get the CPU time used by every process of a session, including the children they have waited for
+
+    Returns:
+        float: The CPU time in seconds
+    """
+    cpu_ticks: int = 0
+    pid: str
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as stat_file:
+                # the fields after the command name, from the state onwards
+                fields: List[str] = stat_file.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[3]) == session_id:
+            # utime, stime, cutime and cstime
+            cpu_ticks += sum(int(field) for field in fields[11:15])
+    return cpu_ticks / CLOCK_TICKS
+
+
+def run_throttled(command: List[str], env: Dict[str, str], cores: List[int], cpu_shares: int) -> Tuple[float, float]:
+    """Run a kernel on the given cores, pausing it whenever it gets ahead of its CPU shares
+
+    Like a CPU limit of cpu_shares millicores, the kernel may use cpu_shares / 1000 cores on average.
+    Every THROTTLE_INTERVAL its CPU time is compared with that allowance, and the kernel is stopped
+    while it has used more and continued once the allowance has caught up. The standard error of the
+    kernel goes to a temporary file rather than a pipe, which nothing reads while the kernel runs.
+
+    Returns:
+        Tuple[float, float]: The wall-clock duration of the kernel and the time it was stopped for, in seconds
+
+    Raises:
+        RuntimeError: If the kernel exits with a non-zero code, with its standard error in the message
+    """
+    stderr_file = tempfile.TemporaryFile()
+    start: float = time.perf_counter()
+    process: subprocess.Popen = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=stderr_file,
+                                                 start_new_session=True, preexec_fn=lambda: os.sched_setaffinity(0, cores))
+    stopped: bool = False
+    stopped_since: float = 0.0
+    throttled_time: float = 0.0
+    try:
+        while True:
+            try:
+                process.wait(THROTTLE_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            allowance: float = cpu_shares / 1000 * \
+                (time.perf_counter() - start)
+            over_allowance: bool = get_session_cpu_time(
+                process.pid) > allowance
+            if over_allowance != stopped:
+                os.killpg(process.pid, signal.SIGSTOP if over_allowance else signal.SIGCONT)
+                stopped = over_allowance
+                if stopped:
+                    stopped_since = time.perf_counter()
+                else:
+                    throttled_time += time.perf_counter() - stopped_since
+        duration: float = time.perf_counter() - start
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            stderr: str = stderr_file.read().decode(errors="replace").strip()
+            raise RuntimeError(
+                f"{' '.join(command)} exited with code {process.returncode}: {stderr}")
+    finally:
+        stderr_file.close()
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+    return duration, throttled_time
+
+
+def time_kernel(task: Task, workload_size: int, cpu_shares: int, cores: List[int]) -> Timing:
+    """Time a task repeatedly until its mean duration is known precisely enough, like WorkloadProfiler.time_workload
+    """
+    command, env = get_kernel_command(task, workload_size, len(cores))
+    durations: List[float] = []
+    throttled_times: List[float] = []
+    while len(durations) < max(PROFILER_TRIES, PROFILER_MAX_TRIES):
+        duration, throttled_time = run_throttled(
+            command, env, cores, cpu_shares)
+        durations.append(duration)
+        throttled_times.append(throttled_time)
+        if len(durations) >= PROFILER_TRIES and is_precise(durations):
+            break
+    return summarize_durations(durations, throttled_times=throttled_times)
+
+
+class LocalWorkloadProfiler:
+    """Profiles workloads on this machine, without Kubernetes, ZooKeeper or cgroups
+
+    Every point runs its kernel as a local process, pinned to as many cores as its CPU shares round up
+    to and throttled to its CPU shares. Points run in parallel in a process pool, each on its own cores,
+    so they do not compete for CPU time. The results go to the same profile as WorkloadProfiler's.
+
+    Args:
+        cores (Optional[List[int]], optional): The cores to profile on. Defaults to every core this process may use.
+        profile_store (Optional[ProfileStore], optional): Where the results are logged. Defaults to the profiling output.
+    """
+
+    def __init__(self, cores: Optional[List[int]] = None, profile_store: Optional[ProfileStore] = None):
+        self.cores: List[int] = sorted(
+            cores if cores is not None else os.sched_getaffinity(0))
+        self.profile_store: ProfileStore = profile_store if profile_store is not None else ProfileStore()
+
+    def get_num_cores(self, cpu_shares: int) -> int:
+        return min(math.ceil(cpu_shares / 1000), len(self.cores))
+
+    def profile_points(self, points: List[TaskPoint]) -> Dict[ProfilePoint, Timing]:
+        """Profile points in parallel, each on its own cores
+
+        The points with the most CPU shares are started first, and whenever a point finishes, the first
+        waiting points that fit in the free cores are started. Points finished by an earlier run are not
+        profiled again.
+
+        Returns:
+            Dict[ProfilePoint, Timing]: The timing of every point
+        """
+        timings: Dict[ProfilePoint, Timing] = {}
+        pending: List[TaskPoint] = []
+        point: TaskPoint
+        for point in points:
+            completed: Optional[Timing] = self.profile_store.get_timing(*point)
+            if completed is not None:
+                timings[(point[0].task_name, point[1], point[2])] = completed
+            else:
+                pending.append(point)
+        pending.sort(key=lambda point: point[2], reverse=True)
+
+        free_cores: List[int] = list(self.cores)
+        running: Dict[Future, Tuple[TaskPoint, List[int]]] = {}
+        with ProcessPoolExecutor(max_workers=len(self.cores)) as pool:
+            while len(pending) > 0 or len(running) > 0:
+                waiting: List[TaskPoint] = []
+                for point in pending:
+                    num_cores: int = self.get_num_cores(point[2])
+                    if num_cores > len(free_cores):
+                        waiting.append(point)
+                        continue
+                    cores: List[int] = free_cores[:num_cores]
+                    del free_cores[:num_cores]
+                    running[pool.submit(time_kernel, *point, cores)] = (point, cores)
+                pending = waiting
+                future: Future
+                for future in wait(running, return_when=FIRST_COMPLETED).done:
+                    point, cores = running.pop(future)
+                    free_cores += cores
+                    task, workload_size, cpu_shares = point
+                    timing: Timing = future.result()
+                    self.profile_store.log_timing(
+                        task, workload_size, cpu_shares, timing)
+                    timings[(task.task_name, workload_size, cpu_shares)] = timing
+        return timings
+
+    def check_cores(self) -> None:
+        if PROFILER_MAX_SHARES - PROFILER_SHARE_INCREMENT > 1000 * len(self.cores):
+            print(f"Only {len(self.cores)} cores are available, so CPU shares above {1000 * len(self.cores)} "
+                  f"are not met and their points are profiled with {len(self.cores)} full cores")
+
+    def profile_resource_configurations(self, tasks: List[Task]) -> None:
+        """Profile every task over the full grid of workload sizes and CPU shares
+        """
+        self.check_cores()
+        start: float = time.time()
+        self.profile_points([(task, workload_size, cpu_shares) for task in tasks
+                             for cpu_shares in range(PROFILER_MIN_SHARES, PROFILER_MAX_SHARES, PROFILER_SHARE_INCREMENT)
+                             for workload_size in range(SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT)])
+        print(
+            f"Profiling {len(tasks)} tasks on {len(self.cores)} cores took {time.time() - start} seconds")
+        self.profile_store.close()
+
+    def profile_task_adaptive(self, task: Task, sampler: AdaptiveSampler) -> Dict[Point, float]:
+        """Profile a task only at the points the sampler picks, like WorkloadProfiler.profile_task_adaptive,
+        with the points of every batch profiled in parallel
+        """
+        def measure(points: List[Point]) -> List[float]:
+            timings: Dict[ProfilePoint, Timing] = self.profile_points(
+                [(task, workload_size, cpu_shares) for workload_size, cpu_shares in points])
+            return [timings[(task.task_name, workload_size, cpu_shares)].duration for workload_size, cpu_shares in points]
+
+        measurements: Dict[Point, float] = sampler.run(measure)
+        print(f"Profiled {task.task_name} at {len(measurements)} points, "
+              f"relative leave-one-out error {sampler.relative_error:.4f}, stopped on {sampler.stop_reason}")
+        return measurements
+
+    def profile_resource_configurations_adaptive(self, tasks: List[Task],
+                                                 error_targets: Optional[Dict[str, float]] = None) -> None:
+        error_targets = error_targets if error_targets is not None else {}
+        self.check_cores()
+        task: Task
+        for task in tasks:
+            self.profile_task_adaptive(task, AdaptiveSampler(
+                error_target=error_targets.get(task.task_name, PROFILER_ADAPTIVE_ERROR_TARGET)))
+        self.profile_store.close()
+
+
+def main():
+    tasks: List[Task] = [workload.task for workload in WORKLOADS]
+    if shutil.which(STRESS_NG_COMMAND) is None:
+        print(f"{STRESS_NG_COMMAND} is not installed, profiling the in-repo kernels instead")
+        tasks = LOCAL_TASKS
+    LocalWorkloadProfiler().profile_resource_configurations(tasks)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,13 @@
 import pandas
 import seaborn
 import matplotlib.pyplot as plt
-from typing import List
+from typing import List, Sequence
 
 from simulation.config.config import SIMULATION_DIR, PROFILER_OUTPUT_PATH
 from simulation.shared.workloads import Workload, WORKLOADS
 
 
-def generate_workload_figures(workloads: List[Workload]):
+def generate_workload_figures(workloads: Sequence[Workload]):
     print(SIMULATION_DIR + PROFILER_OUTPUT_PATH)
     df: pandas.DataFrame = pandas.read_csv(
         SIMULATION_DIR + PROFILER_OUTPUT_PATH)
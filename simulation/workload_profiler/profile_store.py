@@ -0,0 +1,125 @@
+import math
+import statistics
+import threading
+from dataclasses import dataclass
+from scipy import stats
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from simulation.shared.workloads import Task
+from simulation.workload_profiler.stat_logger import StatLogger, read_rows
+from simulation.config.config import (PROFILER_CI_WIDTH_TARGET, PROFILER_MANIFEST_PATH, PROFILER_OUTPUT_PATH, SIMULATION_DIR,
+                                      SIMULATION_MAX_WORKLOAD, SIMULATION_MIN_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT)
+
+CSV_HEADER: List[str] = ["task", "workload_size", "cpu_shares", "duration",
+                          "variance", "num_samples", "overhead", "throttled_time"]
+MANIFEST_HEADER: List[str] = ["task", "workload_size", "cpu_shares"]
+CONFIDENCE_LEVEL: float = 0.95
+
+# (task name, workload size, CPU shares)
+ProfilePoint = Tuple[str, int, int]
+
+
+@dataclass(frozen=True)
+class Timing:
+    # mean duration over the samples
+    duration: float
+    # sample variance of the duration, 0 for a single sample
+    variance: float
+    num_samples: int
+    # mean time the profiler measured on top of the duration the job reported, 0 without job telemetry
+    overhead: float = 0.0
+    # mean time the job was throttled for
+    throttled_time: float = 0.0
+
+
+def summarize_durations(durations: List[float], overheads: Optional[List[float]] = None,
+                        throttled_times: Optional[List[float]] = None) -> Timing:
+    return Timing(duration=statistics.mean(durations),
+                  variance=statistics.variance(durations) if len(durations) > 1 else 0.0,
+                  num_samples=len(durations),
+                  overhead=statistics.mean(overheads) if overheads else 0.0,
+                  throttled_time=statistics.mean(throttled_times) if throttled_times else 0.0)
+
+
+def is_precise(durations: List[float], ci_width_target: float = PROFILER_CI_WIDTH_TARGET) -> bool:
+    """Check whether the confidence interval of the mean duration is narrow enough
+
+    Returns:
+        bool: True if the half-width of the confidence interval is within ci_width_target of the mean
+    """
+    if len(durations) < 2:
+        return False
+    half_width: float = stats.t.ppf((1 + CONFIDENCE_LEVEL) / 2, len(durations) - 1) * \
+        statistics.stdev(durations) / math.sqrt(len(durations))
+    return half_width <= ci_width_target * statistics.mean(durations)
+
+
+def load_completed_points(output_path: str, manifest_path: str) -> Dict[ProfilePoint, Timing]:
+    """Load the timing of every point that an earlier run finished
+
+    A point only counts as finished once it is in the manifest, which is written after its row in the output.
+
+    Returns:
+        Dict[ProfilePoint, Timing]: The timing of every finished point
+    """
+    manifest: Set[ProfilePoint] = set()
+    row: List[str]
+    for row in read_rows(manifest_path):
+        if len(row) == len(MANIFEST_HEADER):
+            manifest.add((row[0], int(row[1]), int(row[2])))
+    completed: Dict[ProfilePoint, Timing] = {}
+    for row in read_rows(output_path):
+        if len(row) == len(CSV_HEADER) and (row[0], int(row[1]), int(row[2])) in manifest:
+            completed[(row[0], int(row[1]), int(row[2]))] = Timing(
+                duration=float(row[3]), variance=float(row[4]), num_samples=int(row[5]),
+                overhead=float(row[6]), throttled_time=float(row[7]))
+    return completed
+
+
+class ProfileStore:
+    """The profiled points of every task, appended to the profiling output as they finish
+
+    Points finished by earlier runs are loaded first and are not profiled again, so a restarted
+    profiler resumes where it stopped. Profilers that time points from several threads share the store.
+
+    Args:
+        output_path (str, optional): The profiling output. Defaults to PROFILER_OUTPUT_PATH.
+        manifest_path (str, optional): The manifest of finished points. Defaults to PROFILER_MANIFEST_PATH.
+    """
+
+    def __init__(self, output_path: str = SIMULATION_DIR + PROFILER_OUTPUT_PATH,
+                 manifest_path: str = SIMULATION_DIR + PROFILER_MANIFEST_PATH):
+        self.completed: Dict[ProfilePoint, Timing] = load_completed_points(
+            output_path, manifest_path)
+        if len(self.completed) > 0:
+            print(f"Resuming profiling, {len(self.completed)} points are already profiled")
+        self.stat_logger: StatLogger = StatLogger(output_path, CSV_HEADER)
+        self.manifest_logger: StatLogger = StatLogger(
+            manifest_path, MANIFEST_HEADER)
+        self.log_lock: threading.Lock = threading.Lock()
+
+    def log_statistics(self, statistics: Sequence[Union[float, int, str]]) -> None:
+        with self.log_lock:
+            print(", ".join(str(statistic) for statistic in statistics))
+            self.stat_logger.log_statistics(statistics)
+
+    def log_timing(self, task: Task, workload_size: int, cpu_shares: int, timing: Timing) -> None:
+        """Log the timing of a point, then mark the point as finished in the manifest
+        """
+        self.log_statistics([task.task_name, workload_size, cpu_shares, timing.duration,
+                             timing.variance, timing.num_samples, timing.overhead, timing.throttled_time])
+        with self.log_lock:
+            self.manifest_logger.log_statistics(
+                [task.task_name, workload_size, cpu_shares])
+            self.completed[(task.task_name, workload_size, cpu_shares)] = timing
+
+    def get_timing(self, task: Task, workload_size: int, cpu_shares: int) -> Optional[Timing]:
+        return self.completed.get((task.task_name, workload_size, cpu_shares))
+
+    def get_pending_workload_sizes(self, task: Task, cpu_shares: int) -> List[int]:
+        return [workload_size for workload_size in range(SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT)
+                if (task.task_name, workload_size, cpu_shares) not in self.completed]
+
+    def close(self) -> None:
+        self.stat_logger.close_file()
+        self.manifest_logger.close_file()
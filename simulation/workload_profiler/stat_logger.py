@@ -1,17 +1,41 @@
 import csv
-from typing import TextIO, List, Union
+import os
+import time
+from typing import TextIO, List, Optional, Sequence, Union
 
 
 class StatLogger():
-    def __init__(self, file_path: str):
-        self.csv_file: TextIO = open(file_path, "w+")
+    """Appends statistics to a CSV file, so that a restarted profiler keeps the rows of earlier runs
+
+    Every row is flushed to disk as soon as it is logged, so a crash loses at most the row being written.
+
+    Args:
+        file_path (str): The CSV file to append to
+        headers (Optional[List[str]], optional): The header of the file, written if the file is new. An existing
+            file with a different header is moved aside to a backup rather than appended to. Defaults to None.
+    """
+
+    def __init__(self, file_path: str, headers: Optional[List[str]] = None):
+        if headers is not None and os.path.exists(file_path) and read_header(file_path) not in ([], headers):
+            backup_path: str = f"{file_path}.{int(time.time())}.bak"
+            print(f"{file_path} has a different header, moving it to {backup_path}")
+            os.replace(file_path, backup_path)
+        self.csv_file: TextIO = open(file_path, "a", newline="")
         self.csv_writer = csv.writer(self.csv_file)
+        if self.csv_file.tell() > 0 and not ends_with_newline(file_path):
+            # the last row was cut off by a crash, so it is ended before appending
+            self.csv_file.write("\n")
+        if headers is not None:
+            self.write_header(headers)
 
     def write_header(self, headers: List[str]):
-        self.csv_writer.writerow(headers)
+        if self.csv_file.tell() == 0:
+            self.log_statistics(headers)
 
-    def log_statistics(self, statistics: List[Union[float, int, str]]):
+    def log_statistics(self, statistics: Sequence[Union[float, int, str]]):
         self.csv_writer.writerow(statistics)
+        self.csv_file.flush()
+        os.fsync(self.csv_file.fileno())
 
     def close_file(self):
         self.csv_file.close()
@@ -19,3 +43,23 @@ class StatLogger():
     def __del__(self):
         if not self.csv_file.closed:
             self.csv_file.close()
+
+
+def ends_with_newline(file_path: str) -> bool:
+    with open(file_path, "rb") as csv_file:
+        csv_file.seek(-1, os.SEEK_END)
+        return csv_file.read(1) == b"\n"
+
+
+def read_header(file_path: str) -> List[str]:
+    with open(file_path, newline="") as csv_file:
+        return [column.strip() for column in next(csv.reader(csv_file), [])]
+
+
+def read_rows(file_path: str) -> List[List[str]]:
+    """Read the rows of a CSV file after its header, or no rows if the file does not exist
+    """
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, newline="") as csv_file:
+        return [[value.strip() for value in row] for row in csv.reader(csv_file)][1:]
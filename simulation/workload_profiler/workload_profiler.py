@@ -2,27 +2,77 @@ from simulation.shared.workloads import WORKLOADS, Workload, Task, get_env_vars
 from kazoo.client import KazooClient
 from kazoo.recipe.queue import LockingQueue
 from kazoo.recipe.barrier import DoubleBarrier
-from typing import List
+from typing import Dict, List, Optional, Sequence
+from queue import Empty, Queue
+import threading
 import time
-from simulation.shared.kube_api import kube_create_stress_job, kube_delete_job
+from concurrent.futures import Future, ThreadPoolExecutor
+from simulation.shared.env_vars import EnvVarName
+from simulation.shared.kube_api import KubeJobResizer
+from simulation.shared.job_resizer import JobResizer
+from simulation.shared.telemetry import SuperstepRecord, TelemetryCollector
 from simulation.shared.zookeeper import reset_zookeeper
-from simulation.workload_profiler.stat_logger import StatLogger
-from simulation.config.config import (ZOOKEEPER_CLIENT_ENDPOINT, ZOOKEEPER_BARRIER_PATH, PROFILER_MIN_SHARES, PROFILER_MAX_SHARES,
-                                      PROFILER_TRIES, PROFILER_SHARE_INCREMENT, SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD,
-                                      SIMULATION_WORKLOAD_INCREMENT, PROFILER_OUTPUT_PATH, SIMULATION_DIR)
+from simulation.workload_profiler.profile_store import ProfileStore, Timing, is_precise, summarize_durations
+from simulation.workload_profiler.adaptive_sampler import AdaptiveSampler, Point
+from simulation.config.config import (ZOOKEEPER_CLIENT_ENDPOINT, ZOOKEEPER_BARRIER_PATH, ZOOKEEPER_TELEMETRY_PATH, PROFILER_MIN_SHARES, PROFILER_MAX_SHARES,
+                                      PROFILER_TRIES, PROFILER_MAX_TRIES, PROFILER_SHARE_INCREMENT, PROFILER_NUM_LANES,
+                                      PROFILER_MAX_TOTAL_SHARES, PROFILER_ADAPTIVE_ERROR_TARGET)
 
-CSV_HEADER: List[str] = ["task", "workload_size", "cpu_shares", "duration"]
 NUM_TASKS_TUNING: int = 1
 
 
+class CpuBudget:
+    """Caps the CPU shares requested by all profiling lanes together
+
+    Args:
+        total_shares (int): The most CPU shares (in millicores) the lanes may request at once
+    """
+
+    def __init__(self, total_shares: int):
+        self.total_shares = total_shares
+        self.used_shares: int = 0
+        self.condition: threading.Condition = threading.Condition()
+
+    def try_acquire(self, cpu_shares: int) -> bool:
+        """Take the shares if they fit in the budget right now
+
+        Returns:
+            bool: True if the shares were taken
+        """
+        with self.condition:
+            if self.used_shares + cpu_shares > self.total_shares:
+                return False
+            self.used_shares += cpu_shares
+            return True
+
+    def acquire(self, cpu_shares: int) -> None:
+        """Block until the shares fit in the budget, then take them
+
+        Raises:
+            ValueError: If the shares are more than the whole budget, so they would never fit
+        """
+        if cpu_shares > self.total_shares:
+            raise ValueError(
+                f"{cpu_shares} CPU shares never fit in a budget of {self.total_shares}")
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.used_shares + cpu_shares <= self.total_shares)
+            self.used_shares += cpu_shares
+
+    def release(self, cpu_shares: int) -> None:
+        with self.condition:
+            self.used_shares -= cpu_shares
+            self.condition.notify_all()
+
+
 class WorkloadProfiler:
     """Profiles runtimes for Workloads under various inputs and resource configurations
     """
 
-    def __init__(self):
-        self.stat_logger: StatLogger = StatLogger(
-            SIMULATION_DIR + PROFILER_OUTPUT_PATH)
-        self.stat_logger.write_header(CSV_HEADER)
+    def __init__(self, job_resizer: Optional[JobResizer] = None, profile_store: Optional[ProfileStore] = None):
+        self.job_resizer: JobResizer = job_resizer if job_resizer is not None else KubeJobResizer()
+        # Profiling lanes share the store
+        self.profile_store: ProfileStore = profile_store if profile_store is not None else ProfileStore()
         self.zk: KazooClient = KazooClient(hosts=ZOOKEEPER_CLIENT_ENDPOINT)
         self.barrier: DoubleBarrier = DoubleBarrier(
             self.zk, ZOOKEEPER_BARRIER_PATH, NUM_TASKS_TUNING + 1)
@@ -30,47 +80,245 @@ class WorkloadProfiler:
         if self.zk.connected:
             print("Resource tuner has connected to Zookeeper")
 
-    def time_workload(self, queue: LockingQueue, workload_size: int) -> float:
-        total_duration: float = 0
-        for _ in range(PROFILER_TRIES):
+    def time_workload(self, queue: LockingQueue, workload_size: int, barrier: Optional[DoubleBarrier] = None,
+                      collector: Optional[TelemetryCollector] = None) -> Timing:
+        """Time a workload repeatedly until its mean duration is known precisely enough
+
+        At least PROFILER_TRIES samples are taken. Sampling then stops once the confidence interval of the
+        mean is within PROFILER_CI_WIDTH_TARGET of it, or after PROFILER_MAX_TRIES samples.
+
+        The duration of a sample is the compute time the job reports, so it does not include the
+        ZooKeeper latency of the barrier, which is kept as the overhead. Without a record from the job,
+        the time between entering and leaving the barrier is used instead.
+        """
+        barrier = barrier if barrier is not None else self.barrier
+        durations: List[float] = []
+        overheads: List[float] = []
+        throttled_times: List[float] = []
+        while len(durations) < max(PROFILER_TRIES, PROFILER_MAX_TRIES):
             queue.put(bytes([workload_size]))
-            self.barrier.enter()
+            barrier.enter()
             start: float = time.time()
-            self.barrier.leave()
-            total_duration += time.time() - start
-        return total_duration / PROFILER_TRIES
+            barrier.leave()
+            barrier_time: float = time.time() - start
+            records: List[SuperstepRecord] = next(
+                iter(collector.collect().values()), []) if collector is not None else []
+            if len(records) > 0:
+                durations.append(records[-1].compute_time)
+                overheads.append(barrier_time - records[-1].compute_time)
+                throttled_times.append(records[-1].throttled_time)
+            else:
+                durations.append(barrier_time)
+            if len(durations) >= PROFILER_TRIES and is_precise(durations):
+                break
+        return summarize_durations(durations, overheads, throttled_times)
+
+    def create_telemetry_collector(self, task: Task) -> TelemetryCollector:
+        collector: TelemetryCollector = TelemetryCollector(
+            self.zk, ZOOKEEPER_TELEMETRY_PATH, [task.task_name])
+        # records left over from an earlier run are dropped
+        collector.collect()
+        return collector
 
-    def profile_cpu_configuration(self, cpu_shares: int, task: Task) -> None:
+    def profile_cpu_configuration(self, cpu_shares: int, task: Task, queue: LockingQueue,
+                                  barrier: Optional[DoubleBarrier] = None,
+                                  collector: Optional[TelemetryCollector] = None) -> None:
+        workload_size: int
+        # print(f"Currently timing job {task.task_name}")
+        for workload_size in self.profile_store.get_pending_workload_sizes(task, cpu_shares):
+            timing: Timing = self.time_workload(
+                queue, workload_size, barrier, collector)
+            self.profile_store.log_timing(task, workload_size, cpu_shares, timing)
 
-        # Create the job
-        kube_create_stress_job(get_env_vars(
-            task, NUM_TASKS_TUNING), cpu_shares)
+    def profile_task(self, task: Task, barrier_path: str = ZOOKEEPER_BARRIER_PATH,
+                     cpu_budget: Optional[CpuBudget] = None) -> None:
+        """Profile a task across all CPU shares, resizing a single job in place between share levels
 
+        Args:
+            task (Task): The task to profile
+            barrier_path (str, optional): The barrier the job and profiler meet at. Defaults to ZOOKEEPER_BARRIER_PATH.
+            cpu_budget (Optional[CpuBudget], optional): The budget the shares of the job are taken from.
+                Defaults to no budget. The shares are given back and the job is deleted even if profiling fails.
+        """
+        cpu_shares: int
         queue: LockingQueue = LockingQueue(self.zk, f"/{task.task_name}")
+        barrier: DoubleBarrier = self.barrier if barrier_path == ZOOKEEPER_BARRIER_PATH else DoubleBarrier(
+            self.zk, barrier_path, NUM_TASKS_TUNING + 1)
+        env_vars: Dict[str, str] = get_env_vars(task, NUM_TASKS_TUNING)
+        env_vars[EnvVarName.BARRIER_PATH.value] = barrier_path
+        collector: TelemetryCollector = self.create_telemetry_collector(task)
+        # The shares held in the budget, which are those of the job while there is one
+        job_shares: int = 0
+        has_job: bool = False
+        try:
+            for cpu_shares in range(PROFILER_MIN_SHARES, PROFILER_MAX_SHARES, PROFILER_SHARE_INCREMENT):
+                if len(self.profile_store.get_pending_workload_sizes(task, cpu_shares)) == 0:
+                    continue
+                if cpu_budget is not None and not cpu_budget.try_acquire(cpu_shares - job_shares):
+                    # waiting while holding shares could deadlock the lanes, so the job is deleted until the level fits
+                    if has_job:
+                        has_job = False
+                        self.job_resizer.delete_job(task.task_name)
+                    cpu_budget.release(job_shares)
+                    job_shares = 0
+                    cpu_budget.acquire(cpu_shares)
+                job_shares = cpu_shares
+                if not has_job:
+                    self.job_resizer.create_job(env_vars, cpu_shares)
+                    has_job = True
+                else:
+                    self.job_resizer.resize_job(env_vars, cpu_shares)
+                self.profile_cpu_configuration(
+                    cpu_shares, task, queue, barrier, collector)
+        finally:
+            try:
+                if has_job:
+                    self.job_resizer.delete_job(task.task_name)
+            finally:
+                if cpu_budget is not None:
+                    cpu_budget.release(job_shares)
 
-        workload_size: int
-        # print(f"Currently timing job {task.task_name}")
-        for workload_size in range(SIMULATION_MIN_WORKLOAD, SIMULATION_MAX_WORKLOAD, SIMULATION_WORKLOAD_INCREMENT):
-            duration: float = self.time_workload(queue, workload_size)
-            print(
-                f"{task.task_name}, {workload_size}, {cpu_shares}, {duration}")
-            self.stat_logger.log_statistics(
-                [task.task_name, workload_size, cpu_shares, duration])
-        kube_delete_job(task.task_name)
-
-    def profile_resource_configurations(self, workloads: List[Workload]) -> None:
+    def profile_task_adaptive(self, task: Task, sampler: AdaptiveSampler,
+                              barrier_path: str = ZOOKEEPER_BARRIER_PATH) -> Dict[Point, float]:
+        """Profile a task only at the points the sampler picks, until the runtime surface is accurate enough
+
+        The points of every batch are timed in order of CPU shares, so the job is only resized when the
+        shares change. The timed points are logged like those of a full profile, and points finished by
+        an earlier run are not timed again.
+
+        Args:
+            task (Task): The task to profile
+            sampler (AdaptiveSampler): Picks the points to profile and decides when to stop
+            barrier_path (str, optional): The barrier the job and profiler meet at. Defaults to ZOOKEEPER_BARRIER_PATH.
+
+        Returns:
+            Dict[Point, float]: The duration of every profiled point
+        """
+        queue: LockingQueue = LockingQueue(self.zk, f"/{task.task_name}")
+        barrier: DoubleBarrier = self.barrier if barrier_path == ZOOKEEPER_BARRIER_PATH else DoubleBarrier(
+            self.zk, barrier_path, NUM_TASKS_TUNING + 1)
+        env_vars: Dict[str, str] = get_env_vars(task, NUM_TASKS_TUNING)
+        env_vars[EnvVarName.BARRIER_PATH.value] = barrier_path
+        collector: TelemetryCollector = self.create_telemetry_collector(task)
+        job_shares: int = 0
+
+        def measure(points: List[Point]) -> List[float]:
+            nonlocal job_shares
+            durations: Dict[Point, float] = {}
+            point: Point
+            for point in sorted(points, key=lambda point: (point[1], point[0])):
+                workload_size, cpu_shares = point
+                completed: Optional[Timing] = self.profile_store.get_timing(
+                    task, workload_size, cpu_shares)
+                if completed is not None:
+                    durations[point] = completed.duration
+                    continue
+                if job_shares == 0:
+                    self.job_resizer.create_job(env_vars, cpu_shares)
+                elif cpu_shares != job_shares:
+                    self.job_resizer.resize_job(env_vars, cpu_shares)
+                job_shares = cpu_shares
+                timing: Timing = self.time_workload(
+                    queue, workload_size, barrier, collector)
+                self.profile_store.log_timing(task, workload_size, cpu_shares, timing)
+                durations[point] = timing.duration
+            return [durations[point] for point in points]
+
+        measurements: Dict[Point, float] = sampler.run(measure)
+        if job_shares != 0:
+            self.job_resizer.delete_job(task.task_name)
+        print(f"Profiled {task.task_name} at {len(measurements)} points, "
+              f"relative leave-one-out error {sampler.relative_error:.4f}, stopped on {sampler.stop_reason}")
+        return measurements
+
+    def profile_resource_configurations_adaptive(self, workloads: Sequence[Workload],
+                                                 error_targets: Optional[Dict[str, float]] = None) -> None:
+        """Profile every workload adaptively rather than over the full grid
+
+        Args:
+            workloads (Sequence[Workload]): The workloads to profile
+            error_targets (Optional[Dict[str, float]], optional): The error target of each task by name.
+                Defaults to PROFILER_ADAPTIVE_ERROR_TARGET for every task.
+        """
+        error_targets = error_targets if error_targets is not None else {}
         workload: Workload
-        cpu_shares: int
         for workload in workloads:
-            for cpu_shares in range(PROFILER_MIN_SHARES, PROFILER_MAX_SHARES, PROFILER_SHARE_INCREMENT):
-                self.profile_cpu_configuration(cpu_shares, workload.task)
+            sampler: AdaptiveSampler = AdaptiveSampler(error_target=error_targets.get(
+                workload.task.task_name, PROFILER_ADAPTIVE_ERROR_TARGET))
+            self.profile_task_adaptive(workload.task, sampler)
+        reset_zookeeper(self.zk, workloads)
+        self.profile_store.close()
+
+    def profile_resource_configurations(self, workloads: Sequence[Workload]) -> None:
+        workload: Workload
+        for workload in workloads:
+            self.profile_task(workload.task)
         reset_zookeeper(self.zk, workloads)
-        self.stat_logger.close_file()
+        self.profile_store.close()
+
+    def run_profiling_lane(self, lane: int, tasks: "Queue[Task]", cpu_budget: CpuBudget) -> None:
+        barrier_path: str = f"{ZOOKEEPER_BARRIER_PATH}-lane-{lane}"
+        try:
+            while True:
+                try:
+                    task: Task = tasks.get_nowait()
+                except Empty:
+                    break
+                print(f"Lane {lane} is profiling {task.task_name}")
+                self.profile_task(task, barrier_path, cpu_budget)
+        finally:
+            if self.zk.exists(barrier_path):
+                self.zk.delete(barrier_path, recursive=True)
+
+    def profile_resource_configurations_parallel(self, workloads: Sequence[Workload], num_lanes: int = PROFILER_NUM_LANES,
+                                                 max_total_shares: int = PROFILER_MAX_TOTAL_SHARES) -> None:
+        """Profile several workloads at once, each in its own lane with its own job, queue and barrier
+
+        Lanes take the next unprofiled workload when they finish one. The CPU shares requested by the
+        jobs of all lanes together never exceed the budget, so that the cluster is not oversubscribed
+        and the lanes do not slow each other down. A lane whose next share level does not fit deletes
+        its job and waits for the shares to free up. A lane that fails gives its shares back and stops,
+        the other lanes profile the remaining workloads, and the first failure is raised once they are done.
+
+        Args:
+            workloads (Sequence[Workload]): The workloads to profile
+            num_lanes (int, optional): Number of workloads profiled at once. Defaults to PROFILER_NUM_LANES.
+            max_total_shares (int, optional): The most CPU shares the lanes may request together.
+                Defaults to PROFILER_MAX_TOTAL_SHARES.
+
+        Raises:
+            ValueError: If a share level does not fit in max_total_shares on its own
+            Exception: The first error a lane failed with
+        """
+        largest_shares: int = max(
+            range(PROFILER_MIN_SHARES, PROFILER_MAX_SHARES, PROFILER_SHARE_INCREMENT))
+        if largest_shares > max_total_shares:
+            raise ValueError(f"The largest share level of {largest_shares} is above max_total_shares of {max_total_shares}, "
+                             f"so the lanes would wait for it forever")
+        tasks: "Queue[Task]" = Queue()
+        workload: Workload
+        for workload in workloads:
+            tasks.put(workload.task)
+        cpu_budget: CpuBudget = CpuBudget(max_total_shares)
+        start: float = time.time()
+        num_running_lanes: int = min(num_lanes, len(workloads))
+        with ThreadPoolExecutor(max_workers=max(num_running_lanes, 1)) as executor:
+            lanes: List[Future] = [executor.submit(self.run_profiling_lane, lane, tasks, cpu_budget)
+                                   for lane in range(num_running_lanes)]
+        lane: Future
+        try:
+            for lane in lanes:
+                lane.result()
+        finally:
+            reset_zookeeper(self.zk, workloads)
+            self.profile_store.close()
+        print(
+            f"Profiling {len(workloads)} workloads in {len(lanes)} lanes took {time.time() - start} seconds")
 
 
 def main():
     workload_profiler: WorkloadProfiler = WorkloadProfiler()
-    workload_profiler.profile_resource_configurations(WORKLOADS)
+    workload_profiler.profile_resource_configurations_parallel(WORKLOADS)
 
 
 if __name__ == "__main__":